@@ -7,9 +7,10 @@ from enum import Enum
 
 from Bio.PDB import MMCIFParser, PDBParser
 from Bio.PDB.mmcifio import MMCIFIO
-from Bio.PDB import PDBIO
+from Bio.PDB import PDBIO, Select
 
 from .models.domains import ChoppingSeqres, ChoppingPdbResLabel
+from .profiling import STAGE_COMPUTE, STAGE_PARSE, STAGE_WRITE, timed, timer
 from .errors import ChoppingError, MultipleModelsError, MultipleChainsError, ParseError
 
 LOG = logging.getLogger(__name__)
@@ -56,6 +57,7 @@ def chop_cif(
     )
 
 
+@timed(STAGE_COMPUTE)
 def chop_structure(
     *,
     domain_id: str,
@@ -86,28 +88,55 @@ def chop_structure(
 
     if file_type == StructureFileType.CIF:
         parser = MMCIFParser()
-        io = MMCIFIO()
     elif file_type == StructureFileType.PDB:
         parser = PDBParser()
-        io = PDBIO()
     else:
         raise ParseError(f"Unknown file type {file_type}")
 
-    if str(chain_path).endswith(".gz"):
-        with gzip.open(str(chain_path), mode="rt") as fp:
-            structure = parser.get_structure(domain_id, fp)
-    else:
-        structure = parser.get_structure(domain_id, str(chain_path))
+    with timer(STAGE_PARSE, f"{__name__}.get_structure"):
+        if str(chain_path).endswith(".gz"):
+            with gzip.open(str(chain_path), mode="rt") as fp:
+                structure = parser.get_structure(domain_id, fp)
+        else:
+            structure = parser.get_structure(domain_id, str(chain_path))
+
+    save_chopped_structure(
+        structure,
+        domain_path=domain_path,
+        chopping=chopping,
+        map_to_pdb_resid=map_to_pdb_resid,
+        file_type=file_type,
+        source=chain_path,
+    )
+
+
+@timed(STAGE_COMPUTE)
+def get_chopping_residue_ids(
+    structure,
+    chopping: Union[ChoppingPdbResLabel, ChoppingSeqres],
+    *,
+    map_to_pdb_resid: Callable = default_map_to_pdb_resid,
+    source=None,
+):
+    """
+    Returns the model, chain and ids of the residues within the chopping
+
+    The structure is expected to contain exactly one model with one chain (`source`
+    is only used in error messages).
+    """
+
+    if source is None:
+        source = structure.get_id()
 
     models = structure.get_list()
     if len(models) != 1:
-        msg = f"expected exactly 1 model, found {len(models)} in {chain_path}"
+        msg = f"expected exactly 1 model, found {len(models)} in {source}"
         raise MultipleModelsError(msg)
     model = models[0]
 
     chains = model.get_list()
     if len(chains) != 1:
-        msg = f"expected exactly 1 chain, found {len(chains)} in {chain_path}"
+        msg = f"expected exactly 1 chain, found {len(chains)} in {source}"
         raise MultipleChainsError(msg)
     chain = chains[0]
 
@@ -124,9 +153,83 @@ def chop_structure(
         msg = f"failed to find any valid residues when applying chopping {chopping} to chain {chain}"
         raise ChoppingError(msg)
 
+    return model, chain, all_valid_resids
+
+
+@timed(STAGE_COMPUTE)
+def chop_biostructure(
+    structure,
+    chopping: Union[ChoppingPdbResLabel, ChoppingSeqres],
+    *,
+    map_to_pdb_resid: Callable = default_map_to_pdb_resid,
+):
+    """
+    Returns a copy of a (single chain) structure containing the residues in the chopping
+
+    The copy can be written as it is with `save_structure` (rather than applying the
+    chopping again with `save_chopped_structure`).
+    """
+
+    _model, _chain, all_valid_resids = get_chopping_residue_ids(
+        structure, chopping, map_to_pdb_resid=map_to_pdb_resid
+    )
+    domain_structure = structure.copy()
+    domain_chain = domain_structure.get_list()[0].get_list()[0]
+    for residue in list(domain_chain):
+        if residue.get_id() not in all_valid_resids:
+            domain_chain.detach_child(residue.get_id())
+    return domain_structure
+
+
+@timed(STAGE_WRITE)
+def save_structure(
+    structure,
+    *,
+    path: Path,
+    file_type: StructureFileType = StructureFileType.PDB,
+    select: Select = None,
+):
+    """
+    Writes a structure (or the parts of it accepted by `select`) to a PDB/CIF file
+    """
+
+    if file_type == StructureFileType.CIF:
+        io = MMCIFIO()
+    elif file_type == StructureFileType.PDB:
+        io = PDBIO()
+    else:
+        raise ParseError(f"Unknown file type {file_type}")
+
+    if select is None:
+        select = Select()
+
     io.set_structure(structure)
 
-    class ResSelector:
+    if str(path).endswith(".gz"):
+        with gzip.open(str(path), mode="wt") as fp:
+            io.save(fp, select=select)
+    else:
+        io.save(str(path), select=select)
+
+
+def save_chopped_structure(
+    structure,
+    *,
+    domain_path: Path,
+    chopping: Union[ChoppingPdbResLabel, ChoppingSeqres],
+    map_to_pdb_resid: Callable = default_map_to_pdb_resid,
+    file_type: StructureFileType = StructureFileType.PDB,
+    source=None,
+):
+    """
+    Writes the residues of a (single chain) structure within the chopping to a file
+    """
+
+    model, chain, all_valid_resids = get_chopping_residue_ids(
+        structure, chopping, map_to_pdb_resid=map_to_pdb_resid, source=source
+    )
+
+    class ResSelector(Select):
         def accept_model(self, _model):
             # LOG.info(f"accept_model: {_model} == {model} ({_model == model})")
             return 1 if _model == model else 0
@@ -138,16 +241,9 @@ def chop_structure(
         def accept_residue(self, _residue):
             return 1 if _residue.get_id() in all_valid_resids else 0
 
-        def accept_atom(self, _atom):
-            return 1
-
-    res_selector = ResSelector()
-
-    if str(domain_path).endswith(".gz"):
-        with gzip.open(str(domain_path), mode="wt") as fp:
-            io.save(fp, select=res_selector)
-    else:
-        io.save(str(domain_path), select=res_selector)
+    save_structure(
+        structure, path=domain_path, file_type=file_type, select=ResSelector()
+    )
 
 
 class ChoppingProcessor:
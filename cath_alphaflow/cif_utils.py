@@ -0,0 +1,144 @@
+"""
+Reading metadata from the header of mmCIF files
+
+AlphaFold model files contain ~20 small categories of metadata followed by the
+`_atom_site` loop (which makes up most of the file). Parsing the whole file with
+`MMCIF2Dict` just to read a few items is slow, so `read_cif_categories` only tokenizes
+the requested categories and stops reading as soon as they have all been read (i.e.
+before `_atom_site` for the metadata categories in AlphaFold files).
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List
+
+from cath_alphaflow.errors import ParseError
+from cath_alphaflow.profiling import STAGE_PARSE, timed
+
+LOG = logging.getLogger(__name__)
+
+# quoted strings end at a matching quote followed by whitespace (or end of line)
+RE_CIF_TOKEN = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+
+
+def split_cif_line(line: str) -> List[str]:
+    """
+    Splits a line of mmCIF into tokens (removing quotes)
+    """
+    return [match.group(match.lastindex) for match in RE_CIF_TOKEN.finditer(line)]
+
+
+def cif_category(tag: str) -> str:
+    """
+    Category of an mmCIF tag (`_entity.pdbx_description` -> `_entity`)
+    """
+    return tag.split(".", 1)[0]
+
+
+@timed(STAGE_PARSE)
+def read_cif_categories(cif_fh, categories: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Returns the items in the requested categories of an mmCIF file
+
+    The result has the same form as `MMCIF2Dict` (each tag maps to a list of values),
+    but only includes the requested categories. Reading stops at the first category
+    after all the requested categories have been read (categories are contiguous), so
+    the whole file is only read if a requested category is missing.
+    """
+    categories = set(categories)
+    cif_dict = {}
+    seen_categories = set()
+
+    loop_tags = []
+    loop_values = []
+    in_loop_header = False
+    collect_loop = False
+    pending_tag = None
+    text_lines = None
+
+    def add_value(value):
+        nonlocal pending_tag
+        if pending_tag:
+            cif_dict[pending_tag] = [value]
+            pending_tag = None
+        elif collect_loop:
+            loop_values.append(value)
+
+    def end_loop():
+        nonlocal loop_tags, loop_values, collect_loop
+        if collect_loop:
+            if len(loop_values) % len(loop_tags) != 0:
+                msg = (
+                    f"expected the number of values in loop {loop_tags[0]} "
+                    f"to be a multiple of {len(loop_tags)} (got {len(loop_values)})"
+                )
+                raise ParseError(msg)
+            for idx, tag in enumerate(loop_tags):
+                cif_dict[tag] = loop_values[idx :: len(loop_tags)]
+        loop_tags = []
+        loop_values = []
+        collect_loop = False
+
+    for line in cif_fh:
+        # multi-line text fields (can contain anything until a line starting with ';')
+        if text_lines is not None:
+            if line.startswith(";"):
+                add_value("\n".join(text_lines))
+                text_lines = None
+                for token in split_cif_line(line[1:]):
+                    add_value(token)
+            else:
+                text_lines.append(line.rstrip("\r\n"))
+            continue
+        if line.startswith(";"):
+            in_loop_header = False
+            if pending_tag or collect_loop:
+                text_lines = [line[1:].rstrip("\r\n")]
+            else:
+                text_lines = []
+            continue
+
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+
+        if stripped.startswith("loop_"):
+            end_loop()
+            in_loop_header = True
+            continue
+
+        if stripped.startswith("_"):
+            tokens = split_cif_line(stripped)
+            tag = tokens[0]
+            category = cif_category(tag)
+            if category not in categories and seen_categories == categories:
+                break
+            wanted = category in categories
+            if wanted:
+                seen_categories.add(category)
+            if in_loop_header:
+                loop_tags.append(tag)
+                collect_loop = wanted
+                continue
+            end_loop()
+            if wanted:
+                if len(tokens) > 1:
+                    cif_dict[tag] = [tokens[1]]
+                else:
+                    # value is on the next line (or in a text field)
+                    pending_tag = tag
+            continue
+
+        # values (for a pending item or the current loop)
+        in_loop_header = False
+        if pending_tag or collect_loop:
+            for token in split_cif_line(stripped):
+                add_value(token)
+
+    end_loop()
+
+    missing_categories = categories - seen_categories
+    if missing_categories:
+        LOG.debug(f"categories not found in mmCIF: {sorted(missing_categories)}")
+
+    return cif_dict
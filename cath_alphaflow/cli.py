@@ -1,23 +1,95 @@
+import importlib
 import logging
+import textwrap
 import click
 
 
-from .settings import get_default_settings
-from .commands import create_dataset_uniprot_ids
-from .commands import create_dataset_cath_files
-from .commands import optimise_domain_boundaries
-from .commands import convert_dssp_to_sse_summary
-from .commands import convert_cif_to_dssp
-from .commands import extract_plddt_and_lur
-from .commands import convert_cif_to_foldseek_db
-from .commands import run_foldseek
-from .commands import convert_foldseek_output_to_summary
-from .commands import chop_domain
-from .commands import create_md5
-from .commands import convert_cif_to_fasta
-from .commands import load_mongo
-from .commands import measure_globularity
-from .commands import pdb_to_md5
+# commands are only imported when they are used (the command modules import slow
+# dependencies), so each command is listed with the
+# module that defines it and its short help (shown by `--help`)
+LAZY_COMMANDS = {
+    "chop-cif": (
+        "cath_alphaflow.commands.chop_domain:chop_cif_command",
+        "Apply chopping to CIF files",
+    ),
+    "convert-cif-to-dssp": (
+        "cath_alphaflow.commands.convert_cif_to_dssp:convert_cif_to_dssp",
+        "Converts CIF to DSSP files",
+    ),
+    "convert-cif-to-fasta": (
+        "cath_alphaflow.commands.convert_cif_to_fasta:convert_cif_to_fasta",
+        "Convert CIF to FASTA",
+    ),
+    "convert-cif-to-foldseek-db": (
+        "cath_alphaflow.commands.convert_cif_to_foldseek_db:convert_cif_to_foldseek_db",
+        "Create Foldseek query database from mmCIF folder",
+    ),
+    "convert-cif-to-plddt-summary": (
+        "cath_alphaflow.commands.extract_plddt_and_lur:convert_cif_to_plddt_summary",
+        "Creates summary of secondary structure elements (SSEs) from DSSP files",
+    ),
+    "convert-dssp-to-sse-summary": (
+        "cath_alphaflow.commands.convert_dssp_to_sse_summary:"
+        "convert_dssp_to_sse_summary",
+        "Creates summary of secondary structure elements (SSEs) from DSSP files",
+    ),
+    "convert-foldseek-output-to-summary": (
+        "cath_alphaflow.commands.convert_foldseek_output_to_summary:"
+        "convert_foldseek_output_to_summary",
+        "",
+    ),
+    "create-cath-dataset-from-db": (
+        "cath_alphaflow.commands.create_dataset_cath_files:create_cath_dataset_from_db",
+        "Creates CATH data files for a given dataset (based on DB)",
+    ),
+    "create-cath-dataset-from-files": (
+        "cath_alphaflow.commands.create_dataset_cath_files:"
+        "create_cath_dataset_from_files",
+        "Creates CATH data files for a given dataset (based on flat files)",
+    ),
+    "create-dataset-uniprot-ids": (
+        "cath_alphaflow.commands.create_dataset_uniprot_ids:create_dataset_uniprot_ids",
+        "Creates UniProt IDs for given dataset",
+    ),
+    "create-md5": (
+        "cath_alphaflow.commands.create_md5:create_md5",
+        "Calculate MD5 for FASTA sequences",
+    ),
+    "filter-crh-by-md5": (
+        "cath_alphaflow.commands.filter_crh_by_md5:filter_crh_by_md5",
+        "Filter CRH (and domain list) to the sequence MD5s available in AF",
+    ),
+    "load-mongo-archive": (
+        "cath_alphaflow.commands.load_mongo:load_af_from_archive",
+        "",
+    ),
+    "measure-globularity": (
+        "cath_alphaflow.commands.measure_globularity:measure_globularity",
+        "Checks the globularity of the AF domain",
+    ),
+    "optimise-domain-boundaries": (
+        "cath_alphaflow.commands.optimise_domain_boundaries:optimise_domain_boundaries",
+        "Adjusts the domain boundaries of AF2 by removing unpacked tails",
+    ),
+    "pdb-to-md5": (
+        "cath_alphaflow.commands.pdb_to_md5:pdb_to_md5",
+        "Convert PDB files to MD5 checksums of their sequences and write to a TSV "
+        "file.",
+    ),
+    "run-domain-qc": (
+        "cath_alphaflow.commands.run_domain_qc:run_domain_qc",
+        "Runs all the domain QC stages, reading each chain file once",
+    ),
+    "run-foldseek": (
+        "cath_alphaflow.commands.run_foldseek:run_foldseek",
+        "Run Foldseek Query DB against Target DB",
+    ),
+    "serve": (
+        "cath_alphaflow.commands.serve:serve",
+        "Runs cath-af-cli commands submitted over a Unix socket (keeping imports "
+        "warm)",
+    ),
+}
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s"
@@ -26,11 +98,64 @@ logging.basicConfig(
 LOG = logging.getLogger(__name__)
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """
+    Click group that imports the module of a lazy command when it is first used
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.lazy_commands})
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            import_path, _short_help = self.lazy_commands[cmd_name]
+            module_name, command_name = import_path.split(":")
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, command_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        limit = formatter.width - 6 - max(len(name) for name in self.list_commands(ctx))
+        rows = []
+        for cmd_name in self.list_commands(ctx):
+            if cmd_name in self.commands:
+                cmd = self.commands[cmd_name]
+                if cmd.hidden:
+                    continue
+                short_help = cmd.get_short_help_str(limit)
+            else:
+                _import_path, short_help = self.lazy_commands[cmd_name]
+                # the stored short help is one line (clip it like click would)
+                short_help = textwrap.shorten(
+                    short_help, width=limit, placeholder="..."
+                )
+            rows.append((cmd_name, short_help))
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
 @click.version_option()
 @click.option("--verbose", "-v", "verbosity", default=0, count=True)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Output: JSON report of the time spent in each stage of the command",
+)
+@click.option(
+    "--profile_stats",
+    "profile_stats_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Output: cProfile stats for the command (see `pstats`)",
+)
 @click.pass_context
-def cli(ctx, verbosity):
+def cli(ctx, verbosity, profile_path, profile_stats_path):
     "Workflow tools to assign CATH structural domains to AlphaFold predictions"
 
     root_logger = logging.getLogger()
@@ -40,12 +165,40 @@ def cli(ctx, verbosity):
         f"Starting logging... (level={logging.getLevelName(root_logger.getEffectiveLevel())})"
     )
 
+    # reports are written when the command has finished (or failed)
+    if profile_path:
+        from .profiling import PROFILER
+
+        PROFILER.start(ctx.invoked_subcommand)
+
+        def write_profile_report():
+            PROFILER.stop()
+            PROFILER.write_report(profile_path)
+            LOG.info(f"Wrote timing report: {profile_path}")
+
+        ctx.call_on_close(write_profile_report)
+
+    if profile_stats_path:
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+
+        def write_profile_stats():
+            profile.disable()
+            profile.dump_stats(profile_stats_path)
+            LOG.info(f"Wrote cProfile stats: {profile_stats_path}")
+
+        ctx.call_on_close(write_profile_stats)
+
 
 @click.command()
 def dump_config():
     """
     Dump the current settings
     """
+    from .settings import get_default_settings
+
     settings = get_default_settings()
     click.echo("Settings:")
     for key, val in settings.to_dict().items():
@@ -53,19 +206,3 @@ def dump_config():
 
 
 cli.add_command(dump_config)
-cli.add_command(create_dataset_uniprot_ids.create_dataset_uniprot_ids)
-cli.add_command(create_dataset_cath_files.create_cath_dataset_from_db)
-cli.add_command(create_dataset_cath_files.create_cath_dataset_from_files)
-cli.add_command(optimise_domain_boundaries.optimise_domain_boundaries)
-cli.add_command(convert_dssp_to_sse_summary.convert_dssp_to_sse_summary)
-cli.add_command(convert_cif_to_dssp.convert_cif_to_dssp)
-cli.add_command(extract_plddt_and_lur.convert_cif_to_plddt_summary)
-cli.add_command(convert_cif_to_foldseek_db.convert_cif_to_foldseek_db)
-cli.add_command(run_foldseek.run_foldseek)
-cli.add_command(convert_foldseek_output_to_summary.convert_foldseek_output_to_summary)
-cli.add_command(chop_domain.chop_cif_command)
-cli.add_command(create_md5.create_md5)
-cli.add_command(pdb_to_md5.pdb_to_md5)
-cli.add_command(convert_cif_to_fasta.convert_cif_to_fasta)
-cli.add_command(load_mongo.load_af_from_archive)
-cli.add_command(measure_globularity.measure_globularity)
@@ -14,6 +14,7 @@ from cath_alphaflow.constants import (
 )
 from cath_alphaflow.chopping import chop_cif
 from cath_alphaflow.errors import ChoppingError
+from cath_alphaflow.profiling import entries
 
 LOG = logging.getLogger()
 
@@ -95,7 +96,7 @@ def chop_cif_command(
             f"option --af_version must be specified when using id_type={id_type}"
         )
 
-    for id_str in yield_first_col(id_file):
+    for id_str in entries(yield_first_col(id_file)):
         if id_type == ID_TYPE_AF_DOMAIN:
             af_domain_id = AFDomainID.from_str(id_str)
         elif id_type == ID_TYPE_UNIPROT_DOMAIN:
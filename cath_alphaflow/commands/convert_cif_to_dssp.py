@@ -15,12 +15,6 @@ from cath_alphaflow.settings import get_default_settings
 from cath_alphaflow.errors import ArgumentError
 
 
-config = get_default_settings()
-
-DSSP_BINARY_PATH = config.DSSP_BINARY_PATH
-DSSP_PDB_DICT = config.DSSP_PDB_DICT
-
-
 LOG = logging.getLogger()
 
 
@@ -71,6 +65,8 @@ def convert_cif_to_dssp(
 ):
     "Converts CIF to DSSP files"
 
+    config = get_default_settings()
+
     for af_id_str in yield_first_col(id_file):
         af_chain_id = None
         chopping = None
@@ -94,12 +90,12 @@ def convert_cif_to_dssp(
         dssp_path = Path(dssp_out_dir) / f"{file_stub}{dssp_suffix}"
 
         LOG.debug(f"Running DSSP: {cif_path} {dssp_path}")
-        run_dssp(cif_path, dssp_path)
+        run_dssp(cif_path, dssp_path, config=config)
 
     click.echo("DONE")
 
 
-def run_dssp(cif_path: Path, dssp_path: Path):
+def run_dssp(cif_path: Path, dssp_path: Path, *, config=None):
 
     if not cif_path.exists():
         msg = f"failed to locate CIF input file {cif_path}"
@@ -111,15 +107,18 @@ def run_dssp(cif_path: Path, dssp_path: Path):
         LOG.error(msg)
         raise FileNotFoundError(msg)
 
+    if config is None:
+        config = get_default_settings()
+
     args = [
-        DSSP_BINARY_PATH,
+        config.DSSP_BINARY_PATH,
     ]
 
-    if not DSSP_PDB_DICT is None:
+    if not config.DSSP_PDB_DICT is None:
         args.extend(
             [
                 "--mmcif-dictionary",
-                DSSP_PDB_DICT,
+                config.DSSP_PDB_DICT,
             ]
         )
 
@@ -1,12 +1,18 @@
+import functools
 import logging
 from pathlib import Path
 import click
-from cath_alphaflow.io_utils import yield_first_col
+from cath_alphaflow.io_utils import chunked_iterable, yield_first_col
 from cath_alphaflow.constants import DEFAULT_CIF_SUFFIX
-from cath_alphaflow.settings import get_default_settings
-from cath_alphaflow.seq_utils import cif_to_fasta, combine_fasta_files, write_fasta_file
+from cath_alphaflow.fasta_utils import (
+    format_fasta_record,
+    map_in_processes,
+    open_fasta_text_writer,
+)
+from cath_alphaflow.seq_utils import cif_to_fasta
 
-config = get_default_settings()
+DEFAULT_JOBS = 1
+DEFAULT_BATCH_SIZE = 100
 
 LOG = logging.getLogger()
 
@@ -33,25 +39,77 @@ LOG = logging.getLogger()
 @click.option(
     "--fasta_out_dir",
     type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True),
-    required=True,
-    help="Output: FASTA Output Folder",
+    required=False,
+    help="Output: optional FASTA Output Folder (writes a FASTA file for each chain)",
 )
 @click.option(
     "--combined_fasta_file",
-    type=click.File("wt"),
+    type=click.Path(dir_okay=False, allow_dash=True),
     required=True,
     default="merged.fasta",
-    help="Output multiFASTA file containing all FASTA sequences",
+    show_default=True,
+    help="Output multiFASTA file containing all FASTA sequences (gzipped if the name ends with .gz)",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    show_default=True,
+    help="Option: number of processes used to read the CIF files",
+)
+@click.option(
+    "--batch_size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="Option: number of CIF files given to each process at a time",
 )
 def convert_cif_to_fasta(
-    cif_in_dir, id_file, cif_suffix, fasta_out_dir, combined_fasta_file
+    cif_in_dir,
+    id_file,
+    cif_suffix,
+    fasta_out_dir,
+    combined_fasta_file,
+    jobs,
+    batch_size,
 ):
     "Convert CIF to FASTA"
 
-    for file_stub in yield_first_col(id_file):
-        cif_path = Path(cif_in_dir) / (file_stub + cif_suffix)
-        header, sequence = cif_to_fasta(cif_path)
-        write_fasta_file(header=header, sequence=sequence, fasta_out_file=f'{fasta_out_dir}/{header}.fasta')
-    combine_fasta_files(fasta_in_dir=fasta_out_dir, fasta_out_file=combined_fasta_file)
+    # sequences are written straight to the multiFASTA file (in the order of the ids)
+    id_batches = chunked_iterable(yield_first_col(id_file), chunk_size=batch_size)
+    make_records = functools.partial(
+        fasta_records_from_cif_files,
+        cif_in_dir=cif_in_dir,
+        cif_suffix=cif_suffix,
+        fasta_out_dir=fasta_out_dir,
+    )
+    record_count = 0
+    with open_fasta_text_writer(combined_fasta_file) as fasta_out_fh:
+        for records_text, batch_record_count in map_in_processes(
+            make_records, id_batches, jobs=jobs
+        ):
+            fasta_out_fh.write(records_text)
+            record_count += batch_record_count
+    LOG.info(f"Wrote {record_count} sequences to {combined_fasta_file}")
 
     click.echo("DONE")
+
+
+def fasta_records_from_cif_files(
+    file_stubs, *, cif_in_dir, cif_suffix, fasta_out_dir=None
+):
+    """
+    Returns the FASTA records (as text) and the number of records for a batch of ids
+
+    A FASTA file is also written for each chain if `fasta_out_dir` is set.
+    """
+    records = []
+    for file_stub in file_stubs:
+        cif_path = Path(cif_in_dir) / (file_stub + cif_suffix)
+        header, sequence = cif_to_fasta(cif_path)
+        record = format_fasta_record(header, sequence)
+        if fasta_out_dir:
+            fasta_out_path = Path(fasta_out_dir) / f"{header}.fasta"
+            fasta_out_path.write_text(record)
+        records.append(record)
+    return "".join(records), len(records)
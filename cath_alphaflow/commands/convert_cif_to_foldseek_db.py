@@ -2,8 +2,6 @@ import logging
 from pathlib import Path
 import os
 import click
-import shutil
-import subprocess
 from cath_alphaflow.io_utils import yield_first_col
 from cath_alphaflow.models.domains import AFDomainID
 from cath_alphaflow.constants import (
@@ -16,13 +14,22 @@ from cath_alphaflow.constants import (
 from tempfile import TemporaryDirectory
 from cath_alphaflow.settings import get_default_settings,DEFAULT_AF_VERSION
 from cath_alphaflow.errors import ArgumentError
-
-config = get_default_settings()
-
-FS_BINARY_PATH = config.FS_BINARY_PATH
+from cath_alphaflow.foldseek_utils import (
+    concat_dbs,
+    create_sub_db,
+    get_keys_by_filename,
+    get_file_checksum,
+    plan_incremental_update,
+    replace_db,
+    run_foldseek_command,
+    write_checksums,
+)
 
 LOG = logging.getLogger()
 
+# number of missing CIF files to include in the error message
+MAX_MISSING_EXAMPLES = 10
+
 
 @click.command()
 @click.option(
@@ -71,8 +78,8 @@ LOG = logging.getLogger()
 @click.option(
     "--fs_bin_path",
     type=click.Path(file_okay=True, resolve_path=True),
-    default=FS_BINARY_PATH,
-    help=f"Option: directory containing the Foldseek executable. (default: {FS_BINARY_PATH})"
+    default=lambda: get_default_settings().FS_BINARY_PATH,
+    help="Option: directory containing the Foldseek executable. (default: FS_BINARY_PATH setting)"
 )
 @click.option(
     "--af_version",
@@ -80,12 +87,18 @@ LOG = logging.getLogger()
     default=DEFAULT_AF_VERSION,
     help=f"Option: specify the AF version when parsing uniprot ids. (default: {DEFAULT_AF_VERSION}",
 )
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Option: only add new (or changed) CIF files to an existing Foldseek query database (entries for CIF files that no longer exist are removed)",
+)
 def convert_cif_to_foldseek_db(
-    cif_dir, fs_querydb_dir, fs_querydb_name, id_file, id_type, cif_suffix, fs_querydb_suffix, fs_bin_path, af_version
+    cif_dir, fs_querydb_dir, fs_querydb_name, id_file, id_type, cif_suffix, fs_querydb_suffix, fs_bin_path, af_version, incremental
 ):
     "Create Foldseek query database from mmCIF folder"
 
-    if FS_BINARY_PATH is None:
+    if fs_bin_path is None:
         msg = "expected foldseek binary path (FS_BINARY_PATH) to be set"
         raise RuntimeError(msg)
 
@@ -93,9 +106,11 @@ def convert_cif_to_foldseek_db(
     if not fs_querydb_path.exists():
         os.makedirs(fs_querydb_path)
     
-    af_tmp_dir = None
+    fs_querydb = Path(f"{fs_querydb_dir}/{fs_querydb_name}{fs_querydb_suffix}")
+
+    cif_paths = None
     if id_file is not None:
-        af_tmp_dir = TemporaryDirectory(prefix='af_fs_tmp_dir_')
+        file_names = []
         for af_domain_id_str in yield_first_col(id_file):
             if id_type == ID_TYPE_UNIPROT_DOMAIN:
                 af_domain_id = AFDomainID.from_uniprot_str(
@@ -106,32 +121,123 @@ def convert_cif_to_foldseek_db(
             else:
                 msg = f"failed to understand id_type '${id_type}'"
                 raise ArgumentError(msg)
+            file_names.append(f"{af_domain_id.to_file_stub()}{cif_suffix}")
+
+        cif_paths, missing_names = resolve_cif_paths(cif_dir, file_names)
+        if missing_names:
+            for file_name in missing_names:
+                LOG.error(f"failed to locate CIF input file {file_name} in {cif_dir}")
+            examples = ", ".join(missing_names[:MAX_MISSING_EXAMPLES])
+            msg = (
+                f"failed to locate {len(missing_names)} of {len(file_names)} CIF input "
+                f"files in {cif_dir} (e.g. {examples})"
+            )
+            raise FileNotFoundError(msg)
+    elif incremental:
+        cif_paths = sorted(
+            Path(entry.path) for entry in os.scandir(cif_dir) if entry.is_file()
+        )
+
+    if incremental and Path(f"{fs_querydb}.lookup").exists():
+        update_foldseek_db(
+            fs_querydb, cif_paths, cif_dir=cif_dir, fs_bin_path=fs_bin_path
+        )
+        click.echo("DONE")
+        return
+
+    with TemporaryDirectory(prefix="af_fs_tmp_dir_") as af_tmp_dir:
+        if cif_paths is not None:
+            cif_list_path = Path(af_tmp_dir) / "cif_files.tsv"
+            cif_input = write_cif_file_list(cif_paths, cif_list_path)
+        else:
+            cif_input = cif_dir
+        LOG.info(f"{cif_input} {fs_querydb_dir}")
+        run_foldseek_command(fs_bin_path, "createdb", cif_input, fs_querydb)
+
+    if incremental:
+        # record checksums so that the next incremental update can spot changes
+        write_checksums(
+            fs_querydb,
+            {cif_path.name: get_file_checksum(cif_path) for cif_path in cif_paths},
+        )
 
-            file_stub = af_domain_id.to_file_stub()
-            cif_path = Path(cif_dir) / f"{file_stub}{cif_suffix}"
-            if not cif_path.exists():
-                msg = f"failed to locate CIF input file {cif_path}"
-                LOG.error(msg)
-                raise FileNotFoundError(msg)
-            # Create symlinks to querydb_dir
-            dest_cif_path = Path(af_tmp_dir.name) / cif_path.name
-            if not dest_cif_path.exists():
-                os.symlink(str(cif_path), str(dest_cif_path))
-        cif_input_dir = af_tmp_dir.name
-        fs_querydb = Path(f"{fs_querydb_dir}/{fs_querydb_name}{fs_querydb_suffix}")
-    else:
-        cif_input_dir = cif_dir
-        fs_querydb = Path(f"{fs_querydb_dir}/{fs_querydb_name}{fs_querydb_suffix}")
-    LOG.info(f'{cif_input_dir} {fs_querydb_dir}')
-    subprocess.run(
-        [
-            f"{fs_bin_path}",
-            "createdb",
-            f"{cif_input_dir}",
-            f"{fs_querydb}",
-        ],
-        stderr=subprocess.DEVNULL,
-        check=True,
-    )
     click.echo("DONE")
     return
+
+
+def resolve_cif_paths(cif_dir, file_names):
+    """
+    Returns the paths of the CIF files that exist in `cif_dir` and the names that do not
+
+    The directory is listed once (rather than checking each file) to keep the number of
+    filesystem operations down on network filesystems.
+    """
+    with os.scandir(cif_dir) as entries:
+        existing_names = {entry.name for entry in entries}
+    cif_paths = []
+    missing_names = []
+    for file_name in dict.fromkeys(file_names):
+        if file_name in existing_names:
+            cif_paths.append(Path(cif_dir) / file_name)
+        else:
+            missing_names.append(file_name)
+    return cif_paths, missing_names
+
+
+def write_cif_file_list(cif_paths, list_path):
+    "Write the CIF paths to a file list (`foldseek createdb` reads `.tsv` input as a list)"
+    with open(list_path, "wt") as fh:
+        for cif_path in cif_paths:
+            fh.write(f"{cif_path}\n")
+    return list_path
+
+
+def update_foldseek_db(fs_querydb, cif_paths, *, fs_bin_path, cif_dir=None):
+    """
+    Add new (or changed) CIF files to an existing Foldseek query database
+
+    Entries for files whose checksum has changed (or that no longer exist in `cif_dir`)
+    are dropped (`createsubdb`), a DB is created for the new files (`createdb`) and the
+    two are merged (`concatdbs`).
+    """
+    plan = plan_incremental_update(fs_querydb, cif_paths, cif_dir=cif_dir)
+    LOG.info(
+        f"Incremental update of {fs_querydb}: {len(plan.new_paths)} new files, "
+        f"{len(plan.changed_paths)} changed files, "
+        f"{len(plan.removed_filenames)} removed files "
+        f"({len(plan.stale_keys)} stale entries)"
+    )
+
+    if plan.is_empty:
+        write_checksums(fs_querydb, plan.checksums)
+        return
+
+    with TemporaryDirectory(prefix="af_fs_incr_") as tmp_dir:
+        tmp_path = Path(tmp_dir)
+
+        base_db = fs_querydb
+        if plan.stale_keys:
+            all_keys = set().union(*get_keys_by_filename(fs_querydb).values())
+            base_db = tmp_path / "current.db"
+            create_sub_db(
+                fs_bin_path,
+                all_keys - plan.stale_keys,
+                fs_querydb,
+                base_db,
+                tmp_dir=tmp_path,
+            )
+
+        if plan.paths_to_add:
+            new_cif_list = write_cif_file_list(
+                plan.paths_to_add, tmp_path / "new_cif_files.tsv"
+            )
+            new_db = tmp_path / "new.db"
+            run_foldseek_command(fs_bin_path, "createdb", new_cif_list, new_db)
+            merged_db = tmp_path / "merged.db"
+            concat_dbs(fs_bin_path, base_db, new_db, merged_db)
+        else:
+            # files were only removed
+            merged_db = base_db
+        replace_db(merged_db, fs_querydb)
+
+    write_checksums(fs_querydb, plan.checksums)
@@ -15,6 +15,8 @@ from cath_alphaflow.io_utils import (
     get_sse_summary_writer,
 )
 from cath_alphaflow.models.domains import SecStrSummary, AFDomainID
+from cath_alphaflow.profiling import STAGE_COMPUTE, STAGE_READ, entries, timed
+from cath_alphaflow.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
 from cath_alphaflow.constants import (
     DEFAULT_DSSP_SUFFIX,
     ID_TYPE_SIMPLE,
@@ -70,8 +72,22 @@ from cath_alphaflow.constants import (
     default=DEFAULT_DSSP_CHECK_POLICY,
     help=f"Option: specify behaviour on dssp check [{DEFAULT_DSSP_CHECK_POLICY}]",
 )
+@click.option(
+    "--progress_interval",
+    type=float,
+    default=DEFAULT_PROGRESS_INTERVAL,
+    show_default=True,
+    help="Option: seconds between progress messages (0 to disable)",
+)
 def convert_dssp_to_sse_summary(
-    dssp_dir, id_file, id_type, sse_out_file, dssp_suffix, af_version, dssp_check_policy
+    dssp_dir,
+    id_file,
+    id_type,
+    sse_out_file,
+    dssp_suffix,
+    af_version,
+    dssp_check_policy,
+    progress_interval,
 ):
     "Creates summary of secondary structure elements (SSEs) from DSSP files"
 
@@ -81,8 +97,9 @@ def convert_dssp_to_sse_summary(
         )
 
     sse_out_writer = get_sse_summary_writer(sse_out_file)
+    progress = ProgressReporter.for_id_file(id_file, interval=progress_interval)
 
-    for id_str in yield_first_col(id_file):
+    for id_str in entries(yield_first_col(id_file)):
 
         click.echo(f"Processing '{id_str}' (id:{id_type}) ...")
 
@@ -117,33 +134,55 @@ def convert_dssp_to_sse_summary(
             msg = f"failed to get SSE summary for entry {acc_id} [err: {err}] "
             if dssp_check_policy == FILE_POLICY_SKIP:
                 LOG.warning(f"{msg} (skipping)")
+                progress.update()
                 continue
             else:
                 LOG.error(f"{msg} (use --dssp_check_policy=skip to ignore)")
                 raise
 
         sse_out_writer.writerow(ss_sum.to_dict())
+        progress.update()
 
+    progress.finish()
     click.echo("DONE")
 
 
+@timed(STAGE_COMPUTE)
 def get_sse_summary_from_dssp(
     dssp_path: Path, *, chopping=None, acc_id=None
 ) -> SecStrSummary:
 
-    dssp_string = ""
-    read_headers = False
     if acc_id is None:
         acc_id = dssp_path.stem
 
+    dssp_string = read_dssp_string(dssp_path)
+
+    return get_sse_summary_from_dssp_string(
+        dssp_string, chopping=chopping, acc_id=acc_id, dssp_path=dssp_path
+    )
+
+
+@timed(STAGE_READ)
+def read_dssp_string(dssp_path: Path) -> str:
+    """
+    Returns the DSSP codes of all the residues in a DSSP file
+    """
+    dssp_codes = []
+    read_headers = False
     with dssp_path.open("rt") as dssp_fh:
         for line in dssp_fh:
             if line.startswith("  #"):
                 read_headers = True
                 continue
             if read_headers:
-                dssp_code = line[16]
-                dssp_string += dssp_code
+                dssp_codes.append(line[16])
+    return "".join(dssp_codes)
+
+
+@timed(STAGE_COMPUTE)
+def get_sse_summary_from_dssp_string(
+    dssp_string: str, *, acc_id: str, chopping=None, dssp_path=None
+) -> SecStrSummary:
 
     segment_dssp = ""
     if chopping:
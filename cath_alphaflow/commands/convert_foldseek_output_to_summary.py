@@ -1,20 +1,41 @@
+import heapq
+import itertools
 import logging
-from unittest import result
+import re
+
 import click
+import numpy as np
+
 from cath_alphaflow.io_utils import (
     yield_first_col,
-    get_foldseek_reader,
     get_foldseek_summary_writer,
+    get_foldseek_ranked_hits_writer,
+    get_cath_domain_superfamily_lookup,
+    FOLDSEEK_FIELDNAMES,
 )
-from cath_alphaflow.settings import get_default_settings, DEFAULT_AF_VERSION
-from cath_alphaflow.constants import DEFAULT_FS_BITS_CUTOFF, DEFAULT_FS_OVERLAP,ID_TYPE_AF_DOMAIN,ID_TYPE_UNIPROT_DOMAIN
-from cath_alphaflow.models.domains import FoldseekSummary,AFDomainID
-from cath_alphaflow.errors import ArgumentError
-
-config = get_default_settings()
+from cath_alphaflow.settings import DEFAULT_AF_VERSION
+from cath_alphaflow.constants import (
+    DEFAULT_FS_BITS_CUTOFF,
+    DEFAULT_FS_OVERLAP,
+    DEFAULT_FS_TOP_K,
+    ID_TYPE_AF_DOMAIN,
+    ID_TYPE_UNIPROT_DOMAIN,
+)
+from cath_alphaflow.models.domains import AFDomainID
+from cath_alphaflow.errors import ArgumentError, ParseError
 
 LOG = logging.getLogger()
 
+DEFAULT_BATCH_SIZE = 1000000
+
+FS_QUERY_COL = FOLDSEEK_FIELDNAMES.index("query")
+FS_TCOV_COL = FOLDSEEK_FIELDNAMES.index("tcov")
+FS_BITS_COL = FOLDSEEK_FIELDNAMES.index("bits")
+FS_TARGET_COL = FOLDSEEK_FIELDNAMES.index("target")
+
+# CATH domain id within a Foldseek target id (e.g. '1xhlA00' in 'cath|4_3_0|1xhlA00/3-252')
+RE_CATH_DOMAIN_ID = re.compile(r"[0-9][0-9a-z]{3}[0-9A-Za-z][0-9]{2}")
+
 
 @click.command()
 @click.option(
@@ -47,17 +68,68 @@ LOG = logging.getLogger()
     default=DEFAULT_AF_VERSION,
     help=f"Option: specify the AF version when parsing uniprot ids. (default:{DEFAULT_AF_VERSION})",
 )
+@click.option(
+    "--batch_size",
+    type=int,
+    default=DEFAULT_BATCH_SIZE,
+    help=f"Param: number of Foldseek rows to process at a time. (default:{DEFAULT_BATCH_SIZE})",
+)
+@click.option(
+    "--top_k",
+    type=int,
+    default=DEFAULT_FS_TOP_K,
+    help=f"Param: number of ranked hits to keep per query. (default:{DEFAULT_FS_TOP_K})",
+)
+@click.option(
+    "--cath_domain_list",
+    type=click.File("rt"),
+    required=False,
+    help="Input: CATH domain list file (CathDomainList format) to map target domains to superfamilies",
+)
+@click.option(
+    "--fs_top_hits",
+    type=click.File("wt"),
+    required=False,
+    help="Output: top K hits per query (ranked by bits)",
+)
+@click.option(
+    "--fs_top_superfamily_hits",
+    type=click.File("wt"),
+    required=False,
+    help="Output: best hit per superfamily for the top K superfamilies per query (requires --cath_domain_list)",
+)
+def convert_foldseek_output_to_summary(
+    id_file,
+    fs_input_file,
+    fs_results,
+    id_type,
+    af_version,
+    batch_size,
+    top_k,
+    cath_domain_list,
+    fs_top_hits,
+    fs_top_superfamily_hits,
+):
+    if fs_top_superfamily_hits and not cath_domain_list:
+        msg = "--fs_top_superfamily_hits requires --cath_domain_list"
+        raise click.UsageError(msg)
+
+    if top_k < 1:
+        raise click.BadParameter("--top_k must be a positive integer")
+
+    superfamily_by_domain = None
+    if cath_domain_list:
+        superfamily_by_domain = get_cath_domain_superfamily_lookup(cath_domain_list)
+        LOG.info(f"Loaded superfamilies for {len(superfamily_by_domain)} CATH domains")
 
-def convert_foldseek_output_to_summary(id_file, fs_input_file, fs_results, id_type, af_version):
     unique_af_ids = set()
     unique_af_ids.add("NOHIT")
-    best_hit_by_query = {}
     foldseek_results_writer = get_foldseek_summary_writer(fs_results)
     # Build set of unique AF IDs
     for af_domain_id_str in yield_first_col(id_file):
         if id_type == ID_TYPE_UNIPROT_DOMAIN:
             af_domain_id = AFDomainID.from_uniprot_str(
-                af_domain_id_str,version=af_version
+                af_domain_id_str, version=af_version
             )
             af_domain_id_str = af_domain_id.to_file_stub()
         elif id_type == ID_TYPE_AF_DOMAIN:
@@ -67,41 +139,294 @@ def convert_foldseek_output_to_summary(id_file, fs_input_file, fs_results, id_ty
             msg = f"failed to understand id_type '${id_type}'"
             raise ArgumentError(msg)
         unique_af_ids.add(af_domain_id_str)
-   
-    # Build Foldseek Reader
-    foldseek_reader = get_foldseek_reader(fs_input_file)
-
-    # Extract best hit per query for filtered ids
-    for foldseek_result_as_dict in foldseek_reader:
-        result = FoldseekSummary(**foldseek_result_as_dict)
-        
-        """
-        result: 
-        {'query': 'AF-A0A059CHW2-F1-model_v4-22-322.cif', 'target': '1xhlA00', 'qstart': '7', 'qend': '271', 
-         'qlen': '301', 'tstart': '3', 'tend': '252', 'tlen': '274', 'qcov': '0.880', 'tcov': '0.912', 
-         'bits': '509', 'evalue': '1.305E-11'}
-        """
-        
-        af_query_id = AFDomainID.from_foldseek_query(result.query)
-        
-        
-        af_query_id_str = af_query_id.from_str(str(af_query_id)).to_file_stub()
-    
-        if af_query_id_str not in unique_af_ids:
+
+    # Extract best hit (and top hits) per query for filtered ids
+    best_hit_by_query, top_hits_by_query = summarise_foldseek_hits(
+        fs_input_file,
+        unique_af_ids=unique_af_ids,
+        batch_size=batch_size,
+        top_k=top_k if (fs_top_hits or fs_top_superfamily_hits) else None,
+        superfamily_by_domain=superfamily_by_domain,
+    )
+
+    # Write results to summary file
+    for af_query_id, (bits, cols) in best_hit_by_query.items():
+        foldseek_results_writer.writerow(dict(zip(FOLDSEEK_FIELDNAMES, cols)))
+
+    if fs_top_hits:
+        write_ranked_hits(fs_top_hits, top_hits_by_query)
+
+    if fs_top_superfamily_hits:
+        write_ranked_hits(
+            fs_top_superfamily_hits, top_hits_by_query, by_superfamily=True
+        )
+
+    click.echo("DONE")
+
+
+class QueryTopHits:
+    """
+    Bounded collections of the best Foldseek hits for a single query
+
+    Keeps the top `top_k` hits, and the best hit for each of the top `top_k`
+    superfamilies, so memory is bounded by `top_k` however many hits are added.
+
+    Hits are ranked by bits (ties are ranked by the order they were seen).
+    """
+
+    __slots__ = ("top_k", "superfamily_by_target", "_hits", "_sfam_hits")
+
+    def __init__(self, top_k, superfamily_by_target):
+        self.top_k = top_k
+        self.superfamily_by_target = superfamily_by_target
+        self._hits = []  # min heap of (bits, -seq, cols)
+        self._sfam_hits = {}  # superfamily -> (bits, -seq, cols)
+
+    def superfamily_of(self, cols):
+        return self.superfamily_by_target.get(cols[FS_TARGET_COL], "")
+
+    def add_hit(self, bits, seq, cols):
+        hit = (bits, -seq, cols)
+        if len(self._hits) < self.top_k:
+            heapq.heappush(self._hits, hit)
+        elif hit[:2] > self._hits[0][:2]:
+            heapq.heapreplace(self._hits, hit)
+
+    def add_superfamily_hit(self, superfamily, bits, seq, cols):
+        hit = (bits, -seq, cols)
+        sfam_hits = self._sfam_hits
+        if superfamily in sfam_hits:
+            if hit[:2] > sfam_hits[superfamily][:2]:
+                sfam_hits[superfamily] = hit
+            return
+        if len(sfam_hits) >= self.top_k:
+            # a superfamily that drops out can never come back with a worse hit
+            worst_sfam = min(sfam_hits, key=lambda sfam: sfam_hits[sfam][:2])
+            if hit[:2] < sfam_hits[worst_sfam][:2]:
+                return
+            del sfam_hits[worst_sfam]
+        sfam_hits[superfamily] = hit
+
+    def ranked_hits(self):
+        return [cols for _, _, cols in sorted(self._hits, key=_hit_rank_key)]
+
+    def ranked_superfamily_hits(self):
+        hits = sorted(self._sfam_hits.values(), key=_hit_rank_key)
+        return [cols for _, _, cols in hits]
+
+
+def _hit_rank_key(hit):
+    bits, neg_seq, _cols = hit
+    return (-bits, -neg_seq)
+
+
+def _first_n_per_group(sorted_group_codes, n):
+    """
+    Returns a mask of the first `n` entries of each group (in an array sorted by group)
+    """
+    size = len(sorted_group_codes)
+    is_group_start = np.ones(size, dtype=bool)
+    is_group_start[1:] = sorted_group_codes[1:] != sorted_group_codes[:-1]
+    group_start_idx = np.maximum.accumulate(
+        np.where(is_group_start, np.arange(size), 0)
+    )
+    return (np.arange(size) - group_start_idx) < n
+
+
+def summarise_foldseek_hits(
+    fs_input_file,
+    *,
+    unique_af_ids,
+    batch_size=DEFAULT_BATCH_SIZE,
+    min_tcov=DEFAULT_FS_OVERLAP,
+    min_bits=DEFAULT_FS_BITS_CUTOFF,
+    top_k=None,
+    superfamily_by_domain=None,
+):
+    """
+    Finds the best (highest bits) Foldseek hits for each query in `unique_af_ids`
+
+    Rows are processed in batches of `batch_size`: the thresholds are applied to each
+    batch as arrays and each batch is reduced to its best hits per query before being
+    merged with the hits so far. Each query id is only parsed once.
+
+    Returns `(best_hit_by_query, top_hits_by_query)`:
+
+    - `best_hit_by_query` is a `dict` of `{query_file_stub: (bits, columns)}` ordered by
+      the first hit that passes the thresholds for each query (ties keep the first hit)
+    - `top_hits_by_query` is a `dict` of `{query_file_stub: QueryTopHits}` in the same
+      order (empty unless `top_k` is set)
+    """
+
+    # raw query id -> AF domain file stub (or None if not in `unique_af_ids`)
+    query_id_cache = {}
+
+    def query_to_file_stub(raw_query_id):
+        af_query_id = AFDomainID.from_foldseek_query(raw_query_id)
+        af_query_id_str = af_query_id.to_file_stub()
+        return af_query_id_str if af_query_id_str in unique_af_ids else None
+
+    # raw target id -> superfamily ("" if unknown)
+    superfamily_by_target = {}
+    superfamily_codes = {}
+
+    def target_to_superfamily(raw_target_id):
+        if raw_target_id not in superfamily_by_target:
+            superfamily = ""
+            if superfamily_by_domain:
+                superfamily = superfamily_by_domain.get(raw_target_id, "")
+                if not superfamily:
+                    match = RE_CATH_DOMAIN_ID.search(raw_target_id)
+                    if match:
+                        superfamily = superfamily_by_domain.get(match.group(0), "")
+            superfamily_by_target[raw_target_id] = superfamily
+        return superfamily_by_target[raw_target_id]
+
+    best_hit_by_query = {}
+    top_hits_by_query = {}
+    row_count = 0
+    for batch in yield_foldseek_row_batches(fs_input_file, batch_size=batch_size):
+        batch_offset = row_count
+        row_count += len(batch)
+
+        query_ids = np.array([cols[FS_QUERY_COL] for cols in batch])
+        tcov = np.array([cols[FS_TCOV_COL] for cols in batch], dtype=np.float64)
+        bits = np.array([cols[FS_BITS_COL] for cols in batch], dtype=np.float64)
+        # bits are compared as integers
+        bits = np.trunc(bits)
+
+        # parse each unique query id in the batch (unless we've already seen it)
+        unique_query_ids, query_idx = np.unique(query_ids, return_inverse=True)
+        query_stubs = []
+        for raw_query_id in unique_query_ids.tolist():
+            if raw_query_id not in query_id_cache:
+                query_id_cache[raw_query_id] = query_to_file_stub(raw_query_id)
+            query_stubs.append(query_id_cache[raw_query_id])
+        is_requested = np.array([stub is not None for stub in query_stubs], dtype=bool)
+
+        mask = is_requested[query_idx] & (tcov > min_tcov) & (bits > min_bits)
+        row_idx = np.flatnonzero(mask)
+        if not len(row_idx):
             continue
-        
-        if float(result.tcov) <= DEFAULT_FS_OVERLAP or int(result.bits) <= DEFAULT_FS_BITS_CUTOFF:
+
+        # hits per query in this batch: sort by query, bits (desc), row (asc)
+        order = np.lexsort((row_idx, -bits[row_idx], query_idx[row_idx]))
+        sorted_row_idx = row_idx[order]
+        sorted_query_idx = query_idx[sorted_row_idx]
+        best_row_idx = sorted_row_idx[_first_n_per_group(sorted_query_idx, 1)]
+
+        # merge in the order each query first appears in the batch
+        _, first_seen = np.unique(query_idx[row_idx], return_index=True)
+        first_seen_row_idx = row_idx[first_seen]
+        for best_idx in best_row_idx[np.argsort(first_seen_row_idx, kind="stable")]:
+            af_query_id_str = query_stubs[query_idx[best_idx]]
+            best_bits = bits[best_idx]
+            if (
+                af_query_id_str not in best_hit_by_query
+                or best_bits > best_hit_by_query[af_query_id_str][0]
+            ):
+                best_hit_by_query[af_query_id_str] = (best_bits, batch[best_idx])
+            if top_k and af_query_id_str not in top_hits_by_query:
+                top_hits_by_query[af_query_id_str] = QueryTopHits(
+                    top_k, superfamily_by_target
+                )
+
+        if not top_k:
+            continue
+
+        # only the top K hits per query in this batch can make the top K overall
+        for idx in sorted_row_idx[_first_n_per_group(sorted_query_idx, top_k)]:
+            top_hits = top_hits_by_query[query_stubs[query_idx[idx]]]
+            top_hits.add_hit(bits[idx], batch_offset + idx, batch[idx])
+
+        if not superfamily_by_domain:
             continue
 
-        if af_query_id_str not in best_hit_by_query:
-            best_hit_by_query[af_query_id_str] = result
+        # ... and only the best hit per (query, superfamily)
+        # (map each unique target in the batch to a superfamily code)
+        unique_target_ids, target_idx = np.unique(
+            np.array([batch[idx][FS_TARGET_COL] for idx in row_idx.tolist()]),
+            return_inverse=True,
+        )
+        target_sfam_codes = np.array(
+            [
+                superfamily_codes.setdefault(
+                    target_to_superfamily(raw_target_id), len(superfamily_codes)
+                )
+                for raw_target_id in unique_target_ids.tolist()
+            ],
+            dtype=np.int64,
+        )
+        sfam_idx = np.empty(len(batch), dtype=np.int64)
+        sfam_idx[row_idx] = target_sfam_codes[target_idx]
+        order = np.lexsort(
+            (row_idx, -bits[row_idx], sfam_idx[row_idx], query_idx[row_idx])
+        )
+        sorted_row_idx = row_idx[order]
+        group_codes = (
+            query_idx[sorted_row_idx] * (len(superfamily_codes) + 1)
+            + sfam_idx[sorted_row_idx]
+        )
+        for idx in sorted_row_idx[_first_n_per_group(group_codes, 1)]:
+            superfamily = superfamily_by_target[batch[idx][FS_TARGET_COL]]
+            if not superfamily:
+                continue
+            top_hits = top_hits_by_query[query_stubs[query_idx[idx]]]
+            top_hits.add_superfamily_hit(
+                superfamily, bits[idx], batch_offset + idx, batch[idx]
+            )
 
-        if int(result.bits) > int(best_hit_by_query[af_query_id_str].bits):
-            best_hit_by_query[af_query_id_str] = result
-        
+    LOG.info(
+        f"Found best hits for {len(best_hit_by_query)} queries "
+        f"(from {row_count} Foldseek rows, {len(query_id_cache)} unique queries)"
+    )
+    return best_hit_by_query, top_hits_by_query
 
 
-        
-    # Write results to summary file
-    for af_query_id, result in best_hit_by_query.items():   
-        foldseek_results_writer.writerow(result.__dict__)
+def get_best_hit_by_query(fs_input_file, **kwargs):
+    """
+    Returns the best (highest bits) Foldseek hit for each query (see `summarise_foldseek_hits`)
+    """
+    best_hit_by_query, _ = summarise_foldseek_hits(fs_input_file, **kwargs)
+    return best_hit_by_query
+
+
+def write_ranked_hits(fh, top_hits_by_query, *, by_superfamily=False):
+    """
+    Writes the ranked hits for each query (with rank and superfamily)
+    """
+    writer = get_foldseek_ranked_hits_writer(fh)
+    for top_hits in top_hits_by_query.values():
+        if by_superfamily:
+            ranked_hits = top_hits.ranked_superfamily_hits()
+        else:
+            ranked_hits = top_hits.ranked_hits()
+        for rank, cols in enumerate(ranked_hits, 1):
+            row = dict(zip(FOLDSEEK_FIELDNAMES, cols))
+            row["superfamily"] = top_hits.superfamily_of(cols)
+            row["rank"] = rank
+            writer.writerow(row)
+
+
+def yield_foldseek_row_batches(fs_input_file, *, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields lists (of up to `batch_size`) of Foldseek rows as lists of columns
+    """
+    expected_cols = len(FOLDSEEK_FIELDNAMES)
+    lines = iter(fs_input_file)
+    while True:
+        lines_batch = list(itertools.islice(lines, batch_size))
+        if not lines_batch:
+            break
+        batch = [
+            line.rstrip("\r\n").split("\t") for line in lines_batch if line.strip()
+        ]
+        if not batch:
+            continue
+        for cols in batch:
+            if len(cols) < expected_cols:
+                msg = (
+                    f"expected {expected_cols} columns in Foldseek output (got {cols})"
+                )
+                raise ParseError(msg)
+        yield batch
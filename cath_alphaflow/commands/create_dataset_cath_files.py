@@ -14,7 +14,10 @@ from cath_alphaflow.settings import DEFAULT_AF_VERSION, DEFAULT_AF_FRAGMENT
 from cath_alphaflow.predicted_domain_provider import (
     Gene3DCrhPredictedCathDomainProvider,
     DecoratedCrhPredictedCathDomainProvider,
+    IndexedDecoratedCrhPredictedCathDomainProvider,
+    SortMergeDecoratedCrhPredictedCathDomainProvider,
 )
+from cath_alphaflow.sort_utils import DEFAULT_SORT_BUFFER_ROWS
 from pydantic import ConfigDict
 
 LOG = logging.getLogger()
@@ -115,11 +118,49 @@ def create_cath_dataset_from_db(*args, **kwargs):
     required=True,
     help="Input: Decorated CRH file containing matches",
 )
+@click.option(
+    "--crh_index",
+    type=click.Path(file_okay=False, dir_okay=True, resolve_path=True),
+    default=None,
+    help="Option: directory of the byte-offset index for the CRH file, reads CRH rows "
+    "for each chunk of UniProt IDs directly (built if missing or out of date)",
+)
+@click.option(
+    "--af_uniprot_md5_lookup",
+    type=click.Path(file_okay=False, dir_okay=True, resolve_path=True),
+    default=None,
+    help="Option: directory of the compact MD5 lookup for the AF / UniProt / MD5 file "
+    "(built if missing or out of date, otherwise built in a temporary directory)",
+)
+@click.option(
+    "--sort_merge_join",
+    is_flag=True,
+    default=False,
+    help="Option: process all UniProt IDs at once by sorting the inputs on disk by "
+    "MD5 and merge joining them (memory bounded by --sort_buffer_rows, not input size)",
+)
+@click.option(
+    "--sort_buffer_rows",
+    type=int,
+    default=DEFAULT_SORT_BUFFER_ROWS,
+    show_default=True,
+    help="Param: maximum number of rows held in memory by all the sorts (with --sort_merge_join)",
+)
+@click.option(
+    "--sort_tmp_dir",
+    type=click.Path(file_okay=False, dir_okay=True, exists=True),
+    default=None,
+    help="Option: directory for temporary sort files (with --sort_merge_join)",
+)
 def create_cath_dataset_from_files(src_decorated_crh, **kwargs):
     """
     Creates CATH data files for a given dataset (based on flat files)
     """
 
+    if kwargs["sort_merge_join"] and kwargs["crh_index"]:
+        msg = "--sort_merge_join cannot be used with --crh_index"
+        raise click.UsageError(msg)
+
     generator = CathDatasetGeneratorFromDecoratedCrh(
         src_crh=src_decorated_crh, **kwargs
     )
@@ -288,13 +329,61 @@ class CathDatasetGeneratorFromDB(CathDatasetGeneratorBase):
 class CathDatasetGeneratorFromDecoratedCrh(CathDatasetGeneratorBase):
     src_crh: io.TextIOWrapper  # from click.File
     src_af_uniprot_md5: io.TextIOWrapper  # from click.File
+    crh_index: typing.Optional[str] = None
+    af_uniprot_md5_lookup: typing.Optional[str] = None
+    sort_merge_join: bool = False
+    sort_buffer_rows: int = DEFAULT_SORT_BUFFER_ROWS
+    sort_tmp_dir: typing.Optional[str] = None
+    crh_provider: typing.Any = None
 
-    def next_cath_dataset_entry(self, uniprot_ids):
+    def run(self):
+        if not self.sort_merge_join:
+            return super().run()
+
+        click.echo("Setting up output file writers ...")
+        self.setup_writers()
+
+        click.echo(f"Setting up UniProt reader '{self.csv_uniprot_ids.name}'")
+        uniprot_reader = get_uniprot_id_dictreader(self.csv_uniprot_ids)
+        uniprot_ids = (row.get("uniprot_id") for row in uniprot_reader)
 
-        provider = DecoratedCrhPredictedCathDomainProvider(
-            datasource=self.src_crh,
-            af_uniprot_md5_file=self.src_af_uniprot_md5,
+        # all ids in one pass: the merge join reads the full CRH / MD5 files each time
+        click.echo(
+            f"Processing all UniProtIDs via sort / merge join "
+            f"(sort_buffer_rows={self.sort_buffer_rows}) ..."
         )
+        self.process_uniprot_ids(uniprot_ids)
+
+        click.echo("DONE")
+
+    def get_crh_provider(self):
+        # the provider holds the MD5 lookup (and CRH index) so only create it once
+        if self.crh_provider is None:
+            if self.sort_merge_join:
+                self.crh_provider = SortMergeDecoratedCrhPredictedCathDomainProvider(
+                    datasource=self.src_crh,
+                    af_uniprot_md5_file=self.src_af_uniprot_md5,
+                    sort_buffer_rows=self.sort_buffer_rows,
+                    sort_tmp_dir=self.sort_tmp_dir,
+                )
+            elif self.crh_index:
+                self.crh_provider = IndexedDecoratedCrhPredictedCathDomainProvider(
+                    datasource=self.src_crh,
+                    af_uniprot_md5_file=self.src_af_uniprot_md5,
+                    lookup_path=self.af_uniprot_md5_lookup,
+                    index_path=self.crh_index,
+                )
+            else:
+                self.crh_provider = DecoratedCrhPredictedCathDomainProvider(
+                    datasource=self.src_crh,
+                    af_uniprot_md5_file=self.src_af_uniprot_md5,
+                    lookup_path=self.af_uniprot_md5_lookup,
+                )
+        return self.crh_provider
+
+    def next_cath_dataset_entry(self, uniprot_ids):
+
+        provider = self.get_crh_provider()
 
         for entry in provider.next_cath_dataset_entry(
             uniprot_ids=uniprot_ids,
@@ -2,8 +2,7 @@ import logging
 import click
 
 from cath_alphaflow.io_utils import get_csv_dictwriter
-from cath_alphaflow.db_utils import OraDB
-
+from cath_alphaflow.db_utils import OraDB, DEFAULT_FETCH_ARRAYSIZE
 
 LOG = logging.getLogger()
 
@@ -33,7 +32,16 @@ LOG = logging.getLogger()
     type=str,
     help="Param: maximum records to return",
 )
-def create_dataset_uniprot_ids(uniprot_ids_csv, gene3d_dbname, max_evalue, max_records):
+@click.option(
+    "--arraysize",
+    type=int,
+    default=DEFAULT_FETCH_ARRAYSIZE,
+    show_default=True,
+    help="Param: number of rows to fetch from the database per round trip",
+)
+def create_dataset_uniprot_ids(
+    uniprot_ids_csv, gene3d_dbname, max_evalue, max_records, arraysize
+):
     "Creates UniProt IDs for given dataset"
 
     db = OraDB()
@@ -46,11 +54,12 @@ def create_dataset_uniprot_ids(uniprot_ids_csv, gene3d_dbname, max_evalue, max_r
         f"Querying Dataset UniProtIDs "
         f"(max_evalue={max_evalue}, max_records={max_records}, file={uniprot_ids_csv.name}) ..."
     )
-    for entry in db.next_cath_dataset_entry(
+    for uniprot_acc in db.next_uniprot_accession(
         max_independent_evalue=max_evalue,
         max_records=max_records,
         dbname=gene3d_dbname,
+        arraysize=arraysize,
     ):
-        csv_writer.writerow({"uniprot_acc": entry.uniprot_acc})
+        csv_writer.writerow({"uniprot_acc": uniprot_acc})
 
     click.echo("DONE")
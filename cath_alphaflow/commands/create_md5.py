@@ -1,13 +1,33 @@
+import contextlib
+import csv
+import functools
+import hashlib
+import io
 import logging
-import click
+from pathlib import Path
+import sys
 
-from Bio import SeqIO
+import click
 
-from cath_alphaflow.io_utils import get_af_uniprot_md5_summary_writer
-from cath_alphaflow.seq_utils import str_to_md5
+from cath_alphaflow.fasta_utils import (
+    DEFAULT_CHUNK_BYTES,
+    find_fasta_chunk_ranges,
+    is_gzip_file,
+    iter_fasta_blocks,
+    iter_fasta_records,
+    map_in_processes,
+    open_fasta_binary,
+    read_fasta_chunk,
+)
+from cath_alphaflow.io_utils import CSV_DELIMITER, get_af_uniprot_md5_summary_writer
 from cath_alphaflow.errors import ParseError
 
 DEFAULT_CHUNK_SIZE = 1000000
+DEFAULT_JOBS = 1
+
+# defaults of the csv writer
+CSV_QUOTECHAR = csv.excel.quotechar
+CSV_LINETERMINATOR = csv.excel.lineterminator
 
 LOG = logging.getLogger()
 
@@ -15,10 +35,10 @@ LOG = logging.getLogger()
 @click.command()
 @click.option(
     "--fasta",
-    "fasta_file",
-    type=click.File("rt"),
+    "fasta_path",
+    type=click.Path(exists=True, dir_okay=False, allow_dash=True, path_type=Path),
     required=True,
-    help=f"Input: the fasta database containing all AF sequences",
+    help=f"Input: the fasta database containing all AF sequences (can be gzipped)",
 )
 @click.option(
     "--uniprot_md5_csv",
@@ -27,30 +47,92 @@ LOG = logging.getLogger()
     required=True,
     help="Output: UniProt to MD5 CSV file",
 )
-def create_md5(fasta_file, uniprot_md5_csv_file):
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    show_default=True,
+    help="Option: number of processes used to calculate the MD5s",
+)
+@click.option(
+    "--chunk_bytes",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CHUNK_BYTES,
+    show_default=True,
+    help="Option: size of the chunks of the FASTA file given to each process",
+)
+def create_md5(fasta_path, uniprot_md5_csv_file, jobs, chunk_bytes):
     "Calculate MD5 for FASTA sequences"
+
     with uniprot_md5_csv_file as out_fh:
-        md5_out_writer = get_af_uniprot_md5_summary_writer(out_fh)
-        # work through fasta file, calculate output for relevant records
-        for record in SeqIO.parse(fasta_file, "fasta"):
-            # click.echo(f"record: {record.id} seq='{record.seq[:10]}...'")
-
-            # >AFDB:AF-A0A2L2JPH6-F1
-            header_id = record.id
-            if header_id.startswith("AFDB:"):
-                header_id = header_id[5:]
-            af_chain_id = header_id
-
-            try:
-                af_uniprot_id = af_chain_id.split("-")[1]
-            except:
-                raise ParseError(f"Failed to parse {record.id} as AlphaFold Chain ID")
-
-            row_data = {
-                "af_chain_id": af_chain_id,
-                "uniprot_id": af_uniprot_id,
-                "sequence_md5": str_to_md5(str(record.seq)),
-            }
-            md5_out_writer.writerow(row_data)
+        get_af_uniprot_md5_summary_writer(out_fh)
+
+        # plain files are read by the workers (so only the ranges are sent to them)
+        if str(fasta_path) != "-" and not is_gzip_file(fasta_path):
+            chunks = find_fasta_chunk_ranges(fasta_path, chunk_bytes=chunk_bytes)
+            make_rows = functools.partial(md5_rows_from_fasta_range, fasta_path)
+            chunks_rows = map_in_processes(make_rows, chunks, jobs=jobs)
+            write_rows(chunks_rows, out_fh)
+        else:
+            if str(fasta_path) == "-":
+                fasta_context = contextlib.nullcontext(sys.stdin.buffer)
+            else:
+                fasta_context = open_fasta_binary(fasta_path)
+            with fasta_context as fasta_fh:
+                chunks = iter_fasta_blocks(
+                    fasta_fh, chunk_bytes=chunk_bytes, source=fasta_path
+                )
+                chunks_rows = map_in_processes(
+                    md5_rows_from_fasta_block, chunks, jobs=jobs
+                )
+                write_rows(chunks_rows, out_fh)
 
     click.echo("DONE")
+
+
+def write_rows(chunks_rows, out_fh):
+    record_count = 0
+    for rows_text, chunk_record_count in chunks_rows:
+        out_fh.write(rows_text)
+        record_count += chunk_record_count
+    LOG.info(f"Calculated MD5 for {record_count} sequences")
+
+
+def md5_rows_from_fasta_range(fasta_path: Path, chunk_range):
+    start, end = chunk_range
+    return md5_rows_from_fasta_block(read_fasta_chunk(fasta_path, start, end))
+
+
+def md5_rows_from_fasta_block(data: bytes):
+    """
+    Returns the output rows (as text) and the number of records for a chunk of FASTA
+    """
+    rows = [
+        md5_row(record_id, sequence) for record_id, sequence in iter_fasta_records(data)
+    ]
+    if CSV_QUOTECHAR.encode() not in data:
+        # ids are split at whitespace, so (without quotes) no field needs quoting
+        # and the rows can be joined directly (much faster than the csv writer)
+        rows_text = "".join(
+            CSV_DELIMITER.join(row) + CSV_LINETERMINATOR for row in rows
+        )
+        return rows_text, len(rows)
+    rows_fh = io.StringIO()
+    csv.writer(rows_fh, delimiter=CSV_DELIMITER).writerows(rows)
+    return rows_fh.getvalue(), len(rows)
+
+
+def md5_row(record_id: str, sequence: bytes):
+    # >AFDB:AF-A0A2L2JPH6-F1
+    header_id = record_id
+    if header_id.startswith("AFDB:"):
+        header_id = header_id[5:]
+    af_chain_id = header_id
+
+    try:
+        af_uniprot_id = af_chain_id.split("-")[1]
+    except IndexError:
+        raise ParseError(f"Failed to parse {record_id} as AlphaFold Chain ID")
+
+    # af_chain_id, uniprot_id, sequence_md5
+    return af_chain_id, af_uniprot_id, hashlib.md5(sequence).hexdigest()
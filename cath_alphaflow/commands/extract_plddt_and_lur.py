@@ -1,8 +1,8 @@
 from pathlib import Path
 import gzip
-from Bio.PDB import MMCIF2Dict
 import logging
 import click
+from cath_alphaflow.cif_utils import read_cif_categories
 from cath_alphaflow.io_utils import (
     yield_first_col,
     get_plddt_summary_writer,
@@ -15,9 +15,14 @@ from cath_alphaflow.constants import (
     ID_TYPE_UNIPROT_DOMAIN,
 )
 from cath_alphaflow.errors import ArgumentError
+from cath_alphaflow.profiling import STAGE_COMPUTE, entries, timed
+from cath_alphaflow.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
 
 LOG = logging.getLogger()
 
+# mmCIF categories containing the global and per-residue pLDDT scores
+PLDDT_CIF_CATEGORIES = ("_ma_qa_metric_global", "_ma_qa_metric_local")
+
 
 @click.command()
 @click.option(
@@ -55,6 +60,13 @@ LOG = logging.getLogger()
     default=".cif",
     help="Option: suffix to use for mmCIF files (default: .cif)",
 )
+@click.option(
+    "--progress_interval",
+    type=float,
+    default=DEFAULT_PROGRESS_INTERVAL,
+    show_default=True,
+    help="Option: seconds between progress messages (0 to disable)",
+)
 def convert_cif_to_plddt_summary(
     cif_in_dir,
     id_file,
@@ -62,6 +74,7 @@ def convert_cif_to_plddt_summary(
     plddt_stats_file,
     af_version,
     cif_suffix,
+    progress_interval,
 ):
     "Creates summary of secondary structure elements (SSEs) from DSSP files"
 
@@ -71,8 +84,11 @@ def convert_cif_to_plddt_summary(
         )
 
     plddt_out_writer = get_plddt_summary_writer(plddt_stats_file)
+    progress = ProgressReporter.for_id_file(
+        id_file, label="domains", interval=progress_interval
+    )
 
-    for af_domain_id_str in yield_first_col(id_file):
+    for af_domain_id_str in entries(yield_first_col(id_file)):
         if id_type == ID_TYPE_UNIPROT_DOMAIN:
             af_domain_id = AFDomainID.from_uniprot_str(
                 af_domain_id_str, version=af_version
@@ -106,7 +122,9 @@ def convert_cif_to_plddt_summary(
             residues_total=perc_LUR_summary.residues_total,
         )
         plddt_out_writer.writerow(plddt_stats.__dict__)
+        progress.update()
 
+    progress.finish()
     click.echo("DONE")
 
 
@@ -119,7 +137,12 @@ def get_average_plddt_from_plddt_string(
     if cif_path.name.endswith(".gz"):
         open_func = gzip.open
     with open_func(str(cif_path), mode="rt") as cif_fh:
-        mmcif_dict = MMCIF2Dict.MMCIF2Dict(cif_fh)
+        mmcif_dict = read_cif_categories(cif_fh, PLDDT_CIF_CATEGORIES)
+    return get_average_plddt_from_cif_dict(mmcif_dict, chopping=chopping)
+
+
+@timed(STAGE_COMPUTE)
+def get_average_plddt_from_cif_dict(mmcif_dict: dict, *, chopping=None) -> float:
     chain_plddt = mmcif_dict["_ma_qa_metric_global.metric_value"][0]
     plddt_strings = mmcif_dict["_ma_qa_metric_local.metric_value"]
     chopping_plddt = []
@@ -145,7 +168,12 @@ def get_LUR_residues_percentage(cif_path: Path, *, chopping=None, acc_id=None):
     if cif_path.name.endswith(".gz"):
         open_func = gzip.open
     with open_func(str(cif_path), mode="rt") as cif_fh:
-        mmcif_dict = MMCIF2Dict.MMCIF2Dict(cif_fh)
+        mmcif_dict = read_cif_categories(cif_fh, PLDDT_CIF_CATEGORIES)
+    return get_LUR_summary_from_cif_dict(mmcif_dict, chopping=chopping)
+
+
+@timed(STAGE_COMPUTE)
+def get_LUR_summary_from_cif_dict(mmcif_dict: dict, *, chopping=None) -> LURSummary:
     plddt_strings = mmcif_dict["_ma_qa_metric_local.metric_value"]
     chopping_plddt = []
     if chopping:
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import re
+
+import click
+
+from cath_alphaflow.io_utils import count_lines
+from cath_alphaflow.io_utils import get_af_uniprot_md5_summary_writer
+from cath_alphaflow.index_utils import Md5AfUniprotLookup, Md5BloomFilter
+from cath_alphaflow.models.domains import RE_AF_DOMAIN_ID
+from cath_alphaflow.errors import ParseError
+
+LOG = logging.getLogger()
+
+CRH_FORMATS = {
+    # format: (delimiter, md5 column)
+    "gene3d": ("\t", 0),
+    "decorated": (",", 2),
+}
+
+RE_AF_MODEL_VERSION = re.compile(r"-model_v[0-9]+$")
+
+
+def normalise_line(line: str) -> str:
+    """Removes line endings (including stray carriage returns) from a line"""
+    return line.replace("\r", "").rstrip("\n")
+
+
+def af_chain_stem(af_chain_id: str) -> str:
+    """AF chain id without the model version (`AF-P00520-F1-model_v4` -> `AF-P00520-F1`)"""
+    return RE_AF_MODEL_VERSION.sub("", af_chain_id)
+
+
+def yield_unique_lines(fh):
+    """
+    Yields normalised, non-empty lines that have not been seen before
+
+    Only the digest of each line is kept in memory.
+    """
+    seen = set()
+    for line in fh:
+        line = normalise_line(line)
+        if not line:
+            continue
+        digest = hashlib.md5(line.encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        yield line
+
+
+def load_md5_filter(af_uniprot_md5_path, *, bloom_error_rate=None):
+    md5s = (
+        md5
+        for _af_id, _uniprot_id, md5 in Md5AfUniprotLookup.yield_rows(
+            af_uniprot_md5_path
+        )
+    )
+    if bloom_error_rate:
+        capacity = count_lines(af_uniprot_md5_path)
+        LOG.info(
+            f"Loading MD5s into Bloom filter (capacity={capacity}, "
+            f"error_rate={bloom_error_rate}) ..."
+        )
+        md5_filter = Md5BloomFilter(capacity, error_rate=bloom_error_rate)
+        md5_filter.add_many(md5s)
+        LOG.info(f"  ... Bloom filter uses {md5_filter.bits.nbytes} bytes")
+    else:
+        LOG.info("Loading MD5s into set ...")
+        md5_filter = set(md5s)
+        LOG.info(f"  ... loaded {len(md5_filter)} unique MD5s")
+    return md5_filter
+
+
+@click.command()
+@click.option(
+    "--af_uniprot_md5",
+    "af_uniprot_md5_path",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+    help="Input: CSV file containing AF chain ID, UniProt IDs, MD5 (e.g. from create-md5)",
+)
+@click.option(
+    "--crh",
+    "crh_file",
+    type=click.File("rt"),
+    required=True,
+    help="Input: CRH file containing matches",
+)
+@click.option(
+    "--crh_format",
+    type=click.Choice(list(CRH_FORMATS.keys())),
+    default="gene3d",
+    show_default=True,
+    help="Option: format of the CRH file",
+)
+@click.option(
+    "--af_domain_list",
+    "af_domain_list_file",
+    type=click.File("rt"),
+    required=False,
+    help="Input: list of AF domain ids to filter",
+)
+@click.option(
+    "--crh_out",
+    "crh_out_file",
+    type=click.File("wt"),
+    required=True,
+    help="Output: CRH file containing unique matches with an available MD5",
+)
+@click.option(
+    "--af_uniprot_md5_out",
+    "af_uniprot_md5_out_file",
+    type=click.File("wt"),
+    required=False,
+    help="Output: AF chain ID, UniProt IDs, MD5 rows for MD5s in the filtered CRH",
+)
+@click.option(
+    "--af_domain_list_out",
+    "af_domain_list_out_file",
+    type=click.File("wt"),
+    required=False,
+    help="Output: list of AF domain ids from chains with MD5s in the filtered CRH",
+)
+@click.option(
+    "--bloom_error_rate",
+    type=float,
+    default=None,
+    help="Option: load the MD5s into a Bloom filter with this false positive rate "
+    "(e.g. 1e-4) rather than a set, to reduce memory for very large MD5 files",
+)
+def filter_crh_by_md5(
+    af_uniprot_md5_path,
+    crh_file,
+    crh_format,
+    af_domain_list_file,
+    crh_out_file,
+    af_uniprot_md5_out_file,
+    af_domain_list_out_file,
+    bloom_error_rate,
+):
+    "Filter CRH (and domain list) to the sequence MD5s available in AF"
+
+    if bool(af_domain_list_file) != bool(af_domain_list_out_file):
+        msg = "--af_domain_list and --af_domain_list_out must be used together"
+        raise click.UsageError(msg)
+
+    md5_filter = load_md5_filter(af_uniprot_md5_path, bloom_error_rate=bloom_error_rate)
+
+    delimiter, md5_column = CRH_FORMATS[crh_format]
+    crh_md5s = set()
+    crh_in_count = crh_out_count = 0
+    LOG.info(f"Filtering CRH {crh_file.name} ...")
+    for line in yield_unique_lines(crh_file):
+        crh_in_count += 1
+        try:
+            md5 = line.split(delimiter, md5_column + 1)[md5_column].strip('"')
+        except IndexError:
+            raise ParseError(f"failed to find MD5 in CRH line '{line}'")
+        if md5 not in md5_filter:
+            continue
+        crh_md5s.add(md5)
+        crh_out_file.write(line + "\n")
+        crh_out_count += 1
+    LOG.info(
+        f"  ... wrote {crh_out_count} / {crh_in_count} unique CRH rows "
+        f"({len(crh_md5s)} MD5s)"
+    )
+
+    if not af_uniprot_md5_out_file and not af_domain_list_out_file:
+        click.echo("DONE")
+        return
+
+    af_chain_stems = set()
+    md5_writer = None
+    if af_uniprot_md5_out_file:
+        md5_writer = get_af_uniprot_md5_summary_writer(af_uniprot_md5_out_file)
+    seen_rows = set()
+    for af_id, uniprot_id, md5 in Md5AfUniprotLookup.yield_rows(af_uniprot_md5_path):
+        if md5 not in crh_md5s or (af_id, md5) in seen_rows:
+            continue
+        seen_rows.add((af_id, md5))
+        af_chain_stems.add(af_chain_stem(af_id))
+        if md5_writer:
+            md5_writer.writerow(
+                {"af_chain_id": af_id, "uniprot_id": uniprot_id, "sequence_md5": md5}
+            )
+    LOG.info(f"  ... found {len(seen_rows)} AF chains with MD5s in filtered CRH")
+
+    if af_domain_list_out_file:
+        domain_count = 0
+        af_domain_list_out_file.write("af_domain_id\n")
+        for af_domain_id in yield_unique_lines(af_domain_list_file):
+            af_domain_id = af_domain_id.split()[0]
+            if af_domain_id == "af_domain_id":
+                continue
+            match = RE_AF_DOMAIN_ID.match(af_domain_id)
+            if not match:
+                raise ParseError(f"failed to parse AF domain id '{af_domain_id}'")
+            if af_chain_stem(match.group("raw_id")) not in af_chain_stems:
+                continue
+            af_domain_list_out_file.write(af_domain_id + "\n")
+            domain_count += 1
+        LOG.info(f"  ... wrote {domain_count} AF domain ids")
+
+    click.echo("DONE")
@@ -1,45 +1,115 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+import collections
+import copy
+import functools
+import glob
 import gzip
+import itertools
 import logging
 import io
 import tarfile
+import queue
 import re
-from typing import Collection, Dict, List, Optional
+import threading
+import time
+import zlib
+from typing import Collection, Dict, Iterable, List, Optional, Set
 from urllib.parse import quote
 from pathlib import Path
 
 import click
+import gridfs
 import pymongo
 import pydantic
-from pymongo import UpdateOne
-from Bio.PDB.MMCIF2Dict import MMCIF2Dict
-
+from pymongo import IndexModel, UpdateOne
+from cath_alphaflow.cif_utils import read_cif_categories
 from cath_alphaflow.settings import get_default_settings
-from cath_alphaflow.models.mongo import AFFile, AFFileType
+from cath_alphaflow.models.mongo import AFFile, AFFileType, PyObjectId
 from cath_alphaflow.models import beacons
 from cath_alphaflow.errors import ParseError
 from pydantic import ConfigDict
 
 LOG = logging.getLogger(__name__)
 
-MONGO_INDEXES = ("dataset", "fileType", "afVersion", "uniprotAccession")
+# used by the upserts while loading (so it is created before loading)
+MONGO_LOAD_INDEX = IndexModel(
+    [("dataset", pymongo.ASCENDING), ("fileName", pymongo.ASCENDING)],
+    name="dataset_fileName",
+    unique=True,
+)
+# secondary indexes (built after loading)
+MONGO_INDEXES = (
+    IndexModel(
+        [("uniprotAccession", pymongo.ASCENDING), ("afVersion", pymongo.ASCENDING)],
+        name="uniprotAccession_afVersion",
+    ),
+)
 
 AF_CIF_FILE_RE = re.compile(
     "AF-(?P<up_accession>[0-9A-Z]+)-F(?P<frag_num>[0-9]+)-model_v(?P<af_version>[0-9]+)(?P<cif_suffix>\.cif\.gz)"
 )
 
 DEFAULT_BATCH_SIZE = 50
+DEFAULT_QUEUE_SIZE = 4
+DEFAULT_ARCHIVE_JOBS = 1
+QUEUE_POLL_SECONDS = 0.1
+
+# marks the end of the batches in the pipeline queues
+QUEUE_DONE = None
+
+# how to store the model file contents
+CONTENTS_MODE_TEXT = "text"  # decompressed text in `contents`
+CONTENTS_MODE_GZIP = "gzip"  # gzip bytes in `contents` (GridFS if too large)
+CONTENTS_MODE_GRIDFS = "gridfs"  # gzip bytes in GridFS (`contentsFileId`)
+CONTENTS_MODES = (CONTENTS_MODE_TEXT, CONTENTS_MODE_GZIP, CONTENTS_MODE_GRIDFS)
+CONTENTS_ENCODING_GZIP = "gzip"
+AF_CONTENTS_BUCKET = "afContents"
+# records the archives that have been loaded completely
+AF_LOAD_LEDGER_COLLECTION = "afLoadLedger"
+
+# larger contents are stored in GridFS (Mongo documents are limited to 16MB)
+MAX_INLINE_CONTENTS_BYTES = 8 * 1024 * 1024
+
+# document fields that are not used by each contents mode (removed on update)
+UNUSED_CONTENTS_FIELDS = {
+    CONTENTS_MODE_TEXT: ("contentsEncoding", "contentsFileId"),
+    CONTENTS_MODE_GZIP: ("contentsFileId",),
+    CONTENTS_MODE_GRIDFS: ("contents",),
+}
 PROVIDER_ALPHAFOLD = "AlphaFold DB"
 MODEL_URL_STEM = "https://alphafold.ebi.ac.uk/files"
 MODEL_PAGE_URL_STEM = "https://alphafold.ebi.ac.uk/entry"
 
+# mmCIF categories needed for the 3D-Beacons summary
+BEACONS_CIF_CATEGORIES = (
+    "_entity",
+    "_ma_qa_metric_global",
+    "_ma_target_ref_db_details",
+    "_pdbx_database_status",
+)
+
 
 @click.command("load-mongo-archive")
 @click.option(
     "-i",
     "--archive-path",
-    help="Path to archive tar file.",
-    required=True,
+    "archive_patterns",
+    help="Path to archive tar file (or a glob of archive files, can be repeated).",
+    multiple=True,
+)
+@click.option(
+    "--archive-list",
+    help="File listing the paths of the archive tar files (one per line).",
+    type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="Number of archives to load concurrently (sharing the --workers processes) "
+    f"[default: {DEFAULT_ARCHIVE_JOBS}]",
+    default=DEFAULT_ARCHIVE_JOBS,
+    type=click.IntRange(min=1),
 )
 @click.option(
     "-h",
@@ -60,18 +130,63 @@ MODEL_PAGE_URL_STEM = "https://alphafold.ebi.ac.uk/entry"
     default=DEFAULT_BATCH_SIZE,
     type=int,
 )
+@click.option(
+    "-w",
+    "--workers",
+    help="Number of processes used to parse the model files, with separate threads "
+    "for reading the archive and writing to Mongo (0: load serially) [default: 0]",
+    default=0,
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--queue-size",
+    help="Maximum number of batches waiting between the pipeline stages "
+    f"[default: {DEFAULT_QUEUE_SIZE}]",
+    default=DEFAULT_QUEUE_SIZE,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--contents-mode",
+    help="How to store the model file contents: 'text' (decompressed), 'gzip' "
+    "(compressed bytes, or GridFS for large files) or 'gridfs' (compressed bytes "
+    f"in GridFS) [default: {CONTENTS_MODE_TEXT}]",
+    default=CONTENTS_MODE_TEXT,
+    type=click.Choice(CONTENTS_MODES),
+)
+@click.option(
+    "--validate-every",
+    help="Check 1 in N documents against the pydantic models (0: no validation) "
+    "[default: 0]",
+    default=0,
+    type=click.IntRange(min=0),
+)
+@click.option(
+    "--defer-indexes/--keep-indexes",
+    help="Drop the secondary indexes managed by the loader before loading and build "
+    "them after loading (rather than updating them for every document). Do not use "
+    "this if other loaders are writing to the same collection [default: keep]",
+    default=False,
+)
 @click.option(
     "--force-overwrite",
     is_flag=True,
-    help="Whether or not to overwrite an existing file MongoDB [default: False]",
+    help="Whether or not to overwrite an existing file MongoDB (also reloads archives "
+    "recorded as loaded) [default: False]",
     default=False,
     type=bool,
 )
 def load_af_from_archive(
     mongo_db_url: str,
-    archive_path: str,
+    archive_patterns: List[str],
+    archive_list: Optional[str],
+    jobs: int,
     dataset: str,
     batch_size: int,
+    workers: int,
+    queue_size: int,
+    contents_mode: str,
+    validate_every: int,
+    defer_indexes: bool,
     force_overwrite: bool,
 ):  # pragma: no cover
 
@@ -84,33 +199,158 @@ def load_af_from_archive(
             f"@{settings.MONGO_HOST}"
         )
 
+    archive_paths = expand_archive_paths(archive_patterns, archive_list)
+
     run(
-        archive_path=archive_path,
+        archive_paths=archive_paths,
         mongo_db_url=mongo_db_url,
         dataset=dataset,
         batch_size=batch_size,
         force_overwrite=force_overwrite,
+        workers=workers,
+        queue_size=queue_size,
+        contents_mode=contents_mode,
+        validate_every=validate_every,
+        jobs=jobs,
+        defer_indexes=defer_indexes,
     )
 
 
+def expand_archive_paths(
+    archive_patterns: Iterable[str], archive_list: Optional[str] = None
+) -> List[str]:
+    """
+    Returns the archive paths from paths / globs and an optional list of archives
+    """
+    archive_paths = []
+    for pattern in archive_patterns:
+        if glob.has_magic(pattern):
+            matched_paths = sorted(glob.glob(pattern))
+            if not matched_paths:
+                raise click.UsageError(f"no archive files match '{pattern}'")
+            archive_paths.extend(matched_paths)
+        else:
+            archive_paths.append(pattern)
+    if archive_list:
+        with open(archive_list, "rt") as fh:
+            for line in fh:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    archive_paths.append(line)
+    if not archive_paths:
+        raise click.UsageError("expected --archive-path or --archive-list")
+    # remove duplicates (keeping the order)
+    return list(dict.fromkeys(archive_paths))
+
+
+@functools.lru_cache(maxsize=None)
+def get_mongo_client(mongo_db_url: str) -> pymongo.MongoClient:
+    """
+    Returns a client for the given url (shared by all loads in this process)
+
+    Clients hold a connection pool, so reusing them keeps connections open between
+    tasks run by a long-lived worker (see `cath-af-cli serve`).
+    """
+    return pymongo.MongoClient(mongo_db_url)
+
+
 class MongoLoad:
 
     data: List[Dict]
     collection: Collection
 
-    def __init__(self) -> None:
+    def __init__(
+        self, contents_mode: str = CONTENTS_MODE_TEXT, *, force_overwrite: bool = False
+    ) -> None:
         self.data = []
-        self.key_fields = list((x, "text") for x in MONGO_INDEXES)
+        self.contents_mode = contents_mode
+        # only a reload can replace documents that have contents in GridFS
+        self.force_overwrite = force_overwrite
+        self.contents_bucket = None
+        self.ledger_collection = None
 
     def init_collection(self, mongo_db_url):
-        self.collection = pymongo.MongoClient(mongo_db_url).models.afCollection
+        database = get_mongo_client(mongo_db_url).models
+        self.collection = database.afCollection
+        self.ledger_collection = database[AF_LOAD_LEDGER_COLLECTION]
+        # also needed in text mode (to remove contents left by a previous load when
+        # reloading)
+        self.contents_bucket = gridfs.GridFSBucket(
+            database, bucket_name=AF_CONTENTS_BUCKET
+        )
 
-    def load(self):
-        self.collection.bulk_write(self.data)
+    def store_contents(self, file_id: str, filename: str, data: bytes):
+        """
+        Stores file contents in GridFS (replacing any previous version)
+        """
+        try:
+            self.contents_bucket.delete(file_id)
+        except gridfs.errors.NoFile:
+            pass
+        self.contents_bucket.upload_from_stream_with_id(file_id, filename, data)
+
+    def delete_contents(self, file_ids: List[str]):
+        """
+        Deletes the file contents stored in GridFS for these ids (if any)
+
+        This is used when files are reloaded with inline contents, so the contents
+        from a previous load are not left in GridFS (a fresh load skips the files that
+        are already loaded, so it has nothing to delete).
+        """
+        if not file_ids:
+            return
+        for grid_out in self.contents_bucket.find({"_id": {"$in": file_ids}}):
+            self.contents_bucket.delete(grid_out._id)
+
+    def new_loader(self) -> "MongoLoad":
+        """
+        Returns a loader that shares this connection (with its own pending writes)
+        """
+        loader = copy.copy(self)
+        loader.data = []
+        return loader
 
-    def create_index(self):
-        LOG.info("Creating index")
-        self.collection.create_index(self.key_fields)
+    def load(self):
+        if not self.data:
+            return
+        self.collection.bulk_write(self.data, ordered=False)
+
+    def existing_filenames(self, dataset: str, filenames: Iterable[str]) -> Set[str]:
+        """
+        Returns the file names that are already loaded for this dataset (in one query)
+        """
+        cursor = self.collection.find(
+            {"dataset": dataset, "fileName": {"$in": list(filenames)}},
+            {"fileName": 1, "_id": 0},
+        )
+        return {doc["fileName"] for doc in cursor}
+
+    def create_load_index(self):
+        """
+        Creates the unique index used to find the documents to update while loading
+        """
+        self.collection.create_indexes([MONGO_LOAD_INDEX])
+
+    def drop_secondary_indexes(self):
+        """
+        Drops the secondary indexes managed by the loader (`MONGO_INDEXES`)
+
+        Other indexes on the collection (e.g. created by the API) are not touched,
+        since only `MONGO_INDEXES` are built again after loading.
+        """
+        managed_names = {index.document["name"] for index in MONGO_INDEXES}
+        for index_name in self.collection.index_information():
+            if index_name in managed_names:
+                LOG.info(f"Dropping index {index_name} while loading")
+                self.collection.drop_index(index_name)
+
+    def create_indexes(self):
+        """
+        Builds the secondary indexes (in a single pass over the collection)
+        """
+        index_names = [index.document["name"] for index in MONGO_INDEXES]
+        LOG.info(f"Creating indexes: {index_names}")
+        self.collection.create_indexes(list(MONGO_INDEXES))
 
 
 class AFArchiveFile(pydantic.BaseModel):
@@ -142,12 +382,28 @@ def yield_next_file_from_archive(archive_path) -> AFArchiveFile:
         yield AFArchiveFile(filename=tarinfo.name, tarfileobj=tarfileobj)
 
 
+def yield_batches(items: Iterable, batch_size: int) -> Iterable[List]:
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
 def make_af_file(
     *,
     tarfileobj,
     filename,
     dataset,
+    contents_mode=CONTENTS_MODE_TEXT,
 ) -> AFFile:
+    """
+    Returns the AFFile for a gzipped model file
+
+    The decompressed contents are only included for the 'text' contents mode (otherwise
+    only the header of the file is decompressed to read the metadata).
+    """
 
     cif_file_match = AF_CIF_FILE_RE.match(filename)
     if not cif_file_match:
@@ -155,8 +411,10 @@ def make_af_file(
         raise ParseError(msg)
 
     gzip_file = gzip.GzipFile(fileobj=tarfileobj)
-    file_contents = gzip_file.read()
-    gzip_file.seek(0)
+    file_contents = None
+    if contents_mode == CONTENTS_MODE_TEXT:
+        file_contents = gzip_file.read()
+        gzip_file.seek(0)
 
     text_fh = io.TextIOWrapper(gzip_file)
     try:
@@ -184,15 +442,30 @@ def make_af_file(
     return af_file
 
 
-def get_beacons_uniprot_summary_from_af_cif(
-    cif_fh: io.TextIOWrapper,
-    filename: str,
-) -> beacons.UniprotSummary:
+def read_af_file_contents(af_file_doc: Dict, *, database=None) -> str:
     """
-    Returns the 3D-Beacons compliant UniprotSummary object from AlphaFold CIF file
+    Returns the model file contents as text from a document in the AF collection
 
-    Note: this function relies on metadata and that should be present in all v4 AF files,
-    however they may not be present in files that have been processed.
+    Handles all the contents modes (the Mongo `database` is needed to read contents
+    stored in GridFS).
+    """
+    if af_file_doc.get("contentsFileId") is not None:
+        if database is None:
+            raise ValueError("database is required to read contents from GridFS")
+        bucket = gridfs.GridFSBucket(database, bucket_name=AF_CONTENTS_BUCKET)
+        data = bucket.open_download_stream(af_file_doc["contentsFileId"]).read()
+    else:
+        data = af_file_doc["contents"]
+    if af_file_doc.get("contentsEncoding") == CONTENTS_ENCODING_GZIP:
+        data = gzip.decompress(data)
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return data
+
+
+def read_beacons_metadata_from_af_cif(cif_fh: io.TextIOWrapper, filename: str) -> Dict:
+    """
+    Returns the metadata needed for the 3D-Beacons summary from an AlphaFold CIF file
     """
 
     cif_file_match = AF_CIF_FILE_RE.match(filename)
@@ -206,7 +479,7 @@ def get_beacons_uniprot_summary_from_af_cif(
 
     unp_accession = cif_file_match.group("up_accession")
 
-    cif_dict = MMCIF2Dict(cif_fh)
+    cif_dict = read_cif_categories(cif_fh, BEACONS_CIF_CATEGORIES)
 
     # db_accession                 P00520
     # db_code                      ABL1_MOUSE
@@ -228,18 +501,44 @@ def get_beacons_uniprot_summary_from_af_cif(
     unp_id = cif_dict["_ma_target_ref_db_details.db_code"][0]
     unp_checksum = cif_dict["_ma_target_ref_db_details.seq_db_sequence_checksum"][0]
 
-    # not part of 3D Beacons, but might be useful...
-    taxon_id = cif_dict["_ma_target_ref_db_details.ncbi_taxonomy_id"][0]
-    organism = cif_dict["_ma_target_ref_db_details.organism_scientific"][0]
-
     pdbx_description = cif_dict["_entity.pdbx_description"][0]
     entry_date = cif_dict["_pdbx_database_status.recvd_initial_deposition_date"][0]
 
+    return {
+        "af_id": af_id,
+        "unp_accession": unp_accession,
+        "unp_id": unp_id,
+        "unp_checksum": unp_checksum,
+        "unp_start": unp_start,
+        "unp_end": unp_end,
+        "global_plddt_score": global_plddt_score,
+        "pdbx_description": pdbx_description,
+        "entry_date": entry_date,
+    }
+
+
+def get_beacons_uniprot_summary_from_af_cif(
+    cif_fh: io.TextIOWrapper,
+    filename: str,
+) -> beacons.UniprotSummary:
+    """
+    Returns the 3D-Beacons compliant UniprotSummary object from AlphaFold CIF file
+
+    Note: this function relies on metadata and that should be present in all v4 AF files,
+    however they may not be present in files that have been processed.
+    """
+
+    metadata = read_beacons_metadata_from_af_cif(cif_fh, filename)
+    af_id = metadata["af_id"]
+    unp_accession = metadata["unp_accession"]
+    unp_start = metadata["unp_start"]
+    unp_end = metadata["unp_end"]
+
     beacons_summary = beacons.UniprotSummary(
         uniprot_entry=beacons.UniprotEntry(
             ac=unp_accession,
-            id=unp_id,
-            uniprot_checksum=unp_checksum,
+            id=metadata["unp_id"],
+            uniprot_checksum=metadata["unp_checksum"],
             sequence_length=(unp_end - unp_start + 1),
             segment_start=unp_start,
             segment_end=unp_end,
@@ -257,7 +556,7 @@ def get_beacons_uniprot_summary_from_af_cif(
                     # number_of_conformers=None,
                     # ensemble_sample_url=None,
                     # ensemble_sample_format=None,
-                    created=entry_date,
+                    created=metadata["entry_date"],
                     sequence_identity=100,
                     uniprot_start=unp_start,
                     uniprot_end=unp_end,
@@ -266,14 +565,14 @@ def get_beacons_uniprot_summary_from_af_cif(
                     # resolution=None,
                     confidence_type=beacons.ConfidenceType.pLDDT,
                     # confidence_version=None,
-                    confidence_avg_local_score=global_plddt_score,
+                    confidence_avg_local_score=metadata["global_plddt_score"],
                     entities=[
                         beacons.Entity(
                             entity_type=beacons.EntityType.POLYMER,
                             entity_poly_type=beacons.EntityPolyType.POLYPEPTIDE_L_,
                             identifier=unp_accession,
                             identifier_category=beacons.IdentifierCategory.UNIPROT,
-                            description=pdbx_description,
+                            description=metadata["pdbx_description"],
                             chain_ids=["A"],
                         )
                     ],
@@ -284,72 +583,592 @@ def get_beacons_uniprot_summary_from_af_cif(
     return beacons_summary
 
 
-def run(
+def make_beacons_uniprot_summary_dict(metadata: Dict) -> Dict:
+    """
+    Returns `get_beacons_uniprot_summary_from_af_cif(...).dict()` without the models
+
+    Builds the dict directly (in model field order, with the same values and types) to
+    avoid creating and validating the nested pydantic models for every file.
+    """
+    af_id = metadata["af_id"]
+    unp_accession = metadata["unp_accession"]
+    unp_start = metadata["unp_start"]
+    unp_end = metadata["unp_end"]
+    return {
+        "uniprot_entry": {
+            "ac": unp_accession,
+            "id": metadata["unp_id"],
+            "uniprot_checksum": metadata["unp_checksum"],
+            "sequence_length": unp_end - unp_start + 1,
+            "segment_start": unp_start,
+            "segment_end": unp_end,
+        },
+        "structures": [
+            {
+                "summary": {
+                    "model_identifier": af_id,
+                    "model_category": beacons.ModelCategory.AB_INITIO.value,
+                    "model_url": f"{MODEL_URL_STEM}/{af_id}.cif",
+                    "model_format": beacons.ModelFormat.MMCIF.value,
+                    "model_type": beacons.ModelType.ATOMIC.value,
+                    "model_page_url": f"{MODEL_PAGE_URL_STEM}/{af_id}",
+                    "provider": PROVIDER_ALPHAFOLD,
+                    "number_of_conformers": None,
+                    "ensemble_sample_url": None,
+                    "ensemble_sample_format": None,
+                    "created": metadata["entry_date"],
+                    "sequence_identity": 100.0,
+                    "uniprot_start": unp_start,
+                    "uniprot_end": unp_end,
+                    "coverage": 100.0,
+                    "experimental_method": (
+                        beacons.ExperimentalMethod.THEORETICAL_MODEL.value
+                    ),
+                    "resolution": None,
+                    "confidence_type": beacons.ConfidenceType.pLDDT.value,
+                    "confidence_version": None,
+                    "confidence_avg_local_score": metadata["global_plddt_score"],
+                    "oligomeric_state": None,
+                    "preferred_assembly_id": None,
+                    "entities": [
+                        {
+                            "entity_type": beacons.EntityType.POLYMER.value,
+                            "entity_poly_type": (
+                                beacons.EntityPolyType.POLYPEPTIDE_L_.value
+                            ),
+                            "identifier": unp_accession,
+                            "identifier_category": (
+                                beacons.IdentifierCategory.UNIPROT.value
+                            ),
+                            "description": metadata["pdbx_description"],
+                            "chain_ids": ["A"],
+                        }
+                    ],
+                }
+            }
+        ],
+    }
+
+
+def make_af_document(
     *,
-    archive_path: str,
+    gzip_bytes: bytes,
+    filename: str,
     dataset: str,
-    mongo_db_url: str,
-    batch_size: int,
-    force_overwrite: bool = False,
+    contents_mode: str = CONTENTS_MODE_TEXT,
+) -> Dict:
+    """
+    Returns `make_af_file(...).dict()` for a gzipped model file without the models
+    """
+
+    cif_file_match = AF_CIF_FILE_RE.match(filename)
+    if not cif_file_match:
+        msg = f"archive entry '{filename}' does not match expected file name"
+        raise ParseError(msg)
+
+    gzip_file = gzip.GzipFile(fileobj=io.BytesIO(gzip_bytes))
+    file_contents = None
+    if contents_mode == CONTENTS_MODE_TEXT:
+        file_contents = gzip_file.read().decode("utf-8")
+        gzip_file.seek(0)
+
+    text_fh = io.TextIOWrapper(gzip_file)
+    try:
+        metadata = read_beacons_metadata_from_af_cif(text_fh, filename=filename)
+    except Exception as err:
+        msg = f"failed to parse UniprotSummary from {filename}: {err}"
+        LOG.error(msg)
+        raise
+
+    return {
+        "id": PyObjectId(),
+        "dataset": dataset,
+        "fileType": AFFileType.MODEL_CIF.value,
+        "fileName": filename,
+        "afVersion": int(cif_file_match.group("af_version")),
+        "fragNum": int(cif_file_match.group("frag_num")),
+        "uniprotAccession": cif_file_match.group("up_accession"),
+        "contents": file_contents,
+        "uniprot_summary": make_beacons_uniprot_summary_dict(metadata),
+    }
+
+
+def validate_af_document(
+    af_file_dict: Dict,
+    *,
+    gzip_bytes: bytes,
+    filename: str,
+    dataset: str,
+    contents_mode: str = CONTENTS_MODE_TEXT,
 ):
-    """Load AlphaFold tar archive model files into MONGO
+    """
+    Checks a document from `make_af_document` against the pydantic models
+    """
+    af_file = make_af_file(
+        tarfileobj=io.BytesIO(gzip_bytes),
+        filename=filename,
+        dataset=dataset,
+        contents_mode=contents_mode,
+    )
+    expected_dict = {**af_file.dict(), "id": af_file_dict["id"]}
+    if af_file_dict != expected_dict:
+        mismatched = [
+            key for key in expected_dict if af_file_dict.get(key) != expected_dict[key]
+        ]
+        msg = f"document for {filename} does not match the AFFile model ({mismatched})"
+        raise ParseError(msg)
 
-    Args:
-        archive_path (str): Path to the tar archive file
-        mongo_db_url (str): Mongo DB URL
-        dataset (str): Name to associate with these files
-        batch_size (int): Number of documents to batch in a single commit
-        force_overwrite (bool): Whether to overwrite existing documents
 
+def is_validation_sample(filename: str, validate_every: int) -> bool:
+    "Deterministic 1 in `validate_every` sample of files (independent of batching)"
+    return bool(validate_every) and zlib.crc32(filename.encode()) % validate_every == 0
+
+
+class LoadProgress:
+    """
+    Counts the documents loaded (and skipped) and reports the load rate
     """
 
-    lm = MongoLoad()
+    def __init__(self, name: str = None):
+        self.name = name
+        self.start_time = time.perf_counter()
+        self.loaded = 0
+        self.skipped = 0
+
+    @property
+    def members(self) -> int:
+        return self.loaded + self.skipped
+
+    def log(self):
+        elapsed = time.perf_counter() - self.start_time
+        rate = self.loaded / elapsed if elapsed else 0
+        prefix = f"{self.name}: " if self.name else ""
+        LOG.info(
+            f"{prefix}Loading done: {self.loaded} documents, {self.skipped} skipped "
+            f"({rate:.1f} documents/sec)"
+        )
 
-    LOG.info(f"Initiating Mongo collection {mongo_db_url}")
-    lm.init_collection(mongo_db_url)
 
-    LOG.info(f"Loading all model files from {archive_path}")
-    for af_archive_file in yield_next_file_from_archive(archive_path=archive_path):
+class ArchiveLedger:
+    """
+    Records the archives that have been loaded completely (with their member counts)
 
-        af_filename = af_archive_file.filename
-        af_tarfileobj = af_archive_file.tarfileobj
+    Archives are identified by their resolved path and size, so a restart can skip the
+    archives that are already loaded without checking each of their files.
+    """
 
-        total = incr = 0
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def archive_key(archive_path: str) -> str:
+        return str(Path(archive_path).resolve())
+
+    def loaded_archives(self, dataset: str, archive_paths: Iterable[str]) -> Set[str]:
+        """
+        Returns the archive paths that are recorded as loaded (in one query)
+        """
+        paths_by_key = {self.archive_key(path): path for path in archive_paths}
+        cursor = self.collection.find(
+            {"dataset": dataset, "archivePath": {"$in": list(paths_by_key)}},
+            {"archivePath": 1, "archiveSize": 1, "_id": 0},
+        )
+        loaded_paths = set()
+        for doc in cursor:
+            archive_path = paths_by_key[doc["archivePath"]]
+            if doc["archiveSize"] == Path(archive_path).stat().st_size:
+                loaded_paths.add(archive_path)
+        return loaded_paths
+
+    def record(self, dataset: str, archive_path: str, progress: LoadProgress):
+        archive_key = self.archive_key(archive_path)
+        self.collection.update_one(
+            {"dataset": dataset, "archivePath": archive_key},
+            {
+                "$set": {
+                    "archiveSize": Path(archive_path).stat().st_size,
+                    "members": progress.members,
+                    "loaded": progress.loaded,
+                    "skipped": progress.skipped,
+                    "completed": datetime.now(),
+                }
+            },
+            upsert=True,
+        )
 
-        unique_criteria = {"dataset": dataset, "fileName": af_filename}
 
+def yield_archive_batches(
+    lm: MongoLoad,
+    archive_path: str,
+    *,
+    dataset: str,
+    batch_size: int,
+    force_overwrite: bool,
+    progress: LoadProgress,
+):
+    """
+    Yields batches of `(filename, gzip_bytes)` for the archive files that need loading
+    """
+    for af_archive_files in yield_batches(
+        yield_next_file_from_archive(archive_path=archive_path), batch_size
+    ):
+        existing_filenames = set()
         if not force_overwrite:
-            if lm.collection.find_one(unique_criteria):
-                LOG.info(f"Skipping {af_filename} as it already exists")
+            existing_filenames = lm.existing_filenames(
+                dataset, [af_file.filename for af_file in af_archive_files]
+            )
+
+        batch = []
+        for af_archive_file in af_archive_files:
+            if af_archive_file.filename in existing_filenames:
+                LOG.debug(f"Skipping {af_archive_file.filename} as it already exists")
+                progress.skipped += 1
                 continue
+            batch.append((af_archive_file.filename, af_archive_file.tarfileobj.read()))
+        if batch:
+            yield batch
 
-        af_file = make_af_file(
-            tarfileobj=af_tarfileobj, filename=af_filename, dataset=dataset
-        )
 
-        af_file_dict = af_file.dict()
+def make_af_documents(
+    batch,
+    dataset: str,
+    contents_mode: str = CONTENTS_MODE_TEXT,
+    validate_every: int = 0,
+) -> List[Dict]:
+    """
+    Returns the Mongo documents for a batch of `(filename, gzip_bytes)` archive files
+
+    This is run in the worker processes when loading in parallel. For the compressed
+    contents modes, `contents` holds the gzip bytes (moved to GridFS by the writer).
+    If `validate_every` is set, 1 in `validate_every` documents are checked against
+    the pydantic models.
+    """
+    af_file_dicts = []
+    for af_filename, gzip_bytes in batch:
+        af_file_dict = make_af_document(
+            gzip_bytes=gzip_bytes,
+            filename=af_filename,
+            dataset=dataset,
+            contents_mode=contents_mode,
+        )
+        if is_validation_sample(af_filename, validate_every):
+            validate_af_document(
+                af_file_dict,
+                gzip_bytes=gzip_bytes,
+                filename=af_filename,
+                dataset=dataset,
+                contents_mode=contents_mode,
+            )
+        LOG.debug(f"Adding AF Model: {af_filename}")
+        if contents_mode != CONTENTS_MODE_TEXT:
+            af_file_dict["contents"] = gzip_bytes
+            af_file_dict["contentsEncoding"] = CONTENTS_ENCODING_GZIP
+        af_file_dicts.append(af_file_dict)
+    return af_file_dicts
 
-        LOG.info(f"Adding AF Model: {af_file}")
 
+def write_af_documents(
+    lm: MongoLoad, af_file_dicts: List[Dict], progress: LoadProgress
+):
+    # when reloading, contents stored inline replace any contents from a previous
+    # load in GridFS
+    inline_file_ids = []
+    for af_file_dict in af_file_dicts:
+        unique_criteria = {
+            "dataset": af_file_dict["dataset"],
+            "fileName": af_file_dict["fileName"],
+        }
+        file_id = f"{af_file_dict['dataset']}/{af_file_dict['fileName']}"
+        contents_mode = lm.contents_mode
+        if contents_mode != CONTENTS_MODE_TEXT and (
+            contents_mode == CONTENTS_MODE_GRIDFS
+            or len(af_file_dict["contents"]) > MAX_INLINE_CONTENTS_BYTES
+        ):
+            contents_mode = CONTENTS_MODE_GRIDFS
+            lm.store_contents(
+                file_id, af_file_dict["fileName"], af_file_dict.pop("contents")
+            )
+            af_file_dict["contentsFileId"] = file_id
+        elif lm.force_overwrite:
+            inline_file_ids.append(file_id)
         lm.data.append(
             UpdateOne(
                 unique_criteria,
-                {"$set": af_file_dict},
+                {
+                    "$set": af_file_dict,
+                    "$unset": {
+                        field: "" for field in UNUSED_CONTENTS_FIELDS[contents_mode]
+                    },
+                },
                 upsert=True,
             )
         )
-        incr += 1
-        if incr == batch_size:
-            total += incr
-            incr = 0
-            lm.load()
-            lm.data.clear()
-            LOG.info(f"Loading done: {incr} documents")
-
-    if lm.data:
-        lm.load()
-        LOG.info(f"Loading done: {incr} documents")
-
-    # lm.create_index()
+    lm.load()
+    # (after the documents no longer refer to the old contents)
+    lm.delete_contents(inline_file_ids)
+    progress.loaded += len(lm.data)
+    lm.data.clear()
+    progress.log()
+
+
+def _put_until_stopped(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=QUEUE_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def run_pipeline(
+    lm: MongoLoad,
+    batches: Iterable,
+    *,
+    dataset: str,
+    contents_mode: str,
+    validate_every: int,
+    workers: int,
+    queue_size: int,
+    progress: LoadProgress,
+    executor: ProcessPoolExecutor = None,
+):
+    """
+    Loads the batches using a reader thread, worker processes and a writer thread
+
+    The reader thread streams batches from the archive, the worker processes decompress
+    and parse the files into documents, and the writer thread sends the bulk writes to
+    Mongo. The stages are connected by bounded queues (and a bounded number of batches
+    in the worker pool) so memory use does not depend on the size of the archive.
+
+    The worker processes can be shared with other pipelines by passing `executor`.
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return run_pipeline(
+                lm,
+                batches,
+                dataset=dataset,
+                contents_mode=contents_mode,
+                validate_every=validate_every,
+                workers=workers,
+                queue_size=queue_size,
+                progress=progress,
+                executor=executor,
+            )
+
+    read_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def read_batches():
+        try:
+            for batch in batches:
+                if not _put_until_stopped(read_queue, batch, stop):
+                    return
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            _put_until_stopped(read_queue, QUEUE_DONE, stop)
+
+    def write_batches():
+        while True:
+            af_file_dicts = write_queue.get()
+            if af_file_dicts is QUEUE_DONE:
+                return
+            if errors:
+                # keep draining the queue so the main thread does not block
+                continue
+            try:
+                write_af_documents(lm, af_file_dicts, progress)
+            except BaseException as err:
+                errors.append(err)
+
+    reader = threading.Thread(target=read_batches, name="archive-reader", daemon=True)
+    writer = threading.Thread(target=write_batches, name="mongo-writer", daemon=True)
+    reader.start()
+    writer.start()
+
+    try:
+        pending = collections.deque()
+        while not errors:
+            batch = read_queue.get()
+            if batch is QUEUE_DONE:
+                break
+            future = executor.submit(
+                make_af_documents, batch, dataset, contents_mode, validate_every
+            )
+            pending.append(future)
+            # results are written in archive order
+            while len(pending) > workers * 2:
+                write_queue.put(pending.popleft().result())
+        while pending and not errors:
+            write_queue.put(pending.popleft().result())
+    finally:
+        stop.set()
+        write_queue.put(QUEUE_DONE)
+        writer.join()
+        reader.join()
+
+    if errors:
+        raise errors[0]
+
+
+def load_archive(
+    lm: MongoLoad,
+    archive_path: str,
+    *,
+    dataset: str,
+    batch_size: int,
+    force_overwrite: bool,
+    workers: int,
+    queue_size: int,
+    contents_mode: str,
+    validate_every: int,
+    executor: ProcessPoolExecutor = None,
+) -> LoadProgress:
+    """
+    Loads the model files from one archive (returns the counts of loaded files)
+    """
+    LOG.info(f"Loading all model files from {archive_path}")
+    progress = LoadProgress(name=Path(archive_path).name)
+    batches = yield_archive_batches(
+        lm,
+        archive_path,
+        dataset=dataset,
+        batch_size=batch_size,
+        force_overwrite=force_overwrite,
+        progress=progress,
+    )
+    if workers:
+        run_pipeline(
+            lm,
+            batches,
+            dataset=dataset,
+            contents_mode=contents_mode,
+            validate_every=validate_every,
+            workers=workers,
+            queue_size=queue_size,
+            progress=progress,
+            executor=executor,
+        )
+    else:
+        for batch in batches:
+            af_file_dicts = make_af_documents(
+                batch, dataset, contents_mode, validate_every
+            )
+            write_af_documents(lm, af_file_dicts, progress)
+    return progress
+
+
+def run(
+    *,
+    archive_paths: Iterable[str],
+    dataset: str,
+    mongo_db_url: str,
+    batch_size: int,
+    force_overwrite: bool = False,
+    workers: int = 0,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    contents_mode: str = CONTENTS_MODE_TEXT,
+    validate_every: int = 0,
+    jobs: int = DEFAULT_ARCHIVE_JOBS,
+    defer_indexes: bool = False,
+):
+    """Load AlphaFold tar archive model files into MONGO
+
+    Args:
+        archive_paths (list): Paths to the tar archive files
+        mongo_db_url (str): Mongo DB URL
+        dataset (str): Name to associate with these files
+        batch_size (int): Number of documents to batch in a single commit (and
+            to check for existing documents in a single query)
+        force_overwrite (bool): Whether to overwrite existing documents (and reload
+            archives that are recorded as loaded)
+        workers (int): Number of processes used to parse the files (0: parse the
+            files in this process, without the reader / writer threads)
+        queue_size (int): Maximum number of batches waiting between each stage
+        contents_mode (str): How to store the model file contents (see CONTENTS_MODES)
+        validate_every (int): Check 1 in N documents against the pydantic models
+            (0: no validation)
+        jobs (int): Number of archives to load concurrently (the archives share
+            the `workers` processes)
+        defer_indexes (bool): Drop the secondary indexes in MONGO_INDEXES while
+            loading (and build them after loading, even if the load fails)
+
+    """
+
+    lm = MongoLoad(contents_mode=contents_mode, force_overwrite=force_overwrite)
+
+    LOG.info(f"Initiating Mongo collection {mongo_db_url}")
+    lm.init_collection(mongo_db_url)
+    ledger = ArchiveLedger(lm.ledger_collection)
+
+    lm.create_load_index()
+    if defer_indexes:
+        lm.drop_secondary_indexes()
+
+    errors = []
+    try:
+        archive_paths = list(archive_paths)
+        if not force_overwrite:
+            loaded_archives = ledger.loaded_archives(dataset, archive_paths)
+            if loaded_archives:
+                LOG.info(
+                    f"Skipping {len(loaded_archives)} of {len(archive_paths)} archives "
+                    f"that are already loaded (see {AF_LOAD_LEDGER_COLLECTION})"
+                )
+            archive_paths = [
+                path for path in archive_paths if path not in loaded_archives
+            ]
+
+        def load_and_record(archive_path):
+            progress = load_archive(
+                lm.new_loader(),
+                archive_path,
+                dataset=dataset,
+                batch_size=batch_size,
+                force_overwrite=force_overwrite,
+                workers=workers,
+                queue_size=queue_size,
+                contents_mode=contents_mode,
+                validate_every=validate_every,
+                executor=executor,
+            )
+            ledger.record(dataset, archive_path, progress)
+            return progress
+
+        total_progress = LoadProgress()
+        executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as archive_pool:
+                futures = {
+                    archive_pool.submit(load_and_record, path): path
+                    for path in archive_paths
+                }
+                # the other archives are still loaded if an archive fails
+                for future, archive_path in futures.items():
+                    try:
+                        progress = future.result()
+                    except Exception as err:
+                        LOG.error(f"failed to load archive {archive_path}: {err}")
+                        errors.append(err)
+                        continue
+                    total_progress.loaded += progress.loaded
+                    total_progress.skipped += progress.skipped
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if len(archive_paths) > 1:
+            total_progress.log()
+    finally:
+        # the documents that were loaded are indexed even if an archive failed
+        # (or the load is interrupted)
+        lm.create_indexes()
+
+    if errors:
+        raise errors[0]
 
     return 0
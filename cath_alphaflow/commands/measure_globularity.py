@@ -15,6 +15,8 @@ from cath_alphaflow.models.domains import GeneralDomainID
 from cath_alphaflow.models.domains import ChoppingPdbResLabel
 
 from cath_alphaflow.constants import DEFAULT_GLOB_DISTANCE, DEFAULT_GLOB_VOLUME
+from cath_alphaflow.profiling import STAGE_COMPUTE, entries, timed
+from cath_alphaflow.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
 
 DEFAULT_PDB_SUFFIX = ".pdb"
 
@@ -78,6 +80,13 @@ LOG = logging.getLogger()
     default=DEFAULT_GLOB_VOLUME,
     help=f"The voxel resolution for approximating the protein volume. (default: {DEFAULT_GLOB_VOLUME})",
 )
+@click.option(
+    "--progress_interval",
+    type=float,
+    default=DEFAULT_PROGRESS_INTERVAL,
+    show_default=True,
+    help="Option: seconds between progress messages (0 to disable)",
+)
 def measure_globularity(
     consensus_domain_list,
     chainsaw_domain_list,
@@ -87,6 +96,7 @@ def measure_globularity(
     distance_cutoff,
     volume_resolution,
     chains_are_gzipped,
+    progress_interval,
 ):
     "Checks the globularity of the AF domain"
 
@@ -98,12 +108,22 @@ def measure_globularity(
         general_domain_provider = yield_domain_from_consensus_domain_list(
             consensus_domain_list
         )
+        progress = ProgressReporter.for_id_file(
+            consensus_domain_list,
+            header=False,
+            label="domains",
+            interval=progress_interval,
+        )
     elif chainsaw_domain_list:
         general_domain_provider = yield_domain_from_chainsaw_domain_list_csv(
             chainsaw_domain_list
         )
+        progress = ProgressReporter.for_id_file(
+            chainsaw_domain_list, label="domains", interval=progress_interval
+        )
     else:
         general_domain_provider = yield_domain_from_pdbdir(pdb_dir)
+        progress = ProgressReporter(label="domains", interval=progress_interval)
 
     globularity_writer = get_csv_dictwriter(
         domain_globularity,
@@ -122,7 +142,7 @@ def measure_globularity(
         f"(model_dir={pdb_dir}, pdb_suffix={pdb_suffix}, out_file={domain_globularity.name} ) ..."
     )
 
-    for domain_id in general_domain_provider:
+    for domain_id in entries(general_domain_provider):
         LOG.info(f"Working on: {domain_id} ...")
 
         model_structure = get_pdb_structure(
@@ -158,7 +178,9 @@ def measure_globularity(
                 "normed_radius_gyration": domain_normed_radius_gyration,
             }
         )
+        progress.update()
 
+    progress.finish()
     click.echo("DONE")
 
 
@@ -181,6 +203,7 @@ def check_domain_chopping_matches_model_residues(
         )
 
 
+@timed(STAGE_COMPUTE)
 def calculate_packing_density(
     domain_id: GeneralDomainID,
     model_structure: Structure,
@@ -245,6 +268,7 @@ def get_volume(residues, volume_resolution):
 
 
 # Function to get the normed radius of gyration
+@timed(STAGE_COMPUTE)
 def calculate_normed_radius_of_gyration(
     domain_id: GeneralDomainID,
     model_structure: Structure,
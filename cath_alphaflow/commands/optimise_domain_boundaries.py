@@ -1,7 +1,9 @@
-from Bio.PDB import MMCIFParser
+from Bio.PDB import MMCIFParser, Structure
 import logging
 from pathlib import Path
 import gzip
+import time
+from typing import Tuple
 
 import click
 
@@ -11,8 +13,16 @@ from cath_alphaflow.io_utils import get_csv_dictwriter
 from cath_alphaflow.models.domains import AFDomainID, SegmentStr, ChoppingPdbResLabel
 from cath_alphaflow.errors import NoMatchingResiduesError
 from cath_alphaflow.io_utils import get_status_log_dictwriter
+from cath_alphaflow.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
 from cath_alphaflow.constants import STATUS_LOG_SUCCESS, STATUS_LOG_FAIL
 from cath_alphaflow.seq_utils import get_local_plddt_for_res
+from cath_alphaflow.profiling import (
+    STAGE_COMPUTE,
+    STAGE_PARSE,
+    entries,
+    timed,
+    timer,
+)
 
 LOG = logging.getLogger()
 
@@ -70,6 +80,20 @@ LOG = logging.getLogger()
     required=True,
     help="Log file recording if domains have been optimised or reason for skipping",
 )
+@click.option(
+    "--status_log_metrics",
+    is_flag=True,
+    default=False,
+    help="Option: add the time taken, input bytes and chain residue count for each "
+    "entry to the status log",
+)
+@click.option(
+    "--progress_interval",
+    type=float,
+    default=DEFAULT_PROGRESS_INTERVAL,
+    show_default=True,
+    help="Option: seconds between progress messages (0 to disable)",
+)
 def optimise_domain_boundaries(
     af_domain_list,
     af_chain_mmcif_dir,
@@ -78,6 +102,8 @@ def optimise_domain_boundaries(
     cutoff_plddt_score,
     gzipped_af_chains,
     status_log_file,
+    status_log_metrics,
+    progress_interval,
 ):
     "Adjusts the domain boundaries of AF2 by removing unpacked tails"
 
@@ -94,35 +120,55 @@ def optimise_domain_boundaries(
     )
     af_mapping_list_post_tailchop_writer.writeheader()
 
-    status_log = get_status_log_dictwriter(status_log_file)
+    status_log = get_status_log_dictwriter(status_log_file, metrics=status_log_metrics)
+    progress = ProgressReporter.for_id_file(
+        af_domain_list, label="domains", interval=progress_interval
+    )
 
     click.echo(
         f"Chopping tails from AF domains"
         f"(mmcif_dir={af_chain_mmcif_dir}, in_file={af_domain_list.name}, "
         f"out_file={af_domain_list_post_tailchop.name} ) ..."
     )
-    for af_domain_id in af_domain_list_reader:
+    for af_domain_id in entries(af_domain_list_reader):
         LOG.debug(f"Working on: {af_domain_id} ...")
+        started = time.perf_counter()
         af_domain_id_post_tailchop = None
+        structure, cif_path = read_af_chain_structure(
+            af_domain_id.af_chain_id, af_chain_mmcif_dir, gzipped_af_chains
+        )
         try:
-            af_domain_id_post_tailchop = calculate_domain_id_post_tailchop(
-                af_domain_id, af_chain_mmcif_dir, cutoff_plddt_score, gzipped_af_chains
+            af_domain_id_post_tailchop = (
+                calculate_domain_id_post_tailchop_from_structure(
+                    af_domain_id, structure, cutoff_plddt_score
+                )
             )
 
             if af_domain_id == af_domain_id_post_tailchop:
                 description = f"boundaries unchanged"
             else:
                 description = f"adjusted boundaries from {af_domain_id} to {af_domain_id_post_tailchop}"
-            write_status_log(
-                status_log, af_domain_id, STATUS_LOG_SUCCESS, None, description
-            )
 
         except NoMatchingResiduesError:
             description = "boundaries not adjusted due to low pLDDT"
             af_domain_id_post_tailchop = af_domain_id
-            write_status_log(
-                status_log, af_domain_id, STATUS_LOG_SUCCESS, None, description
-            )
+
+        # only measure the input when the metrics are written
+        metrics = {}
+        if status_log_metrics:
+            metrics = {
+                "elapsed_seconds": time.perf_counter() - started,
+                "input_bytes": cif_path.stat().st_size,
+                "residue_count": len(list(structure.get_residues())),
+            }
+        write_status_log(
+            status_log,
+            af_domain_id,
+            STATUS_LOG_SUCCESS,
+            None,
+            description,
+            **metrics,
+        )
 
         af_domain_list_post_tailchop_writer.writerow(
             {"af_domain_id": af_domain_id_post_tailchop}
@@ -134,7 +180,9 @@ def optimise_domain_boundaries(
                 "af_domain_id_post_tailchop": af_domain_id_post_tailchop,
             }
         )
+        progress.update()
 
+    progress.finish()
     click.echo("DONE")
 
 
@@ -154,6 +202,7 @@ def biopdb_residue_to_str(res):
     return f"{res_num}{ins_code}"
 
 
+@timed(STAGE_COMPUTE)
 def cut_segment(
     structure, segment_to_cut: SegmentStr, cutoff_plddt_score, cut_start, cut_end
 ) -> SegmentStr:
@@ -283,50 +332,85 @@ def calculate_domain_id_post_tailchop(
     cif_filename=None,
 ) -> AFDomainID:
 
-    old_chopping = af_domain_id.chopping
+    structure, _cif_path = read_af_chain_structure(
+        af_domain_id.af_chain_id,
+        af_chain_mmcif_dir,
+        gzipped_af_chains,
+        cif_filename=cif_filename,
+    )
+
+    return calculate_domain_id_post_tailchop_from_structure(
+        af_domain_id, structure, cutoff_plddt_score
+    )
+
+
+def read_af_chain_structure(
+    af_chain_id: str,
+    af_chain_mmcif_dir: Path,
+    gzipped_af_chains: bool = True,
+    *,
+    cif_filename=None,
+) -> Tuple[Structure, Path]:
+    """
+    Returns the parsed structure and the path of the mmCIF file for an AF chain
+    """
 
     # create default filename
     if cif_filename is None:
         if gzipped_af_chains == False:
-            open_func = open
-            cif_filename = af_domain_id.af_chain_id + ".cif"
+            cif_filename = af_chain_id + ".cif"
         else:
-            open_func = gzip.open
-            cif_filename = af_domain_id.af_chain_id + ".cif.gz"
+            cif_filename = af_chain_id + ".cif.gz"
+    open_func = gzip.open if cif_filename.endswith(".gz") else open
 
     cif_path = Path(af_chain_mmcif_dir, cif_filename)
 
-    # var to store the new segments (whether from single or multi-segment domains)
-    new_segments = None
+    with timer(STAGE_PARSE, f"{__name__}.get_structure"):
+        with open_func(f"{cif_path}", mode="rt") as cif_fh:
+            structure = MMCIFParser(QUIET=1).get_structure(f"{cif_filename}", cif_fh)
 
-    with open_func(f"{cif_path}", mode="rt") as cif_fh:
+    return structure, cif_path
 
-        structure = MMCIFParser(QUIET=1).get_structure(f"{cif_filename}", cif_fh)
 
-        if len(old_chopping.segments) == 1:
-            # For single region domains just cut the one region
-            new_segment = cut_segment(
-                structure,
-                old_chopping.segments[0],
-                cutoff_plddt_score,
-                cut_start=True,
-                cut_end=True,
-            )
-            new_segments = [new_segment]
-        else:
-            # For contigs, only cut the outer most parts and leave everything in the middle intact
-            # We do this by first cutting from the start and then from the end.
+@timed(STAGE_COMPUTE)
+def calculate_domain_id_post_tailchop_from_structure(
+    af_domain_id: AFDomainID,
+    structure,
+    cutoff_plddt_score: int,
+) -> AFDomainID:
+    """
+    Returns the AF domain id after chopping the tails (from an already parsed chain)
+    """
+
+    old_chopping = af_domain_id.chopping
+
+    # var to store the new segments (whether from single or multi-segment domains)
+    new_segments = None
+
+    if len(old_chopping.segments) == 1:
+        # For single region domains just cut the one region
+        new_segment = cut_segment(
+            structure,
+            old_chopping.segments[0],
+            cutoff_plddt_score,
+            cut_start=True,
+            cut_end=True,
+        )
+        new_segments = [new_segment]
+    else:
+        # For contigs, only cut the outer most parts and leave everything in the middle intact
+        # We do this by first cutting from the start and then from the end.
 
-            # make a copy so we don't touch the old chopping
-            _chopping = old_chopping.deep_copy().as_pdbreslabel()
+        # make a copy so we don't touch the old chopping
+        _chopping = old_chopping.deep_copy().as_pdbreslabel()
 
-            # adjust the start of the new chopping
-            _chopping = cut_chopping_start(structure, _chopping, cutoff_plddt_score)
+        # adjust the start of the new chopping
+        _chopping = cut_chopping_start(structure, _chopping, cutoff_plddt_score)
 
-            # adjust the end of the new chopping
-            _chopping = cut_chopping_end(structure, _chopping, cutoff_plddt_score)
+        # adjust the end of the new chopping
+        _chopping = cut_chopping_end(structure, _chopping, cutoff_plddt_score)
 
-            new_segments = _chopping.segments
+        new_segments = _chopping.segments
 
     # create a new AF domain id with the new chopping
     af_domain_id_post_tailchop = af_domain_id.deep_copy()
@@ -335,12 +419,32 @@ def calculate_domain_id_post_tailchop(
     return af_domain_id_post_tailchop
 
 
-def write_status_log(status_log, entry_id, status, error, description):
-    status_log.writerow(
-        {
-            "entry_id": entry_id,
-            "status": status,
-            "error": error,
-            "description": description,
-        }
+def write_status_log(
+    status_log,
+    entry_id,
+    status,
+    error,
+    description,
+    *,
+    elapsed_seconds=None,
+    input_bytes=None,
+    residue_count=None,
+):
+    row = {
+        "entry_id": entry_id,
+        "status": status,
+        "error": error,
+        "description": description,
+    }
+    # metrics are only written if the status log includes them
+    metrics = {
+        "elapsed_seconds": (
+            None if elapsed_seconds is None else round(elapsed_seconds, 4)
+        ),
+        "input_bytes": input_bytes,
+        "residue_count": residue_count,
+    }
+    row.update(
+        (key, value) for key, value in metrics.items() if key in status_log.fieldnames
     )
+    status_log.writerow(row)
@@ -0,0 +1,584 @@
+from dataclasses import dataclass
+import gzip
+import io
+import itertools
+import logging
+from pathlib import Path
+import subprocess
+import tempfile
+import time
+
+from Bio.PDB import MMCIFParser, Structure
+import click
+
+from cath_alphaflow.chopping import (
+    StructureFileType,
+    chop_biostructure,
+    save_structure,
+)
+from cath_alphaflow.cif_utils import read_cif_categories
+from cath_alphaflow.commands.convert_cif_to_dssp import run_dssp
+from cath_alphaflow.commands.convert_dssp_to_sse_summary import (
+    get_sse_summary_from_dssp_string,
+    read_dssp_string,
+)
+from cath_alphaflow.commands.extract_plddt_and_lur import (
+    PLDDT_CIF_CATEGORIES,
+    get_average_plddt_from_cif_dict,
+    get_LUR_summary_from_cif_dict,
+)
+from cath_alphaflow.commands.measure_globularity import (
+    calculate_normed_radius_of_gyration,
+    calculate_packing_density,
+)
+from cath_alphaflow.commands.optimise_domain_boundaries import (
+    calculate_domain_id_post_tailchop_from_structure,
+    write_status_log,
+)
+from cath_alphaflow.constants import (
+    DEFAULT_CIF_SUFFIX,
+    DEFAULT_DSSP_SUFFIX,
+    DEFAULT_GLOB_DISTANCE,
+    DEFAULT_GLOB_VOLUME,
+    STATUS_LOG_FAIL,
+    STATUS_LOG_SUCCESS,
+)
+from cath_alphaflow.errors import BaseError, NoMatchingResiduesError
+from cath_alphaflow.io_utils import (
+    get_af_domain_id_reader,
+    get_csv_dictwriter,
+    get_plddt_summary_writer,
+    get_sse_summary_writer,
+    get_status_log_dictwriter,
+)
+from cath_alphaflow.models.domains import (
+    AFDomainID,
+    GeneralDomainID,
+    pLDDTSummary,
+    SecStrSummary,
+)
+from cath_alphaflow.profiling import (
+    STAGE_COMPUTE,
+    STAGE_PARSE,
+    STAGE_READ,
+    entries,
+    timer,
+)
+from cath_alphaflow.progress import DEFAULT_PROGRESS_INTERVAL, ProgressReporter
+from cath_alphaflow.seq_utils import (
+    biostructure_chain_to_sequence,
+    biostructure_to_md5,
+    chopped_sequence_to_md5,
+    cif_dict_to_sequence,
+)
+from cath_alphaflow.settings import get_default_settings
+
+LOG = logging.getLogger()
+
+# mmCIF categories needed for the pLDDT / LUR summary and the sequence MD5
+QC_CIF_CATEGORIES = (*PLDDT_CIF_CATEGORIES, "_entity_poly")
+
+GLOBULARITY_FIELDNAMES = [
+    "model_id",
+    "md5",
+    "chopping",
+    "packing_density",
+    "normed_radius_gyration",
+]
+
+QC_SUMMARY_FIELDNAMES = [
+    "af_domain_id",
+    "af_domain_id_post_tailchop",
+    "md5",
+    "avg_plddt",
+    "perc_LUR",
+    "residues_total",
+    "ss_res_total",
+    "res_count",
+    "perc_not_in_ss",
+    "sse_H_num",
+    "sse_E_num",
+    "sse_num",
+    "packing_density",
+    "normed_radius_gyration",
+]
+
+# errors that fail a single chain / domain (rather than the whole run), including
+# the KeyError / ValueError raised when a CIF file is truncated or missing a category
+QC_ERRORS = (
+    BaseError,
+    FileNotFoundError,
+    KeyError,
+    ValueError,
+    subprocess.CalledProcessError,
+)
+
+
+@click.command("run-domain-qc")
+@click.option(
+    "--af_domain_list",
+    type=click.File("rt"),
+    required=True,
+    help="Input: CSV file containing AF2 domains (grouped by chain)",
+)
+@click.option(
+    "--af_chain_mmcif_dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True),
+    required=True,
+    help="Input: directory of mmCIF files",
+)
+@click.option(
+    "--cif_suffix",
+    type=str,
+    default=DEFAULT_CIF_SUFFIX,
+    help=f"Option: suffix to use for mmCIF files (default: {DEFAULT_CIF_SUFFIX})",
+)
+@click.option(
+    "--dssp_dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True),
+    required=False,
+    help="Input: directory of DSSP files for the AF chains (default: run DSSP on each "
+    "chain)",
+)
+@click.option(
+    "--dssp_suffix",
+    type=str,
+    default=DEFAULT_DSSP_SUFFIX,
+    help=f"Option: suffix to use for DSSP files (default: {DEFAULT_DSSP_SUFFIX})",
+)
+@click.option(
+    "--cutoff_plddt_score",
+    type=int,
+    default=70,
+    help="Option: pLDDT cut-off score used to chop the domain tails (default: 70)",
+)
+@click.option(
+    "--distance_cutoff",
+    type=int,
+    default=DEFAULT_GLOB_DISTANCE,
+    help="Option: distance cutoff for the packing density in Angstrom "
+    f"(default: {DEFAULT_GLOB_DISTANCE})",
+)
+@click.option(
+    "--volume_resolution",
+    type=int,
+    default=DEFAULT_GLOB_VOLUME,
+    help="Option: voxel resolution for approximating the protein volume "
+    f"(default: {DEFAULT_GLOB_VOLUME})",
+)
+@click.option(
+    "--af_domain_list_post_tailchop",
+    type=click.File("wt"),
+    required=True,
+    help="Output: CSV file for AF2 domain list after chopping",
+)
+@click.option(
+    "--af_domain_mapping_post_tailchop",
+    type=click.File("wt"),
+    required=True,
+    help="Output: CSV file for mapping of AF2 domain before/after chopping",
+)
+@click.option(
+    "--domain_cif_out_dir",
+    type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True),
+    required=True,
+    help="Output: directory of chopped domain CIF files",
+)
+@click.option(
+    "--plddt_stats_file",
+    type=click.File("wt"),
+    required=True,
+    help="Output: pLDDT and LUR output file",
+)
+@click.option(
+    "--sse_out_file",
+    type=click.File("wt"),
+    required=True,
+    help="Output: SSE output file",
+)
+@click.option(
+    "--domain_globularity",
+    type=click.File("wt"),
+    required=True,
+    help="Output: CSV file for domain results including both globularity parameters",
+)
+@click.option(
+    "--qc_summary_file",
+    type=click.File("wt"),
+    required=True,
+    help="Output: CSV file combining the results of all QC stages",
+)
+@click.option(
+    "--status_log",
+    "status_log_file",
+    type=click.File("wt"),
+    required=True,
+    help="Output: log file recording the result of the QC for each domain",
+)
+@click.option(
+    "--status_log_metrics",
+    is_flag=True,
+    default=False,
+    help="Option: add the time taken, input bytes and chain residue count for each "
+    "domain to the status log",
+)
+@click.option(
+    "--progress_interval",
+    type=float,
+    default=DEFAULT_PROGRESS_INTERVAL,
+    show_default=True,
+    help="Option: seconds between progress messages (0 to disable)",
+)
+def run_domain_qc(
+    af_domain_list,
+    af_chain_mmcif_dir,
+    cif_suffix,
+    dssp_dir,
+    dssp_suffix,
+    cutoff_plddt_score,
+    distance_cutoff,
+    volume_resolution,
+    af_domain_list_post_tailchop,
+    af_domain_mapping_post_tailchop,
+    domain_cif_out_dir,
+    plddt_stats_file,
+    sse_out_file,
+    domain_globularity,
+    qc_summary_file,
+    status_log_file,
+    status_log_metrics,
+    progress_interval,
+):
+    """
+    Runs all the domain QC stages, reading each chain file once
+
+    Each chain goes through: optimise domain boundaries -> chop CIF -> pLDDT / LUR
+    summary -> SSE summary (from DSSP) -> globularity. The stages write the same
+    outputs as the individual commands, plus a combined summary for each domain.
+    Domains should be grouped by chain (otherwise a chain is read once per group).
+
+    The pLDDT and sequence metadata are tokenized separately from the structure, but
+    only up to the `_atom_site` loop (see `cif_utils.read_cif_categories`).
+
+    With `--status_log_metrics`, the time for each domain includes an equal share of
+    the time taken to read its chain.
+    """
+
+    domain_list_writer = get_csv_dictwriter(
+        af_domain_list_post_tailchop, fieldnames=["af_domain_id"]
+    )
+    domain_list_writer.writeheader()
+    domain_mapping_writer = get_csv_dictwriter(
+        af_domain_mapping_post_tailchop,
+        fieldnames=["af_domain_id_orig", "af_domain_id_post_tailchop"],
+    )
+    domain_mapping_writer.writeheader()
+    plddt_writer = get_plddt_summary_writer(plddt_stats_file)
+    sse_writer = get_sse_summary_writer(sse_out_file)
+    globularity_writer = get_csv_dictwriter(
+        domain_globularity, fieldnames=GLOBULARITY_FIELDNAMES
+    )
+    globularity_writer.writeheader()
+    qc_summary_writer = get_csv_dictwriter(
+        qc_summary_file, fieldnames=QC_SUMMARY_FIELDNAMES
+    )
+    qc_summary_writer.writeheader()
+    status_log = get_status_log_dictwriter(status_log_file, metrics=status_log_metrics)
+    progress = ProgressReporter.for_id_file(
+        af_domain_list, label="domains", interval=progress_interval
+    )
+    config = get_default_settings() if dssp_dir is None else None
+
+    click.echo(
+        f"Running domain QC (mmcif_dir={af_chain_mmcif_dir}, "
+        f"in_file={af_domain_list.name}) ..."
+    )
+
+    domain_count = 0
+    failed_count = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # entries are chains (all the domains in a chain are processed together)
+        for af_chain_id, chain_domain_ids in entries(
+            itertools.groupby(
+                get_af_domain_id_reader(af_domain_list),
+                key=lambda af_domain_id: af_domain_id.af_chain_id,
+            )
+        ):
+            chain_domain_ids = list(chain_domain_ids)
+            domain_count += len(chain_domain_ids)
+            LOG.debug(f"Working on chain: {af_chain_id} ...")
+            started = time.perf_counter()
+            try:
+                qc_chain = read_qc_chain(
+                    af_chain_id,
+                    af_chain_mmcif_dir=af_chain_mmcif_dir,
+                    cif_suffix=cif_suffix,
+                    dssp_dir=dssp_dir or tmp_dir,
+                    dssp_suffix=dssp_suffix,
+                    run_dssp_on_chain=dssp_dir is None,
+                    config=config,
+                )
+            except QC_ERRORS as err:
+                LOG.error(f"failed to read chain {af_chain_id}: {err}")
+                read_seconds = time.perf_counter() - started
+                for af_domain_id in chain_domain_ids:
+                    write_status_log(
+                        status_log,
+                        af_domain_id,
+                        STATUS_LOG_FAIL,
+                        err,
+                        "failed to read chain",
+                        elapsed_seconds=read_seconds / len(chain_domain_ids),
+                    )
+                failed_count += len(chain_domain_ids)
+                progress.update(len(chain_domain_ids))
+                continue
+
+            read_seconds = time.perf_counter() - started
+            read_seconds_per_domain = read_seconds / len(chain_domain_ids)
+            chain_metrics = {}
+            if status_log_metrics:
+                chain_metrics = {
+                    "input_bytes": qc_chain.cif_path.stat().st_size,
+                    "residue_count": len(qc_chain.sequence),
+                }
+            for af_domain_id in chain_domain_ids:
+                started = time.perf_counter()
+                try:
+                    result = run_domain_qc_stages(
+                        af_domain_id,
+                        qc_chain,
+                        cutoff_plddt_score=cutoff_plddt_score,
+                        domain_cif_out_dir=domain_cif_out_dir,
+                        distance_cutoff=distance_cutoff,
+                        volume_resolution=volume_resolution,
+                    )
+                except QC_ERRORS as err:
+                    LOG.error(f"failed to run QC for domain {af_domain_id}: {err}")
+                    elapsed_seconds = time.perf_counter() - started
+                    write_status_log(
+                        status_log,
+                        af_domain_id,
+                        STATUS_LOG_FAIL,
+                        err,
+                        "QC failed",
+                        elapsed_seconds=read_seconds_per_domain + elapsed_seconds,
+                        **chain_metrics,
+                    )
+                    failed_count += 1
+                    progress.update()
+                    continue
+
+                elapsed_seconds = time.perf_counter() - started
+                write_status_log(
+                    status_log,
+                    af_domain_id,
+                    STATUS_LOG_SUCCESS,
+                    None,
+                    result.tailchop_description,
+                    elapsed_seconds=read_seconds_per_domain + elapsed_seconds,
+                    **chain_metrics,
+                )
+                domain_list_writer.writerow(
+                    {"af_domain_id": result.af_domain_id_post_tailchop}
+                )
+                domain_mapping_writer.writerow(
+                    {
+                        "af_domain_id_orig": af_domain_id,
+                        "af_domain_id_post_tailchop": result.af_domain_id_post_tailchop,
+                    }
+                )
+                plddt_writer.writerow(result.plddt_summary.__dict__)
+                sse_writer.writerow(result.sse_summary.to_dict())
+                globularity_writer.writerow(result.globularity)
+                qc_summary_writer.writerow(result.to_summary_dict())
+                progress.update()
+
+    progress.finish()
+    LOG.info(f"Domain QC done: {domain_count} domains, {failed_count} failed")
+    click.echo("DONE")
+
+
+@dataclass
+class QcChain:
+    """
+    AF chain data shared by all the QC stages (read from the files once)
+    """
+
+    af_chain_id: str
+    cif_path: Path
+    structure: Structure
+    cif_dict: dict
+    sequence: str
+    dssp_string: str
+
+
+@dataclass
+class DomainQcResult:
+    """
+    Results of the QC stages for a single domain
+    """
+
+    af_domain_id: AFDomainID
+    af_domain_id_post_tailchop: AFDomainID
+    tailchop_description: str
+    plddt_summary: pLDDTSummary
+    sse_summary: SecStrSummary
+    globularity: dict
+
+    def to_summary_dict(self) -> dict:
+        sse_dict = self.sse_summary.to_dict()
+        del sse_dict["af_domain_id"]
+        return {
+            "af_domain_id": str(self.af_domain_id),
+            "af_domain_id_post_tailchop": str(self.af_domain_id_post_tailchop),
+            "md5": self.plddt_summary.md5,
+            "avg_plddt": self.plddt_summary.avg_plddt,
+            "perc_LUR": self.plddt_summary.perc_LUR,
+            "residues_total": self.plddt_summary.residues_total,
+            **sse_dict,
+            "packing_density": self.globularity["packing_density"],
+            "normed_radius_gyration": self.globularity["normed_radius_gyration"],
+        }
+
+
+def read_qc_chain(
+    af_chain_id: str,
+    *,
+    af_chain_mmcif_dir: str,
+    cif_suffix: str,
+    dssp_dir: str,
+    dssp_suffix: str,
+    run_dssp_on_chain: bool = False,
+    config=None,
+) -> QcChain:
+    """
+    Reads and parses the mmCIF (and DSSP) file of an AF chain
+
+    The file is read once: the QC metadata categories are tokenized from the header
+    (stopping before `_atom_site`) and the structure is parsed from the same text.
+    """
+
+    cif_path = Path(af_chain_mmcif_dir) / f"{af_chain_id}{cif_suffix}"
+    if not cif_path.exists():
+        msg = f"failed to locate CIF input file {cif_path}"
+        raise FileNotFoundError(msg)
+
+    open_func = gzip.open if cif_path.name.endswith(".gz") else open
+    with timer(STAGE_READ, f"{__name__}.read_cif"):
+        with open_func(str(cif_path), mode="rt") as cif_fh:
+            cif_text = cif_fh.read()
+
+    cif_dict = read_cif_categories(io.StringIO(cif_text), QC_CIF_CATEGORIES)
+    with timer(STAGE_PARSE, f"{__name__}.get_structure"):
+        structure = MMCIFParser(QUIET=1).get_structure(
+            af_chain_id, io.StringIO(cif_text)
+        )
+
+    sequence = cif_dict_to_sequence(cif_dict)
+    if sequence is None:
+        sequence = biostructure_chain_to_sequence(structure[0].get_list()[0])
+
+    dssp_path = Path(dssp_dir) / f"{af_chain_id}{dssp_suffix}"
+    if run_dssp_on_chain:
+        # the DSSP file is only needed until it has been read
+        try:
+            with timer(STAGE_COMPUTE, f"{__name__}.run_dssp"):
+                run_dssp(cif_path, dssp_path, config=config)
+            dssp_string = read_dssp_string(dssp_path)
+        finally:
+            dssp_path.unlink(missing_ok=True)
+    else:
+        dssp_string = read_dssp_string(dssp_path)
+
+    return QcChain(
+        af_chain_id=af_chain_id,
+        cif_path=cif_path,
+        structure=structure,
+        cif_dict=cif_dict,
+        sequence=sequence,
+        dssp_string=dssp_string,
+    )
+
+
+def run_domain_qc_stages(
+    af_domain_id: AFDomainID,
+    qc_chain: QcChain,
+    *,
+    cutoff_plddt_score: int,
+    domain_cif_out_dir: str,
+    distance_cutoff: int = DEFAULT_GLOB_DISTANCE,
+    volume_resolution: int = DEFAULT_GLOB_VOLUME,
+) -> DomainQcResult:
+    """
+    Runs the QC stages for a domain on the (already parsed) chain
+    """
+
+    # optimise domain boundaries
+    try:
+        af_domain_id_post_tailchop = calculate_domain_id_post_tailchop_from_structure(
+            af_domain_id, qc_chain.structure, cutoff_plddt_score
+        )
+        if af_domain_id == af_domain_id_post_tailchop:
+            tailchop_description = "boundaries unchanged"
+        else:
+            tailchop_description = (
+                f"adjusted boundaries from {af_domain_id} to "
+                f"{af_domain_id_post_tailchop}"
+            )
+    except NoMatchingResiduesError:
+        af_domain_id_post_tailchop = af_domain_id
+        tailchop_description = "boundaries not adjusted due to low pLDDT"
+
+    # the later stages use the domain id as read from the post-tailchop domain list
+    qc_domain_id = AFDomainID.from_str(str(af_domain_id_post_tailchop))
+    chopping = qc_domain_id.chopping
+    file_stub = qc_domain_id.to_file_stub()
+
+    # chop CIF
+    domain_structure = chop_biostructure(qc_chain.structure, chopping)
+    domain_structure.id = qc_domain_id.to_str()
+    cif_suffix = qc_chain.cif_path.name[len(qc_chain.af_chain_id) :]
+    save_structure(
+        domain_structure,
+        path=Path(domain_cif_out_dir) / f"{file_stub}{cif_suffix}",
+        file_type=StructureFileType.CIF,
+    )
+
+    # pLDDT / LUR
+    lur_summary = get_LUR_summary_from_cif_dict(qc_chain.cif_dict, chopping=chopping)
+    plddt_summary = pLDDTSummary(
+        af_domain_id=str(qc_domain_id),
+        md5=chopped_sequence_to_md5(qc_chain.sequence, chopping=chopping),
+        avg_plddt=get_average_plddt_from_cif_dict(qc_chain.cif_dict, chopping=chopping),
+        perc_LUR=lur_summary.LUR_perc,
+        residues_total=lur_summary.residues_total,
+    )
+
+    # SSE summary
+    sse_summary = get_sse_summary_from_dssp_string(
+        qc_chain.dssp_string, acc_id=file_stub, chopping=chopping
+    )
+
+    # globularity
+    general_domain_id = GeneralDomainID(raw_id=file_stub, chopping=chopping)
+    globularity = {
+        "model_id": file_stub,
+        "md5": biostructure_to_md5(domain_structure),
+        "chopping": chopping.to_str(),
+        "packing_density": calculate_packing_density(
+            general_domain_id, domain_structure, distance_cutoff
+        ),
+        "normed_radius_gyration": calculate_normed_radius_of_gyration(
+            general_domain_id, domain_structure, volume_resolution
+        ),
+    }
+
+    return DomainQcResult(
+        af_domain_id=af_domain_id,
+        af_domain_id_post_tailchop=af_domain_id_post_tailchop,
+        tailchop_description=tailchop_description,
+        plddt_summary=plddt_summary,
+        sse_summary=sse_summary,
+        globularity=globularity,
+    )
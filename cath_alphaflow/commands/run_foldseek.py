@@ -1,25 +1,418 @@
-from email.policy import default
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import hashlib
+import itertools
+import json
 import os
 import glob
+import shutil
 import click
-import subprocess
 
+from cath_alphaflow.errors import ParseError
+from cath_alphaflow.foldseek_utils import (
+    FoldseekResultCache,
+    create_sub_db,
+    get_db_fingerprint,
+    get_entry_hashes,
+    read_lookup,
+    run_foldseek_command,
+    split_keys_into_shards,
+)
 from cath_alphaflow.settings import get_default_settings
 
-config = get_default_settings()
-
-FS_BINARY_PATH = config.FS_BINARY_PATH
-FS_TMP_PATH = config.FS_TMP_PATH
-FS_OVERLAP = config.FS_OVERLAP
 DEFAULT_FS_COV_MODE = "0" # overlap over query and target
 DEFAULT_FS_ALIGNER = "2" # 3di+AA (fast, accurate)
 DEFAULT_FS_FORMAT_OUTPUT = "query,target,qstart,qend,qlen,tstart,tend,tlen,qcov,tcov,bits,evalue"
+DEFAULT_FS_SENSITIVITY = 9.0
+
+SHARD_PLAN_FILENAME = "shards.json"
+SHARD_DONE_FILENAME = "DONE"
 
 LOG = logging.getLogger()
 
 
+def search_and_convert(
+    fs_bin_path,
+    fs_querydb,
+    fs_targetdb,
+    fs_rawdata,
+    fs_results,
+    tmp_dir,
+    *,
+    search_args,
+    threads=None,
+    log_path=None,
+):
+    """
+    Runs `foldseek search` then `convertalis` (removing the raw alignment DB afterwards)
+    """
+    thread_args = ["--threads", threads] if threads else []
+    run_foldseek_command(
+        fs_bin_path,
+        "search",
+        fs_querydb,
+        fs_targetdb,
+        fs_rawdata,
+        tmp_dir,
+        *search_args,
+        *thread_args,
+        log_path=log_path,
+    )
+    run_foldseek_command(
+        fs_bin_path,
+        "convertalis",
+        fs_querydb,
+        fs_targetdb,
+        fs_rawdata,
+        fs_results,
+        "--format-output",
+        DEFAULT_FS_FORMAT_OUTPUT,
+        *thread_args,
+        log_path=log_path,
+    )
+    for file in glob.glob(f"{fs_rawdata}*"):
+        os.unlink(file)
+
+
+def get_shard_dir(shards_dir, shard_index):
+    return Path(shards_dir) / f"shard_{shard_index:04d}"
+
+
+def is_shard_done(shards_dir, shard_index):
+    return (get_shard_dir(shards_dir, shard_index) / SHARD_DONE_FILENAME).exists()
+
+
+def plan_shards(fs_querydb, shards_dir, shard_count):
+    """
+    Writes (or checks) the shard plan and returns the query DB keys in each shard
+
+    The plan is fixed on the first run so that reruns process the same shards. The
+    plan includes a fingerprint of the query DB, so the shards (and their results)
+    cannot be reused if the query DB is rebuilt at the same path.
+    """
+    shards_dir = Path(shards_dir)
+    plan_path = shards_dir / SHARD_PLAN_FILENAME
+    plan = {
+        "fs_querydb": str(fs_querydb),
+        "fs_querydb_fingerprint": get_db_fingerprint(fs_querydb),
+        "shards": shard_count,
+    }
+    if plan_path.exists():
+        previous_plan = json.loads(plan_path.read_text())
+        if previous_plan != plan:
+            msg = (
+                f"shard directory {shards_dir} was created for {previous_plan} "
+                f"(not {plan}), remove it to start again"
+            )
+            raise click.UsageError(msg)
+    else:
+        shards_dir.mkdir(parents=True, exist_ok=True)
+        plan_path.write_text(json.dumps(plan) + "\n")
+
+    keys = [key for key, _name, _file_id in read_lookup(fs_querydb)]
+    return split_keys_into_shards(keys, shard_count)
+
+
+def run_shard(
+    fs_bin_path,
+    fs_querydb,
+    fs_targetdb,
+    shards_dir,
+    shard_index,
+    shard_keys,
+    tmp_dir,
+    *,
+    search_args,
+    threads=None,
+):
+    """
+    Searches one shard of the query DB, marking it as done when the results are written
+    """
+    shard_dir = get_shard_dir(shards_dir, shard_index)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    if not shard_keys:
+        # more shards than queries
+        LOG.info(f"Shard {shard_index} has no queries")
+        (shard_dir / "results.m8").write_text("")
+        (shard_dir / SHARD_DONE_FILENAME).touch()
+        return
+
+    shard_tmp_dir = Path(tmp_dir) / shard_dir.name
+    shard_tmp_dir.mkdir(parents=True, exist_ok=True)
+    log_path = shard_dir / "foldseek.log"
+    shard_querydb = shard_dir / "query.db"
+
+    LOG.info(
+        f"Running shard {shard_index} ({len(shard_keys)} queries, log: {log_path})"
+    )
+    create_sub_db(
+        fs_bin_path,
+        shard_keys,
+        fs_querydb,
+        shard_querydb,
+        tmp_dir=shard_dir,
+        log_path=log_path,
+    )
+    search_and_convert(
+        fs_bin_path,
+        shard_querydb,
+        fs_targetdb,
+        shard_dir / "aln",
+        shard_dir / "results.m8",
+        shard_tmp_dir,
+        search_args=search_args,
+        threads=threads,
+        log_path=log_path,
+    )
+    for file in glob.glob(f"{shard_querydb}*"):
+        os.unlink(file)
+    shutil.rmtree(shard_tmp_dir, ignore_errors=True)
+    (shard_dir / SHARD_DONE_FILENAME).touch()
+    LOG.info(f"Finished shard {shard_index}")
+
+
+def merge_shard_results(shards_dir, shard_count, fs_results):
+    """
+    Concatenates the per-shard results (in shard order) into `fs_results`
+    """
+    tmp_results = f"{fs_results}.tmp"
+    with open(tmp_results, "wb") as out_fh:
+        for shard_index in range(shard_count):
+            shard_results = get_shard_dir(shards_dir, shard_index) / "results.m8"
+            with shard_results.open("rb") as in_fh:
+                shutil.copyfileobj(in_fh, out_fh)
+    os.replace(tmp_results, fs_results)
+
+
+def run_sharded_search(
+    fs_bin_path,
+    fs_querydb,
+    fs_targetdb,
+    fs_results,
+    tmp_dir,
+    *,
+    search_args,
+    threads,
+    shards,
+    jobs,
+    shard_index,
+    shards_dir,
+):
+    """
+    Searches the query DB in shards (skipping completed shards) and merges the results
+
+    Returns False if only a single shard was run (so the results were not merged).
+    """
+    if shard_index is not None and shard_index >= shards:
+        raise click.UsageError(f"--shard_index must be less than --shards ({shards})")
+
+    if not shards_dir:
+        shards_dir = f"{fs_results}.shards"
+    keys_by_shard = plan_shards(fs_querydb, shards_dir, shards)
+
+    if shard_index is not None:
+        shard_indexes = [shard_index]
+    else:
+        shard_indexes = list(range(shards))
+    pending_indexes = [
+        idx for idx in shard_indexes if not is_shard_done(shards_dir, idx)
+    ]
+    LOG.info(
+        f"Shards: {len(shard_indexes) - len(pending_indexes)} done, "
+        f"{len(pending_indexes)} to run"
+    )
+
+    jobs = min(jobs, len(pending_indexes)) or 1
+    if threads is None and jobs > 1:
+        threads = max(1, (os.cpu_count() or 1) // jobs)
+        LOG.info(f"Running {jobs} shards concurrently with {threads} threads each")
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            idx: executor.submit(
+                run_shard,
+                fs_bin_path,
+                fs_querydb,
+                fs_targetdb,
+                shards_dir,
+                idx,
+                keys_by_shard[idx],
+                tmp_dir,
+                search_args=search_args,
+                threads=threads,
+            )
+            for idx in pending_indexes
+        }
+    failed_indexes = [idx for idx, future in futures.items() if future.exception()]
+    for idx in failed_indexes:
+        log_path = get_shard_dir(shards_dir, idx) / "foldseek.log"
+        LOG.error(f"Shard {idx} failed: {futures[idx].exception()} (log: {log_path})")
+    if failed_indexes:
+        raise futures[failed_indexes[0]].exception()
+
+    if shard_index is not None:
+        LOG.info(f"Shard {shard_index} done, rerun without --shard_index to merge")
+        return False
+
+    LOG.info(f"Merging {shards} shard results into {fs_results}")
+    merge_shard_results(shards_dir, shards, fs_results)
+    return True
+
+
+def run_search(
+    fs_bin_path,
+    fs_querydb,
+    fs_targetdb,
+    fs_rawdata,
+    fs_results,
+    tmp_dir,
+    *,
+    search_args,
+    threads=None,
+    shards=1,
+    jobs=1,
+    shard_index=None,
+    shards_dir=None,
+):
+    """
+    Searches the query DB against the target DB (in shards if requested)
+
+    Returns False if only a single shard was run (so `fs_results` was not written).
+    """
+    if shards == 1 and shard_index is None:
+        log_path = Path(fs_results).parent / "foldseek.log"
+        LOG.info(f"Running search (log: {log_path})")
+        search_and_convert(
+            fs_bin_path,
+            fs_querydb,
+            fs_targetdb,
+            fs_rawdata,
+            fs_results,
+            tmp_dir,
+            search_args=search_args,
+            threads=threads,
+            log_path=log_path,
+        )
+        return True
+    return run_sharded_search(
+        fs_bin_path,
+        fs_querydb,
+        fs_targetdb,
+        fs_results,
+        tmp_dir,
+        search_args=search_args,
+        threads=threads,
+        shards=shards,
+        jobs=jobs,
+        shard_index=shard_index,
+        shards_dir=shards_dir,
+    )
+
+
+def get_search_params_hash(search_args):
+    """
+    MD5 of the parameters that affect the search results
+    """
+    params = [*[str(arg) for arg in search_args], DEFAULT_FS_FORMAT_OUTPUT]
+    return hashlib.md5("\t".join(params).encode("utf-8")).hexdigest()
+
+
+def yield_hits_by_query(fs_results):
+    """
+    Yields `(query, rows)` for each query in a Foldseek m8 file (rows without the query)
+    """
+    with open(fs_results, "rt") as fh:
+        rows_by_query = (
+            line.rstrip("\n").split("\t", 1) for line in fh if line.strip()
+        )
+        for query, rows in itertools.groupby(rows_by_query, key=lambda row: row[0]):
+            yield query, [row[1] for row in rows]
+
+
+def search_with_cache(
+    fs_bin_path,
+    fs_querydb,
+    fs_targetdb,
+    fs_rawdata,
+    fs_results,
+    tmp_dir,
+    *,
+    cache_path,
+    **search_kwargs,
+):
+    """
+    Searches the queries that are not in the cache, then writes all hits from the cache
+    """
+    query_lookup = read_lookup(fs_querydb)
+    hash_by_key = get_entry_hashes(fs_querydb)
+    params_hash = get_search_params_hash(search_kwargs["search_args"])
+    target_fingerprint = get_db_fingerprint(fs_targetdb)
+
+    with FoldseekResultCache(
+        cache_path, target_fingerprint=target_fingerprint, params_hash=params_hash
+    ) as cache:
+        cached_hashes = cache.cached_hashes(set(hash_by_key.values()))
+        miss_keys = [
+            key
+            for key, _name, _ in query_lookup
+            if hash_by_key[key] not in cached_hashes
+        ]
+        LOG.info(
+            f"Cache: {len(query_lookup) - len(miss_keys)} hits, "
+            f"{len(miss_keys)} misses (target: {target_fingerprint}, "
+            f"params: {params_hash})"
+        )
+
+        if miss_keys:
+            miss_dir = Path(f"{fs_results}.cache_misses")
+            miss_dir.mkdir(parents=True, exist_ok=True)
+            miss_querydb = miss_dir / "query.db"
+            miss_results = miss_dir / "results.m8"
+            create_sub_db(
+                fs_bin_path, miss_keys, fs_querydb, miss_querydb, tmp_dir=miss_dir
+            )
+            run_search(
+                fs_bin_path,
+                miss_querydb,
+                fs_targetdb,
+                fs_rawdata,
+                miss_results,
+                tmp_dir,
+                **search_kwargs,
+            )
+
+            hash_by_name = {
+                name: hash_by_key[key]
+                for key, name, _ in query_lookup
+                if hash_by_key[key] not in cached_hashes
+            }
+            found_hashes = set()
+            for query, rows in yield_hits_by_query(miss_results):
+                if query not in hash_by_name:
+                    msg = f"failed to find query '{query}' in query DB {fs_querydb}"
+                    raise ParseError(msg)
+                found_hashes.add(hash_by_name[query])
+                cache.add_many([(hash_by_name[query], rows)])
+            # queries without any hits are cached too
+            cache.add_many(
+                (query_hash, [])
+                for query_hash in set(hash_by_name.values()) - found_hashes
+            )
+            shutil.rmtree(miss_dir)
+            if search_kwargs.get("shards_dir"):
+                # shard results are only valid for this set of misses
+                shutil.rmtree(search_kwargs["shards_dir"], ignore_errors=True)
+
+        LOG.info(f"Writing results for {len(query_lookup)} queries to {fs_results}")
+        tmp_results = f"{fs_results}.tmp"
+        with open(tmp_results, "wt") as fh:
+            for key, name, _ in query_lookup:
+                for row in cache.get(hash_by_key[key]):
+                    fh.write(f"{name}\t{row}\n")
+        os.replace(tmp_results, fs_results)
+
+
 @click.command()
 @click.option(
     "--fs_querydb",
@@ -49,8 +442,8 @@ LOG = logging.getLogger()
     "--tmp_dir",
     type=click.Path(file_okay=False, dir_okay=True, resolve_path=True),
     required=True,
-    default=FS_TMP_PATH,
-    help=f"Output: Foldseek temp folder (default:{FS_TMP_PATH})",
+    default=lambda: get_default_settings().FS_TMP_PATH,
+    help="Output: Foldseek temp folder (default: FS_TMP_PATH setting)",
 )
 @click.option(
     "--cov_mode",
@@ -61,14 +454,14 @@ LOG = logging.getLogger()
 @click.option(
     "--coverage",
     type=float,
-    default=FS_OVERLAP,
-    help=f'Foldseek overlap (default:{FS_OVERLAP})'
+    default=lambda: get_default_settings().FS_OVERLAP,
+    help="Foldseek overlap (default: FS_OVERLAP setting)",
 )
 @click.option(
     "--fs_bin_path",
     type=click.Path(file_okay=True, resolve_path=True),
-    default=FS_BINARY_PATH,
-    help=f"Option: directory containing the Foldseek executable. (default: {FS_BINARY_PATH})"
+    default=lambda: get_default_settings().FS_BINARY_PATH,
+    help="Option: directory containing the Foldseek executable. (default: FS_BINARY_PATH setting)"
 )
 @click.option(
     "--alignment-type",
@@ -76,45 +469,98 @@ LOG = logging.getLogger()
     default=DEFAULT_FS_ALIGNER,
     help=f"Option: Foldseek alignment engine: 0: 3di alignment 1: TMalign 2: 3di+AA. (default: {DEFAULT_FS_ALIGNER})",
 )
-def run_foldseek(fs_querydb, fs_targetdb, fs_rawdata, fs_results, tmp_dir, cov_mode, coverage, alignment_type, fs_bin_path):
+@click.option(
+    "--sensitivity",
+    type=float,
+    default=DEFAULT_FS_SENSITIVITY,
+    help=f"Option: Foldseek search sensitivity (-s). (default: {DEFAULT_FS_SENSITIVITY})",
+)
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Option: number of threads for each Foldseek process (default: all cores, "
+    "or cores / jobs when running shards concurrently)",
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Option: split the query DB into this many shards that are searched "
+    "separately and merged (completed shards are skipped on reruns). (default: 1)",
+)
+@click.option(
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Option: number of shards to run concurrently. (default: 1)",
+)
+@click.option(
+    "--shard_index",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Option: only run this shard (e.g. from an array job), "
+    "rerun without this option to merge the results",
+)
+@click.option(
+    "--shards_dir",
+    type=click.Path(file_okay=False, dir_okay=True, resolve_path=True),
+    default=None,
+    help="Output: directory for per-shard results, logs and completion markers "
+    "(default: <fs_results>.shards)",
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False, resolve_path=True),
+    default=None,
+    help="Option: SQLite cache of hits by query structure, target DB and search "
+    "parameters (only queries that are not in the cache are searched)",
+)
+def run_foldseek(fs_querydb, fs_targetdb, fs_rawdata, fs_results, tmp_dir, cov_mode, coverage, alignment_type, fs_bin_path, sensitivity, threads, shards, jobs, shard_index, shards_dir, cache_path):
     "Run Foldseek Query DB against Target DB"
     assert str(fs_rawdata) != ''
-    subprocess.run(
-        [
+    search_args = [
+        "-s",
+        f"{sensitivity:g}",
+        "--cov-mode",
+        str(cov_mode),
+        "-c",
+        str(coverage),
+        "--alignment-type",
+        str(alignment_type),
+    ]
+
+    if cache_path and shard_index is not None:
+        raise click.UsageError("--cache cannot be used with --shard_index")
+
+    search_kwargs = dict(
+        search_args=search_args,
+        threads=threads,
+        shards=shards,
+        jobs=jobs,
+        shard_index=shard_index,
+        shards_dir=shards_dir,
+    )
+    if cache_path:
+        search_with_cache(
             fs_bin_path,
-            "search",
             fs_querydb,
             fs_targetdb,
             fs_rawdata,
+            fs_results,
             tmp_dir,
-            "-s",
-            "9",
-            "--cov-mode",
-            str(cov_mode),
-            "-c",
-            str(coverage),
-            "--alignment-type",
-            str(alignment_type)
-        ],
-        stderr=subprocess.DEVNULL,
-        check=True,
-    )
-    subprocess.run(
-        [
+            cache_path=cache_path,
+            **search_kwargs,
+        )
+    else:
+        run_search(
             fs_bin_path,
-            "convertalis",
             fs_querydb,
             fs_targetdb,
             fs_rawdata,
             fs_results,
-            "--format-output",
-            DEFAULT_FS_FORMAT_OUTPUT,
-        ],
-        stderr=subprocess.DEVNULL,
-        check=True,
-    )
-    files_to_remove = glob.glob(f"{fs_rawdata}*")
-    if files_to_remove:
-        for file in files_to_remove:
-            os.unlink(file)
+            tmp_dir,
+            **search_kwargs,
+        )
     click.echo("DONE")
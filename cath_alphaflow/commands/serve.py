@@ -0,0 +1,277 @@
+"""
+Long-lived worker that runs `cath-af-cli` commands submitted over a Unix socket
+
+Starting `cath-af-cli` for each small task (e.g. one chain in an HPC array job) pays
+for the Python start-up, imports and database connections every time. A worker
+started with `cath-af-cli serve` pays these once and then runs any command sent to it
+with `cath_alphaflow.task_client` (or the `cath-af-submit` script), streaming the
+output and exit code back to the client.
+
+Commands run in the worker process (with the working directory of the client), so
+each worker process runs one task at a time; use `--workers` to run tasks in parallel.
+Tasks use the environment (and so the settings) of the worker, not of the client.
+Mongo clients are kept between tasks, Oracle connections are not (each task connects).
+
+The socket is only accessible to the user running the worker, as anyone who can
+connect to it can run commands as that user.
+"""
+
+import contextlib
+import io
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+from pathlib import Path
+
+import click
+
+from cath_alphaflow import task_client
+from cath_alphaflow.errors import BaseError
+
+LOG = logging.getLogger()
+
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+DEFAULT_WORKERS = 1
+SOCKET_BACKLOG = 64
+
+
+class SocketStream(io.TextIOBase):
+    """
+    Text stream that sends everything written to it to the client
+    """
+
+    def __init__(self, sock_file, name: str, lock: threading.Lock):
+        self.sock_file = sock_file
+        self.name = name
+        self.lock = lock
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        # like other text streams (click checks this to find binary streams)
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            with self.lock:
+                task_client.send_message(self.sock_file, {self.name: text})
+        return len(text)
+
+
+def invoke_cli(args) -> int:
+    """
+    Runs `cath-af-cli` with the given arguments, returns the exit code
+    """
+    from cath_alphaflow.cli import cli
+
+    try:
+        cli.main(args, prog_name="cath-af-cli")
+    except SystemExit as err:
+        if err.code is None or isinstance(err.code, int):
+            return err.code or 0
+        click.echo(err.code, err=True)
+        return 1
+    except (Exception, BaseError):
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def run_task(args, *, cwd, stdout, stderr) -> int:
+    """
+    Runs a command with its output (and logging) sent to the given streams
+    """
+    root_logger = logging.getLogger()
+    log_level = root_logger.level
+    log_handlers = root_logger.handlers[:]
+    task_handler = logging.StreamHandler(stderr)
+    task_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    previous_cwd = os.getcwd()
+    previous_stdout, previous_stderr = sys.stdout, sys.stderr
+    root_logger.handlers = [task_handler]
+    try:
+        os.chdir(cwd)
+        sys.stdout, sys.stderr = stdout, stderr
+        return invoke_cli(args)
+    finally:
+        sys.stdout, sys.stderr = previous_stdout, previous_stderr
+        os.chdir(previous_cwd)
+        root_logger.handlers = log_handlers
+        # `--verbose` changes the level of the root logger
+        root_logger.setLevel(log_level)
+
+
+def handle_connection(conn: socket.socket):
+    with conn.makefile("rwb") as sock_file:
+        request = task_client.read_message(sock_file)
+        if request is None:
+            return
+        args = request["args"]
+        LOG.info(f"Running task: {args}")
+        lock = threading.Lock()
+        exit_code = run_task(
+            args,
+            cwd=request.get("cwd") or os.getcwd(),
+            stdout=SocketStream(sock_file, "stdout", lock),
+            stderr=SocketStream(sock_file, "stderr", lock),
+        )
+        task_client.send_message(sock_file, {"exit_code": exit_code})
+        LOG.info(f"Finished task: {args} (exit_code={exit_code})")
+
+
+def serve_tasks(server_sock: socket.socket, *, max_tasks: int = None):
+    """
+    Runs tasks from the listening socket one at a time
+    """
+    tasks_run = 0
+    while max_tasks is None or tasks_run < max_tasks:
+        conn, _address = server_sock.accept()
+        with conn:
+            try:
+                handle_connection(conn)
+            except OSError as err:
+                LOG.warning(f"Lost connection to client: {err}")
+        tasks_run += 1
+
+
+def preload_commands():
+    """
+    Imports all the commands (so the first task does not pay for the imports)
+    """
+    from cath_alphaflow.cli import cli
+
+    ctx = click.Context(cli)
+    for cmd_name in cli.list_commands(ctx):
+        try:
+            cli.get_command(ctx, cmd_name)
+        except ImportError as err:
+            LOG.warning(f"Failed to preload command {cmd_name}: {err}")
+
+
+def remove_stale_socket(socket_path: Path):
+    """
+    Removes a socket left by a worker that has stopped
+    """
+    if not socket_path.exists():
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except ConnectionRefusedError:
+            LOG.info(f"Removing stale socket: {socket_path}")
+            socket_path.unlink()
+            return
+    msg = f"socket {socket_path} is in use by another worker"
+    raise click.UsageError(msg)
+
+
+def bind_socket(socket_path: Path) -> socket.socket:
+    """
+    Returns a listening Unix socket that only the current user can connect to
+    """
+    server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # create the socket file without group / other permissions (no window to connect)
+    previous_umask = os.umask(0o177)
+    try:
+        server_sock.bind(str(socket_path))
+    except OSError:
+        server_sock.close()
+        raise
+    finally:
+        os.umask(previous_umask)
+    os.chmod(str(socket_path), 0o600)
+    server_sock.listen(SOCKET_BACKLOG)
+    return server_sock
+
+
+def run_workers(server_sock: socket.socket, *, workers: int, max_tasks: int = None):
+    """
+    Serves tasks from `workers` processes (forked so they share the imports)
+    """
+    if workers == 1:
+        serve_tasks(server_sock, max_tasks=max_tasks)
+        return
+
+    pids = set()
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                serve_tasks(server_sock, max_tasks=max_tasks)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        pids.add(pid)
+    try:
+        while pids:
+            pid, _status = os.wait()
+            pids.discard(pid)
+    finally:
+        # workers may have already stopped (e.g. on Ctrl-C)
+        for pid in pids:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+
+@click.command()
+@click.option(
+    "--socket_path",
+    type=click.Path(dir_okay=False, resolve_path=True, path_type=Path),
+    required=True,
+    help="Option: path of the Unix socket to listen on",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    help="Option: number of worker processes (each runs one task at a time)",
+)
+@click.option(
+    "--preload/--no-preload",
+    default=True,
+    show_default=True,
+    help="Option: import all the commands before accepting tasks",
+)
+@click.option(
+    "--max_tasks",
+    type=click.IntRange(min=1),
+    help="Option: stop each worker process after this many tasks",
+)
+def serve(socket_path, workers, preload, max_tasks):
+    """
+    Runs cath-af-cli commands submitted over a Unix socket (keeping imports warm)
+
+    Tasks run with the environment variables and settings of the worker (the
+    environment of the client is not used), so start the worker with the settings the
+    tasks need. The socket can only be used by the user running the worker.
+    """
+    if preload:
+        preload_commands()
+
+    remove_stale_socket(socket_path)
+    server_sock = bind_socket(socket_path)
+    try:
+        LOG.info(f"Listening on {socket_path} (workers={workers})")
+        run_workers(server_sock, workers=workers, max_tasks=max_tasks)
+    except KeyboardInterrupt:
+        LOG.info("Stopping")
+    finally:
+        server_sock.close()
+        socket_path.unlink(missing_ok=True)
+
+    click.echo("DONE")
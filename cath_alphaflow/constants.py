@@ -6,6 +6,7 @@ DEFAULT_FS_QUERYDB_SUFFIX = ".db"
 DEFAULT_FS_RESULTS_SUFFIX = ".m8"
 DEFAULT_FS_OVERLAP = 0.6
 DEFAULT_FS_BITS_CUTOFF = 160
+DEFAULT_FS_TOP_K = 5
 DEFAULT_HELIX_MIN_LENGTH = 3
 DEFAULT_STRAND_MIN_LENGTH = 2
 MIN_LENGTH_LUR = 5
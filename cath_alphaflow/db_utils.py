@@ -6,6 +6,9 @@ from cath_alphaflow.predicted_domain_provider import OraclePredictedCathDomainPr
 
 LOG = logging.getLogger(__name__)
 
+# rows fetched from the server per round trip (oracledb defaults to 100)
+DEFAULT_FETCH_ARRAYSIZE = 10000
+
 
 class OraDB(OraclePredictedCathDomainProvider):
     def __init__(
@@ -37,15 +40,22 @@ class OraDB(OraclePredictedCathDomainProvider):
     def conn(self):
         return self._conn
 
-    def yieldall(self, sql_stmt, *args, return_type=None):
+    def yieldall(self, sql_stmt, *args, return_type=None, arraysize=None):
         """
         Run SQL query and yield rows one-by-one
+
+        Rows are fetched from the server in batches of `arraysize` (if set)
         """
 
         with self.conn as conn:
             with conn.cursor() as curs:
                 LOG.debug("curs: %s", curs)
 
+                if arraysize:
+                    # prefetch the first batch with the execute round trip
+                    curs.arraysize = arraysize
+                    curs.prefetchrows = arraysize + 1
+
                 LOG.debug("SQL: %s (args:%s)", sql_stmt, *args)
                 curs.execute(sql_stmt, *args)
 
@@ -0,0 +1,193 @@
+"""
+Streaming FASTA scanner that works on raw bytes
+
+Parsing a large FASTA file (e.g. the ~200M sequences in AFDB `sequences.fasta`) with
+`SeqIO.parse` creates a `SeqRecord` for every entry on a single core. Here the file is
+split into chunks of bytes that start at a record boundary (`>` at the start of a
+line), so that chunks can be processed independently (e.g. in a process pool):
+
+- plain files are split into byte ranges (`find_fasta_chunk_ranges`) that can be read
+  by each worker
+- streams (gzip files, stdin) are read into blocks that end at a record boundary
+  (`iter_fasta_blocks`)
+
+Records are read in the same way as `SeqIO.parse(fh, "fasta")`: the id is the first
+word of the title and whitespace is removed from the sequence (only `\\n` is treated
+as a line ending). Records are written in the same format as `SeqIO.write(record, fh,
+"fasta")` (`format_fasta_record`).
+"""
+
+import collections
+from concurrent.futures import Executor, ProcessPoolExecutor
+import gzip
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+import click
+
+from .errors import ParseError
+
+RECORD_START = b">"
+RECORD_SEPARATOR = b"\n>"
+SEQUENCE_WHITESPACE = b" \t\r\n"
+GZIP_MAGIC = b"\x1f\x8b"
+
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+
+# same as the line width used by `SeqIO.write`
+FASTA_LINE_WIDTH = 60
+
+# items read ahead of the output (per process)
+PENDING_ITEMS_PER_JOB = 2
+
+
+def is_gzip_file(path: Path) -> bool:
+    with open(str(path), "rb") as fh:
+        return fh.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def open_fasta_binary(path: Path):
+    """
+    Opens a (optionally gzipped) FASTA file for reading bytes
+    """
+    if is_gzip_file(path):
+        return gzip.open(str(path), "rb")
+    return open(str(path), "rb")
+
+
+def check_fasta_start(data: bytes, source=None):
+    if data and not data.startswith(RECORD_START):
+        msg = f"expected FASTA data to start with '>' (source: {source})"
+        raise ParseError(msg)
+
+
+def find_fasta_chunk_ranges(
+    path: Path, *, chunk_bytes: int = DEFAULT_CHUNK_BYTES
+) -> List[Tuple[int, int]]:
+    """
+    Returns (start, end) byte ranges of roughly `chunk_bytes` that split a FASTA file
+    at record boundaries
+    """
+    file_size = Path(path).stat().st_size
+    offsets = [0]
+    with open(str(path), "rb") as fh:
+        check_fasta_start(fh.read(len(RECORD_START)), source=path)
+        position = chunk_bytes
+        while position < file_size:
+            # skip the (partial) line at this position, then find the next title line
+            fh.seek(position)
+            fh.readline()
+            while True:
+                line_start = fh.tell()
+                line = fh.readline()
+                if not line or line.startswith(RECORD_START):
+                    break
+            if not line:
+                break
+            offsets.append(line_start)
+            position = line_start + chunk_bytes
+    if file_size:
+        offsets.append(file_size)
+    return list(zip(offsets[:-1], offsets[1:]))
+
+
+def read_fasta_chunk(path: Path, start: int, end: int) -> bytes:
+    with open(str(path), "rb") as fh:
+        fh.seek(start)
+        return fh.read(end - start)
+
+
+def iter_fasta_blocks(
+    fh, *, chunk_bytes: int = DEFAULT_CHUNK_BYTES, source=None
+) -> Iterator[bytes]:
+    """
+    Yields blocks of roughly `chunk_bytes` from a binary stream (split at records)
+    """
+    remainder = b""
+    first_block = True
+    while True:
+        data = fh.read(chunk_bytes)
+        if not data:
+            break
+        if first_block:
+            check_fasta_start(data, source=source)
+            first_block = False
+        data = remainder + data
+        cut = data.rfind(RECORD_SEPARATOR)
+        if cut == -1:
+            remainder = data
+            continue
+        yield data[: cut + 1]
+        remainder = data[cut + 1 :]
+    if remainder:
+        yield remainder
+
+
+def iter_fasta_records(data: bytes) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yields (id, sequence) for the records in a chunk of FASTA data
+    """
+    if not data:
+        return
+    for record in data[len(RECORD_START) :].split(RECORD_SEPARATOR):
+        title, _newline, sequence = record.partition(b"\n")
+        title = title.decode("utf-8").rstrip()
+        record_id = title.split(None, 1)[0] if title else ""
+        yield record_id, sequence.translate(None, SEQUENCE_WHITESPACE)
+
+
+def format_fasta_record(header: str, sequence: str) -> str:
+    """
+    Returns a FASTA record as text (sequence wrapped at `FASTA_LINE_WIDTH`)
+    """
+    lines = [RECORD_START.decode() + header]
+    for idx in range(0, len(sequence), FASTA_LINE_WIDTH):
+        lines.append(sequence[idx : idx + FASTA_LINE_WIDTH])
+    return "\n".join(lines) + "\n"
+
+
+def open_fasta_text_writer(path):
+    """
+    Opens a FASTA file for writing text (gzipped if the path ends with `.gz`)
+
+    The path `-` writes to stdout.
+    """
+    if str(path).endswith(".gz"):
+        return gzip.open(str(path), "wt")
+    return click.open_file(str(path), "wt")
+
+
+def ordered_map(
+    executor: Executor, func: Callable, iterable: Iterable, *, max_pending: int
+) -> Iterator:
+    """
+    Like `executor.map(func, iterable)`, but only reads ahead `max_pending` items
+
+    Results are yielded in the order of the inputs.
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def map_in_processes(
+    func: Callable, iterable: Iterable, *, jobs: int, pending_per_job: int = None
+) -> Iterator:
+    """
+    Yields the results of `func` for each item (in order) from a pool of `jobs` processes
+
+    The items are processed in the current process if `jobs` is 1.
+    """
+    if pending_per_job is None:
+        pending_per_job = PENDING_ITEMS_PER_JOB
+    if jobs == 1:
+        yield from map(func, iterable)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from ordered_map(
+            executor, func, iterable, max_pending=jobs * pending_per_job
+        )
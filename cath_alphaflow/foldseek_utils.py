@@ -0,0 +1,490 @@
+"""
+Helpers for working with Foldseek databases on disk
+
+A Foldseek structure DB `<db>` is a set of MMseqs2-style databases that share the same
+entry keys: `<db>` (amino acids), `<db>_ss` (3Di), `<db>_h` (headers) and `<db>_ca`
+(C-alpha coordinates), plus the `<db>.lookup` (key, name, file id) and `<db>.source`
+(file id, file name) files that map the entries back to the input structure files.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import sqlite3
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cath_alphaflow.errors import ParseError
+
+LOG = logging.getLogger(__name__)
+
+# databases that make up a Foldseek structure DB (all share the same keys)
+FS_DB_PARTS = ["", "_ss", "_h", "_ca"]
+
+# files that make up each database
+FS_DB_PART_EXTENSIONS = ["", ".index", ".dbtype"]
+
+FS_CHECKSUMS_SUFFIX = ".checksums"
+
+# databases that define the structure of an entry (headers only contain the name)
+FS_DB_STRUCTURE_PARTS = ["", "_ss", "_ca"]
+
+# number of query hashes to look up in the result cache per SQL statement
+CACHE_LOOKUP_CHUNK_SIZE = 500
+
+
+@dataclass
+class FileChecksum:
+    """
+    Checksum of an input file (size / mtime are used to avoid recalculating the MD5)
+    """
+
+    filename: str
+    size: int
+    mtime_ns: int
+    md5: str
+
+    def to_line(self):
+        return f"{self.filename}\t{self.size}\t{self.mtime_ns}\t{self.md5}\n"
+
+    @classmethod
+    def from_line(cls, line: str):
+        filename, size, mtime_ns, md5 = line.rstrip("\n").split("\t")
+        return cls(filename=filename, size=int(size), mtime_ns=int(mtime_ns), md5=md5)
+
+
+@dataclass
+class IncrementalUpdatePlan:
+    """
+    Which input files need adding to an existing Foldseek DB (and which keys to drop)
+    """
+
+    new_paths: List[Path] = field(default_factory=list)
+    changed_paths: List[Path] = field(default_factory=list)
+    removed_filenames: List[str] = field(default_factory=list)
+    stale_keys: Set[int] = field(default_factory=set)
+    checksums: Dict[str, FileChecksum] = field(default_factory=dict)
+
+    @property
+    def paths_to_add(self):
+        return self.new_paths + self.changed_paths
+
+    @property
+    def is_empty(self):
+        return not self.paths_to_add and not self.removed_filenames
+
+
+def file_md5(path, *, chunk_size=1024 * 1024) -> str:
+    md5 = hashlib.md5()
+    with open(str(path), "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def get_file_checksum(path, *, previous: FileChecksum = None) -> FileChecksum:
+    """
+    Returns the checksum for `path` (reusing `previous` if the size and mtime match)
+    """
+    path = Path(path)
+    stat = path.stat()
+    if (
+        previous
+        and previous.size == stat.st_size
+        and previous.mtime_ns == stat.st_mtime_ns
+    ):
+        return previous
+    return FileChecksum(
+        filename=path.name,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        md5=file_md5(path),
+    )
+
+
+def fs_db_files(fs_db) -> List[Path]:
+    """
+    All the files that make up the Foldseek DB (that exist)
+    """
+    fs_db = str(fs_db)
+    paths = [
+        Path(f"{fs_db}{part}{ext}")
+        for part in FS_DB_PARTS
+        for ext in FS_DB_PART_EXTENSIONS
+    ]
+    paths += [Path(f"{fs_db}.lookup"), Path(f"{fs_db}.source")]
+    return [path for path in paths if path.exists()]
+
+
+def read_lookup(fs_db) -> List[tuple]:
+    """
+    Returns the `(key, name, file_id)` entries in the DB lookup file
+    """
+    entries = []
+    with open(f"{fs_db}.lookup", "rt") as fh:
+        for line in fh:
+            key, name, file_id = line.rstrip("\n").split("\t")
+            entries.append((int(key), name, int(file_id)))
+    return entries
+
+
+def read_source(fs_db) -> Dict[int, str]:
+    """
+    Returns the `{file_id: filename}` entries in the DB source file
+    """
+    source = {}
+    with open(f"{fs_db}.source", "rt") as fh:
+        for line in fh:
+            file_id, filename = line.rstrip("\n").split("\t", 1)
+            source[int(file_id)] = filename
+    return source
+
+
+def get_keys_by_filename(fs_db) -> Dict[str, Set[int]]:
+    """
+    Returns the DB entry keys for each input file in the DB
+    """
+    source = read_source(fs_db)
+    keys_by_filename = {}
+    for key, _name, file_id in read_lookup(fs_db):
+        filename = Path(source[file_id]).name
+        keys_by_filename.setdefault(filename, set()).add(key)
+    return keys_by_filename
+
+
+def read_db_index(db) -> Dict[int, Tuple[int, int]]:
+    """
+    Returns the `{key: (offset, length)}` entries in the index of an MMseqs2-style DB
+    """
+    index = {}
+    with open(f"{db}.index", "rt") as fh:
+        for line in fh:
+            key, offset, length = line.rstrip("\n").split("\t")
+            index[int(key)] = (int(offset), int(length))
+    return index
+
+
+def _db_data_paths(db) -> List[Path]:
+    """
+    Data files of the DB (split DBs are read as if the numbered files were concatenated)
+    """
+    if Path(db).exists():
+        return [Path(db)]
+    paths = []
+    while Path(f"{db}.{len(paths)}").exists():
+        paths.append(Path(f"{db}.{len(paths)}"))
+    if not paths:
+        raise FileNotFoundError(f"failed to find data file for DB {db}")
+    return paths
+
+
+def _read_db_data(db) -> bytes:
+    data_paths = _db_data_paths(db)
+    if len(data_paths) == 1:
+        with data_paths[0].open("rb") as fh:
+            if data_paths[0].stat().st_size == 0:
+                return b""
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    return b"".join(path.read_bytes() for path in data_paths)
+
+
+def get_entry_hashes(fs_db, *, parts=FS_DB_STRUCTURE_PARTS) -> Dict[int, str]:
+    """
+    Returns an MD5 of the structure (sequence, 3Di and C-alpha coordinates) of each DB entry
+
+    Entries with identical structures have the same hash, whatever they are called.
+    """
+    md5_by_key = {}
+    for part in parts:
+        db = f"{fs_db}{part}"
+        data = _read_db_data(db)
+        for key, (offset, length) in read_db_index(db).items():
+            if key not in md5_by_key:
+                md5_by_key[key] = hashlib.md5()
+            md5_by_key[key].update(data[offset : offset + length])
+    return {key: md5.hexdigest() for key, md5 in md5_by_key.items()}
+
+
+def get_db_fingerprint(fs_db) -> str:
+    """
+    Returns an MD5 of the index, type and lookup files of the DB
+
+    This identifies a (target) DB without reading all of its data.
+    """
+    fs_db = str(fs_db)
+    paths = [
+        path
+        for path in fs_db_files(fs_db)
+        if path.name.endswith((".index", ".dbtype", ".lookup"))
+    ]
+    if not paths:
+        raise ParseError(f"failed to find index files for Foldseek DB {fs_db}")
+    md5 = hashlib.md5()
+    for path in paths:
+        md5.update(path.name[len(Path(fs_db).name) :].encode("utf-8"))
+        md5.update(file_md5(path).encode("utf-8"))
+    return md5.hexdigest()
+
+
+def read_checksums(fs_db) -> Dict[str, FileChecksum]:
+    checksums_path = Path(f"{fs_db}{FS_CHECKSUMS_SUFFIX}")
+    if not checksums_path.exists():
+        return {}
+    with checksums_path.open("rt") as fh:
+        checksums = [FileChecksum.from_line(line) for line in fh if line.strip()]
+    return {checksum.filename: checksum for checksum in checksums}
+
+
+def write_checksums(fs_db, checksums: Dict[str, FileChecksum]):
+    checksums_path = Path(f"{fs_db}{FS_CHECKSUMS_SUFFIX}")
+    tmp_path = checksums_path.with_name(checksums_path.name + ".tmp")
+    with tmp_path.open("wt") as fh:
+        for filename in sorted(checksums):
+            fh.write(checksums[filename].to_line())
+    os.replace(tmp_path, checksums_path)
+
+
+def plan_incremental_update(fs_db, cif_paths, *, cif_dir=None) -> IncrementalUpdatePlan:
+    """
+    Works out which of `cif_paths` need to be added to the existing DB `fs_db`
+
+    Files are new if they are not in the DB lookup. Files already in the DB are
+    changed if their MD5 differs from the checksum recorded when they were added
+    (MD5s are only recalculated when the file size or mtime has changed). If `cif_dir`
+    is set, files in the DB that no longer exist in `cif_dir` are removed. The DB
+    entries of changed and removed files are stale and should be removed.
+    """
+    keys_by_filename = get_keys_by_filename(fs_db)
+    previous_checksums = read_checksums(fs_db)
+
+    plan = IncrementalUpdatePlan(checksums=dict(previous_checksums))
+    for cif_path in cif_paths:
+        cif_path = Path(cif_path)
+        filename = cif_path.name
+        previous = previous_checksums.get(filename)
+        checksum = get_file_checksum(cif_path, previous=previous)
+        plan.checksums[filename] = checksum
+
+        if filename not in keys_by_filename:
+            plan.new_paths.append(cif_path)
+        elif previous and previous.md5 != checksum.md5:
+            plan.changed_paths.append(cif_path)
+            plan.stale_keys.update(keys_by_filename[filename])
+        # files in the DB without a recorded checksum are assumed to be current
+
+    if cif_dir is not None:
+        # the directory is listed once (rather than checking each file)
+        with os.scandir(cif_dir) as entries:
+            existing_names = {entry.name for entry in entries}
+        for filename in sorted(set(keys_by_filename) - existing_names):
+            plan.removed_filenames.append(filename)
+            plan.stale_keys.update(keys_by_filename[filename])
+            plan.checksums.pop(filename, None)
+
+    return plan
+
+
+def run_foldseek_command(fs_bin_path, *args, log_path=None):
+    """
+    Runs a Foldseek command
+
+    The output (stdout and stderr) is appended to `log_path` if set, otherwise it is
+    passed through to the caller's stdout / stderr.
+    """
+    cmd = [str(fs_bin_path), *[str(arg) for arg in args]]
+    LOG.info(f"Running: {' '.join(cmd)}")
+    if log_path is None:
+        subprocess.run(cmd, check=True)
+        return
+    with open(str(log_path), "at") as log_fh:
+        log_fh.write(f"# {' '.join(cmd)}\n")
+        log_fh.flush()
+        subprocess.run(cmd, stdout=log_fh, stderr=subprocess.STDOUT, check=True)
+
+
+def create_sub_db(fs_bin_path, keys, in_db, out_db, *, tmp_dir, log_path=None):
+    """
+    Creates `out_db` containing just the entries of `in_db` with the given keys
+
+    The data is always copied (`--subdb-mode 0`) rather than soft-linked to `in_db`,
+    so `out_db` stays valid if `in_db` is later replaced or removed.
+    """
+    keys_path = Path(tmp_dir) / "subdb_keys.txt"
+    with keys_path.open("wt") as fh:
+        for key in sorted(keys):
+            fh.write(f"{key}\n")
+    for part in FS_DB_PARTS:
+        run_foldseek_command(
+            fs_bin_path,
+            "createsubdb",
+            keys_path,
+            f"{in_db}{part}",
+            f"{out_db}{part}",
+            "--subdb-mode",
+            "0",
+            log_path=log_path,
+        )
+
+    # createsubdb does not subset the lookup / source files
+    keys = set(keys)
+    with open(f"{out_db}.lookup", "wt") as fh:
+        for key, name, file_id in read_lookup(in_db):
+            if key in keys:
+                fh.write(f"{key}\t{name}\t{file_id}\n")
+    shutil.copyfile(f"{in_db}.source", f"{out_db}.source")
+
+
+def split_keys_into_shards(keys, shard_count) -> List[List[int]]:
+    """
+    Splits the sorted keys into `shard_count` contiguous shards of (nearly) equal size
+    """
+    keys = sorted(keys)
+    shard_size, remainder = divmod(len(keys), shard_count)
+    shards = []
+    start = 0
+    for shard_num in range(shard_count):
+        end = start + shard_size + (1 if shard_num < remainder else 0)
+        shards.append(keys[start:end])
+        start = end
+    return shards
+
+
+def concat_dbs(fs_bin_path, db_a, db_b, out_db):
+    """
+    Concatenates Foldseek DBs `db_a` and `db_b` into `out_db`
+
+    The keys of `db_a` are kept and the keys of `db_b` are offset to follow them (as
+    `concatdbs` does), the lookup and source files are merged to match.
+    """
+    for part in FS_DB_PARTS:
+        run_foldseek_command(
+            fs_bin_path,
+            "concatdbs",
+            f"{db_a}{part}",
+            f"{db_b}{part}",
+            f"{out_db}{part}",
+        )
+
+    lookup_a = read_lookup(db_a)
+    source_a = read_source(db_a)
+    key_offset = max([key for key, _, _ in lookup_a], default=-1) + 1
+    file_id_offset = max(source_a.keys(), default=-1) + 1
+
+    with open(f"{out_db}.lookup", "wt") as fh:
+        for key, name, file_id in lookup_a:
+            fh.write(f"{key}\t{name}\t{file_id}\n")
+        for key, name, file_id in read_lookup(db_b):
+            fh.write(f"{key + key_offset}\t{name}\t{file_id + file_id_offset}\n")
+
+    with open(f"{out_db}.source", "wt") as fh:
+        for file_id, filename in source_a.items():
+            fh.write(f"{file_id}\t{filename}\n")
+        for file_id, filename in read_source(db_b).items():
+            fh.write(f"{file_id + file_id_offset}\t{filename}\n")
+
+
+def replace_db(src_db, dest_db):
+    """
+    Moves all the files of Foldseek DB `src_db` to `dest_db` (replacing existing files)
+
+    Any symlinks in `src_db` (e.g. from `createsubdb`) are replaced by copies of the
+    files they point to first, as those may be the files of `dest_db` being removed.
+    """
+    src_db = str(src_db)
+    for src_path in fs_db_files(src_db):
+        if src_path.is_symlink():
+            target_path = src_path.resolve()
+            tmp_path = Path(f"{src_path}.tmp")
+            shutil.copyfile(str(target_path), str(tmp_path))
+            os.replace(str(tmp_path), str(src_path))
+    for dest_path in fs_db_files(dest_db):
+        dest_path.unlink()
+    for src_path in fs_db_files(src_db):
+        dest_path = Path(str(dest_db) + str(src_path)[len(src_db) :])
+        shutil.move(str(src_path), str(dest_path))
+
+
+class FoldseekResultCache:
+    """
+    Persistent (SQLite) cache of the Foldseek hits for each query structure
+
+    Hits are stored by query structure hash (see `get_entry_hashes`) for a given target
+    DB fingerprint and search parameters. The query column is removed from the stored
+    m8 rows (and added back when writing results) so the hits can be reused for
+    identical structures with different names. Queries without any hits are stored
+    with no rows.
+    """
+
+    def __init__(self, path, *, target_fingerprint: str, params_hash: str):
+        self.path = str(path)
+        self.target_fingerprint = target_fingerprint
+        self.params_hash = params_hash
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS foldseek_hits ("
+            "query_hash TEXT NOT NULL, "
+            "target_fingerprint TEXT NOT NULL, "
+            "params_hash TEXT NOT NULL, "
+            "hits TEXT NOT NULL, "
+            "PRIMARY KEY (query_hash, target_fingerprint, params_hash)"
+            ") WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def cached_hashes(self, query_hashes: Iterable[str]) -> Set[str]:
+        """
+        Returns the query hashes that have results in the cache
+        """
+        query_hashes = list(query_hashes)
+        cached = set()
+        for idx in range(0, len(query_hashes), CACHE_LOOKUP_CHUNK_SIZE):
+            chunk = query_hashes[idx : idx + CACHE_LOOKUP_CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self.conn.execute(
+                "SELECT query_hash FROM foldseek_hits "
+                "WHERE target_fingerprint = ? AND params_hash = ? "
+                f"AND query_hash IN ({placeholders})",
+                [self.target_fingerprint, self.params_hash, *chunk],
+            )
+            cached.update(row[0] for row in cursor)
+        return cached
+
+    def get(self, query_hash: str) -> Optional[List[str]]:
+        """
+        Returns the cached m8 rows (without the query column), or None if not cached
+        """
+        row = self.conn.execute(
+            "SELECT hits FROM foldseek_hits "
+            "WHERE query_hash = ? AND target_fingerprint = ? AND params_hash = ?",
+            [query_hash, self.target_fingerprint, self.params_hash],
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0].split("\n") if row[0] else []
+
+    def add_many(self, hits_by_hash: Iterable[Tuple[str, List[str]]]):
+        """
+        Adds (or replaces) the m8 rows (without the query column) for each query hash
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO foldseek_hits "
+            "(query_hash, target_fingerprint, params_hash, hits) VALUES (?, ?, ?, ?)",
+            (
+                (query_hash, self.target_fingerprint, self.params_hash, "\n".join(rows))
+                for query_hash, rows in hits_by_hash
+            ),
+        )
+        self.conn.commit()
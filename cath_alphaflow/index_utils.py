@@ -0,0 +1,407 @@
+"""
+Compact on-disk indexes that can be memory-mapped and searched without parsing
+the (potentially multi-GB) source files they describe
+"""
+
+import itertools
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Iterable, List, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from .errors import ParseError
+
+LOG = logging.getLogger(__name__)
+
+INDEX_META_FILENAME = "meta.json"
+
+MD5_DIGEST_DTYPE = "S16"
+
+DEFAULT_GATHER_CHUNK_SIZE = 1000000
+
+UINT64_MASK = (1 << 64) - 1
+
+CRH_OFFSET_DTYPE = np.dtype([("md5", MD5_DIGEST_DTYPE), ("offset", "<u8")])
+
+
+def md5_to_digest(md5: str) -> bytes:
+    """Convert a hex MD5 string into its 16 byte binary digest"""
+    try:
+        return bytes.fromhex(md5)
+    except ValueError:
+        raise ParseError(f"failed to parse '{md5}' as hex MD5")
+
+
+def digest_to_md5(digest: bytes) -> str:
+    """Convert a 16 byte binary digest back to a hex MD5 string"""
+    return bytes(digest).ljust(16, b"\0").hex()
+
+
+def get_file_signature(path) -> dict:
+    """Cheap signature (size, mtime) used to decide whether an index is stale"""
+    stat = os.stat(str(path))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_index_meta(index_dir, **meta):
+    meta_path = Path(index_dir) / INDEX_META_FILENAME
+    with meta_path.open("wt") as fh:
+        json.dump(meta, fh, indent=2)
+
+
+def read_index_meta(index_dir) -> dict:
+    meta_path = Path(index_dir) / INDEX_META_FILENAME
+    if not meta_path.exists():
+        return None
+    with meta_path.open("rt") as fh:
+        return json.load(fh)
+
+
+def index_is_current(index_dir, source_path, *, index_type: str) -> bool:
+    """
+    Returns whether the index in `index_dir` was built from the current version of `source_path`
+    """
+    meta = read_index_meta(index_dir)
+    if not meta:
+        return False
+    if meta.get("index_type") != index_type:
+        return False
+    return meta.get("source") == get_file_signature(source_path)
+
+
+def searchsorted_range(sorted_values: np.ndarray, key) -> Tuple[int, int]:
+    """
+    Returns the (start, end) slice of `sorted_values` that matches `key` (binary search)
+    """
+    lo = int(np.searchsorted(sorted_values, key, side="left"))
+    hi = int(np.searchsorted(sorted_values, key, side="right"))
+    return lo, hi
+
+
+def get_md5_from_crh_line_func(*, delimiter: bytes, column: int) -> Callable:
+    """
+    Returns a function that extracts the sequence MD5 from a raw (bytes) CRH line
+    """
+
+    def md5_from_crh_line(line: bytes) -> str:
+        cols = line.split(delimiter, column + 1)
+        return cols[column].strip().strip(b'"').decode("ascii")
+
+    return md5_from_crh_line
+
+
+class CrhOffsetIndex:
+    """
+    Byte-offset index of the rows in a CRH file, keyed by sequence MD5
+
+    The index is stored as a directory containing a sorted array of (md5 digest, offset)
+    records (`offsets.npy`) and a small metadata file. The array is memory-mapped on load,
+    so looking up the rows for a set of MD5s is a binary search rather than a scan of
+    the CRH file.
+
+    Typical usage example:
+
+        index = CrhOffsetIndex.load_or_build(
+            crh_path, index_dir, md5_from_line=md5_from_crh_line
+        )
+        for crh_line in index.yield_lines(["000122ad8c8fccfd2991bbd4a138d3c6"]):
+            ...
+    """
+
+    INDEX_TYPE = "crh_offsets"
+    OFFSETS_FILENAME = "offsets.npy"
+
+    def __init__(self, crh_path, records: np.ndarray):
+        self.crh_path = Path(str(crh_path))
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def load_or_build(cls, crh_path, index_dir, *, md5_from_line: Callable):
+        index_dir = Path(str(index_dir))
+        if index_is_current(index_dir, crh_path, index_type=cls.INDEX_TYPE):
+            LOG.info(f"Loading CRH offset index {index_dir}")
+            return cls.load(crh_path, index_dir)
+
+        LOG.info(f"Building CRH offset index {index_dir} (from {crh_path})")
+        return cls.build(crh_path, index_dir, md5_from_line=md5_from_line)
+
+    @classmethod
+    def load(cls, crh_path, index_dir):
+        records = np.load(str(Path(index_dir) / cls.OFFSETS_FILENAME), mmap_mode="r")
+        return cls(crh_path, records)
+
+    @classmethod
+    def build(cls, crh_path, index_dir, *, md5_from_line: Callable):
+        index_dir = Path(str(index_dir))
+        index_dir.mkdir(parents=True, exist_ok=True)
+
+        digests = bytearray()
+        offsets = []
+        offset = 0
+        with open(str(crh_path), "rb") as fh:
+            for line in fh:
+                if line.strip():
+                    digests += md5_to_digest(md5_from_line(line))
+                    offsets.append(offset)
+                offset += len(line)
+
+        records = np.empty(len(offsets), dtype=CRH_OFFSET_DTYPE)
+        records["md5"] = np.frombuffer(bytes(digests), dtype=MD5_DIGEST_DTYPE)
+        records["offset"] = np.asarray(offsets, dtype="<u8")
+        records.sort(order=["md5", "offset"], kind="stable")
+
+        np.save(str(index_dir / cls.OFFSETS_FILENAME), records)
+        write_index_meta(
+            index_dir,
+            index_type=cls.INDEX_TYPE,
+            source=get_file_signature(crh_path),
+            count=len(records),
+        )
+        LOG.info(f"Built CRH offset index with {len(records)} rows")
+
+        return cls.load(crh_path, index_dir)
+
+    def offsets_for_md5(self, md5: str) -> List[int]:
+        digest = np.array(md5_to_digest(md5), dtype=MD5_DIGEST_DTYPE)
+        lo, hi = searchsorted_range(self.records["md5"], digest)
+        return [int(offset) for offset in self.records["offset"][lo:hi]]
+
+    def yield_lines(self, md5s: Iterable[str]):
+        """
+        Yields the raw CRH lines (str) for the given MD5s in the order they appear in the file
+        """
+        offsets = set()
+        for md5 in md5s:
+            offsets.update(self.offsets_for_md5(md5))
+
+        with open(str(self.crh_path), "rb") as fh:
+            for offset in sorted(offsets):
+                fh.seek(offset)
+                yield fh.readline().decode("utf-8")
+
+
+class Md5AfUniprotLookup:
+    """
+    Compact lookup of sequence MD5 -> (AF chain id, UniProt id)
+
+    Built once from the AF / UniProt / MD5 file (`af_chain_id  uniprot_id  sequence_md5`)
+    into a directory of parallel arrays:
+
+    - `md5.npy` - sorted 16 byte MD5 digests
+    - `af_id.npy`, `uniprot_id.npy` - fixed-width ids in the same order as the digests
+    - `uniprot_id_sorted.npy`, `uniprot_order.npy` - UniProt ids in sorted order and the
+      permutation that maps them back to rows
+
+    All arrays are memory-mapped on load and searched by binary search, so even the full
+    AFDB mapping (~214M rows) loads instantly and only needs ~50 bytes per row on disk.
+
+    If `lookup_dir` is not given the arrays are built in a temporary directory that is
+    removed along with this object.
+    """
+
+    INDEX_TYPE = "md5_af_uniprot"
+    HEADER_FIRST_COL = "af_chain_id"
+
+    def __init__(self, lookup_dir, *, tmp_dir=None):
+        lookup_dir = Path(str(lookup_dir))
+        self.lookup_dir = lookup_dir
+        self._tmp_dir = tmp_dir
+        self.md5 = np.load(str(lookup_dir / "md5.npy"), mmap_mode="r")
+        self.af_id = np.load(str(lookup_dir / "af_id.npy"), mmap_mode="r")
+        self.uniprot_id = np.load(str(lookup_dir / "uniprot_id.npy"), mmap_mode="r")
+        self.uniprot_order = np.load(
+            str(lookup_dir / "uniprot_order.npy"), mmap_mode="r"
+        )
+        self.uniprot_id_sorted = np.load(
+            str(lookup_dir / "uniprot_id_sorted.npy"), mmap_mode="r"
+        )
+
+    def __del__(self):
+        if getattr(self, "_tmp_dir", None):
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def __len__(self):
+        return len(self.md5)
+
+    def __contains__(self, md5: str):
+        lo, hi = self._md5_range(md5)
+        return hi > lo
+
+    @classmethod
+    def load_or_build(cls, source_path, lookup_dir=None):
+        if lookup_dir is None:
+            tmp_dir = tempfile.mkdtemp(prefix="af_md5_lookup_")
+            cls.build(source_path, tmp_dir)
+            return cls(tmp_dir, tmp_dir=tmp_dir)
+
+        if index_is_current(lookup_dir, source_path, index_type=cls.INDEX_TYPE):
+            LOG.info(f"Loading MD5 lookup {lookup_dir}")
+        else:
+            cls.build(source_path, lookup_dir)
+        return cls(lookup_dir)
+
+    @classmethod
+    def yield_rows(cls, source_path):
+        with open(str(source_path), "rt") as fh:
+            for line in fh:
+                cols = line.split()
+                if not cols or cols[0] == cls.HEADER_FIRST_COL:
+                    continue
+                if len(cols) != 3:
+                    msg = (
+                        f"expected 3 columns (af_id, uniprot_id, md5) in line '{line}'"
+                    )
+                    raise ParseError(msg)
+                yield cols
+
+    @classmethod
+    def build(cls, source_path, lookup_dir, *, chunk_size=DEFAULT_GATHER_CHUNK_SIZE):
+        """
+        Builds the lookup in two passes over `source_path` (sizes, then values)
+
+        Values are written to memory-mapped arrays on disk, so only the MD5 digests
+        (and their sort order) need to be held in memory while building.
+        """
+        LOG.info(f"Building MD5 lookup {lookup_dir} (from {source_path})")
+        lookup_dir = Path(str(lookup_dir))
+        lookup_dir.mkdir(parents=True, exist_ok=True)
+
+        row_count = af_id_width = uniprot_id_width = 0
+        for af_id, uniprot_id, _md5 in cls.yield_rows(source_path):
+            row_count += 1
+            af_id_width = max(af_id_width, len(af_id))
+            uniprot_id_width = max(uniprot_id_width, len(uniprot_id))
+
+        def new_array(name, dtype):
+            return open_memmap(
+                str(lookup_dir / name), mode="w+", dtype=dtype, shape=(row_count,)
+            )
+
+        af_id_dtype = f"S{max(af_id_width, 1)}"
+        uniprot_id_dtype = f"S{max(uniprot_id_width, 1)}"
+        md5s = np.empty(row_count, dtype=MD5_DIGEST_DTYPE)
+        unsorted_af_ids = new_array("af_id.unsorted.npy", af_id_dtype)
+        unsorted_uniprot_ids = new_array("uniprot_id.unsorted.npy", uniprot_id_dtype)
+        for idx, (af_id, uniprot_id, md5) in enumerate(cls.yield_rows(source_path)):
+            md5s[idx] = md5_to_digest(md5)
+            unsorted_af_ids[idx] = af_id.encode("ascii")
+            unsorted_uniprot_ids[idx] = uniprot_id.encode("ascii")
+
+        def gather(src, order, name):
+            dest = new_array(name, src.dtype)
+            for start in range(0, row_count, chunk_size):
+                dest[start : start + chunk_size] = src[
+                    order[start : start + chunk_size]
+                ]
+            dest.flush()
+            return dest
+
+        md5_order = np.argsort(md5s, kind="stable")
+        np.save(str(lookup_dir / "md5.npy"), md5s[md5_order])
+        del md5s
+        gather(unsorted_af_ids, md5_order, "af_id.npy")
+        uniprot_ids = gather(unsorted_uniprot_ids, md5_order, "uniprot_id.npy")
+        del md5_order, unsorted_af_ids, unsorted_uniprot_ids
+        (lookup_dir / "af_id.unsorted.npy").unlink()
+        (lookup_dir / "uniprot_id.unsorted.npy").unlink()
+
+        uniprot_order = np.argsort(uniprot_ids, kind="stable")
+        np.save(str(lookup_dir / "uniprot_order.npy"), uniprot_order)
+        gather(uniprot_ids, uniprot_order, "uniprot_id_sorted.npy")
+
+        write_index_meta(
+            lookup_dir,
+            index_type=cls.INDEX_TYPE,
+            source=get_file_signature(source_path),
+            count=row_count,
+        )
+        LOG.info(f"Built MD5 lookup with {row_count} rows")
+
+    def _md5_range(self, md5: str):
+        digest = np.array(md5_to_digest(md5), dtype=MD5_DIGEST_DTYPE)
+        return searchsorted_range(self.md5, digest)
+
+    def entries_for_md5(self, md5: str) -> List[Tuple[str, str]]:
+        """
+        Returns the (af_id, uniprot_id) entries for the given MD5 (in input order)
+        """
+        lo, hi = self._md5_range(md5)
+        return [
+            (self.af_id[idx].decode("ascii"), self.uniprot_id[idx].decode("ascii"))
+            for idx in range(lo, hi)
+        ]
+
+    def md5s_for_uniprot(self, uniprot_id: str) -> List[str]:
+        """
+        Returns the sequence MD5s for the given UniProt id
+        """
+        key = uniprot_id.encode("ascii")
+        if len(key) > self.uniprot_id.dtype.itemsize:
+            return []
+        key = np.array(key, dtype=self.uniprot_id.dtype)
+        lo, hi = searchsorted_range(self.uniprot_id_sorted, key)
+        return [digest_to_md5(self.md5[idx]) for idx in self.uniprot_order[lo:hi]]
+
+
+class Md5BloomFilter:
+    """
+    Bloom filter of sequence MD5s
+
+    A compact alternative to a `set` of MD5 strings when the set is too large to hold
+    in memory (~1.2 bytes per MD5 at a 1e-3 false positive rate). Membership tests
+    may return false positives (at roughly `error_rate`) but never false negatives.
+
+    The MD5 digest is already uniformly distributed, so the two halves of the digest
+    are used directly as the hashes for double hashing (no extra hashing needed).
+    """
+
+    def __init__(self, capacity: int, *, error_rate: float = 1e-3):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1 (got {error_rate})")
+        capacity = max(int(capacity), 1)
+        self.bit_count = int(
+            math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        )
+        self.hash_count = max(1, int(round(self.bit_count / capacity * math.log(2))))
+        self.bits = np.zeros((self.bit_count + 7) // 8, dtype=np.uint8)
+        self._bits_view = memoryview(self.bits)
+
+    def add_many(self, md5s: Iterable[str], *, chunk_size=DEFAULT_GATHER_CHUNK_SIZE):
+        md5s = iter(md5s)
+        while True:
+            chunk = list(itertools.islice(md5s, chunk_size))
+            if not chunk:
+                break
+            digests = np.frombuffer(
+                b"".join(md5_to_digest(md5) for md5 in chunk), dtype="<u8"
+            ).reshape(-1, 2)
+            h1, h2 = digests[:, 0], digests[:, 1]
+            for hash_num in range(self.hash_count):
+                # uint64 arithmetic wraps, matching the masking in `_positions`
+                positions = (h1 + np.uint64(hash_num) * h2) % np.uint64(self.bit_count)
+                np.bitwise_or.at(
+                    self.bits,
+                    positions >> np.uint64(3),
+                    np.left_shift(1, positions & np.uint64(7)).astype(np.uint8),
+                )
+
+    def _positions(self, md5: str):
+        digest = md5_to_digest(md5)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little")
+        for hash_num in range(self.hash_count):
+            yield ((h1 + hash_num * h2) & UINT64_MASK) % self.bit_count
+
+    def __contains__(self, md5: str):
+        bits = self._bits_view
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(md5))
@@ -3,6 +3,7 @@ import gzip
 import logging
 from pathlib import Path
 import itertools
+import sys
 from typing import List, Type
 import dataclasses
 
@@ -18,7 +19,8 @@ from .models.domains import Gene3DCrh
 from .models.domains import StatusLog
 from .models.domains import RE_UNIPROT_ID
 from .models.domains import FoldseekSummary
-from .errors import CsvHeaderError
+from .errors import CsvHeaderError, ParseError
+from .profiling import STAGE_PARSE, timed
 
 LOG = logging.getLogger(__name__)
 
@@ -113,8 +115,19 @@ class StatusLogReader(CsvReaderBase):
     object_class = StatusLog
 
 
-def get_status_log_dictwriter(csvfile, **kwargs):
-    fieldnames = ["entry_id", "status", "error", "description"]
+STATUS_LOG_FIELDNAMES = ["entry_id", "status", "error", "description"]
+
+# optional per-entry metrics (e.g. to find the entries that are slow to process)
+STATUS_LOG_METRICS_FIELDNAMES = ["elapsed_seconds", "input_bytes", "residue_count"]
+
+
+def get_status_log_dictwriter(csvfile, *, metrics=False, **kwargs):
+    """
+    Status log writer (metrics in the rows are only written if `metrics` is set)
+    """
+    fieldnames = STATUS_LOG_FIELDNAMES
+    if metrics:
+        fieldnames = fieldnames + STATUS_LOG_METRICS_FIELDNAMES
     writer = get_csv_dictwriter(csvfile, fieldnames=fieldnames, **kwargs)
     writer.writeheader()
     return writer
@@ -166,7 +179,10 @@ class UniprotIDReader(CsvReaderBase):
         return {"uniprot_id": uniprot_id}
 
 
-def get_csv_dictwriter(csvfile, fieldnames, delimiter="\t", **kwargs):
+CSV_DELIMITER = "\t"
+
+
+def get_csv_dictwriter(csvfile, fieldnames, delimiter=CSV_DELIMITER, **kwargs):
     """Common CSV writer"""
     return csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=delimiter, **kwargs)
 
@@ -193,47 +209,65 @@ def get_sse_summary_reader(csvfile):
     return reader
 
 
+FOLDSEEK_FIELDNAMES = [
+    "query",
+    "target",
+    "qstart",
+    "qend",
+    "qlen",
+    "tstart",
+    "tend",
+    "tlen",
+    "qcov",
+    "tcov",
+    "bits",
+    "evalue",
+]
+
+
 def get_foldseek_reader(csvfile):
-    foldseek_fieldnames = [
-        "query",
-        "target",
-        "qstart",
-        "qend",
-        "qlen",
-        "tstart",
-        "tend",
-        "tlen",
-        "qcov",
-        "tcov",
-        "bits",
-        "evalue",
-    ]
-    foldseek_reader = get_csv_dictreader(csvfile, fieldnames=foldseek_fieldnames)
+    foldseek_reader = get_csv_dictreader(csvfile, fieldnames=FOLDSEEK_FIELDNAMES)
     return foldseek_reader
 
 
 def get_foldseek_summary_writer(csvfile):
     writer = get_csv_dictwriter(
         csvfile,
-        fieldnames=[
-            "query",
-            "target",
-            "qstart",
-            "qend",
-            "qlen",
-            "tstart",
-            "tend",
-            "tlen",
-            "qcov",
-            "tcov",
-            "bits",
-            "evalue",
-        ],
+        fieldnames=FOLDSEEK_FIELDNAMES,
+    )
+    writer.writeheader()
+    return writer
+
+
+def get_foldseek_ranked_hits_writer(csvfile):
+    writer = get_csv_dictwriter(
+        csvfile,
+        fieldnames=[*FOLDSEEK_FIELDNAMES, "superfamily", "rank"],
     )
     writer.writeheader()
     return writer
 
 
+def get_cath_domain_superfamily_lookup(cath_domain_list_fh):
+    """
+    Returns a `dict` of CATH domain id to superfamily from a CATH domain list file
+
+    CathDomainList format: domain id followed by the C, A, T, H numbers (then
+    cluster numbers, domain length and resolution); lines starting '#' are comments.
+    Superfamily ids are interned so each one is only stored once.
+    """
+    superfamily_by_domain = {}
+    for line in cath_domain_list_fh:
+        if line.startswith("#") or not line.strip():
+            continue
+        cols = line.split()
+        if len(cols) < 5:
+            msg = f"failed to parse CATH domain list line '{line.rstrip()}'"
+            raise ParseError(msg)
+        superfamily_by_domain[cols[0]] = sys.intern(".".join(cols[1:5]))
+    return superfamily_by_domain
+
+
 def get_sse_summary_writer(csvfile):
     writer = get_csv_dictwriter(
         csvfile,
@@ -251,16 +285,17 @@ def get_sse_summary_writer(csvfile):
     return writer
 
 
-def get_af_uniprot_md5_summary_writer(csvfile):
-    writer = get_csv_dictwriter(
-        csvfile,
-        fieldnames=[
-            "af_chain_id",
-            "uniprot_id",
-            "sequence_md5",
-        ],
-    )
-    writer.writeheader()
+AF_UNIPROT_MD5_FIELDNAMES = [
+    "af_chain_id",
+    "uniprot_id",
+    "sequence_md5",
+]
+
+
+def get_af_uniprot_md5_summary_writer(csvfile, *, header=True):
+    writer = get_csv_dictwriter(csvfile, fieldnames=AF_UNIPROT_MD5_FIELDNAMES)
+    if header:
+        writer.writeheader()
     return writer
 
 
@@ -288,6 +323,17 @@ def yield_first_col(infile, *, header=True):
         yield first_col
 
 
+def count_lines(path, *, chunk_size=1024 * 1024):
+    """
+    Counts the lines in a file (without decoding or splitting the contents)
+    """
+    count = 0
+    with open(str(path), "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
 def get_af_domain_id_reader(csvfile):
     reader = AFDomainIDReader(csvfile)
     return reader
@@ -312,6 +358,7 @@ def chunked_iterable(iterable, *, chunk_size):
         yield chunk
 
 
+@timed(STAGE_PARSE)
 def get_pdb_structure(
     model_id,
     chain_pdb_dir,
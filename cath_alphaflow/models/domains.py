@@ -123,6 +123,9 @@ class StatusLog:
     status: str
     error: str
     description: str
+    elapsed_seconds: float = None
+    input_bytes: int = None
+    residue_count: int = None
 
 
 class PredictedCathDomain(BaseModel):
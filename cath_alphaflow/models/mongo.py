@@ -34,7 +34,9 @@ class AFFile(BaseModel):  # pragma: no cover
     afVersion: int = Field(..., description="AlphaFold version number, e.g. 4")
     fragNum: int = Field(..., description="AlphaFold model fragment number, e.g. 1")
     uniprotAccession: str = Field(..., description="UniProt accession, e.g. 'P00520'")
-    contents: str = Field(..., description="File contents")
+    contents: Optional[str] = Field(
+        None, description="File contents (if stored as text)"
+    )
     uniprot_summary: UniprotSummary = Field(
         ..., description="UniProt Summary (3D Beacons)"
     )
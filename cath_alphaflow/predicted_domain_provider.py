@@ -2,17 +2,47 @@
 Classes to generate `PredictedCathDomain` objects from databases or files
 """
 
+import functools
+import io
 import logging
-
-import pydantic
-from io import TextIOWrapper
+import os
+from operator import itemgetter
 
 from cath_alphaflow.models.domains import PredictedCathDomain
 from cath_alphaflow.io_utils import DecoratedCrhReader, Gene3DCrhReader
-from cath_alphaflow.errors import NoMatchingMd5Error
+from cath_alphaflow.index_utils import (
+    CrhOffsetIndex,
+    Md5AfUniprotLookup,
+    get_md5_from_crh_line_func,
+)
+from cath_alphaflow.sort_utils import (
+    DEFAULT_SORT_BUFFER_ROWS,
+    external_sort,
+    merge_join,
+    unique_rows,
+)
+from cath_alphaflow.errors import ArgumentError, NoMatchingMd5Error
 
 LOG = logging.getLogger()
 
+# most sorts that hold a buffer in memory at the same time in a sort / merge join
+# (the UniProt ids and AF / UniProt / MD5 rows while the requested AF rows are sorted)
+SORTS_IN_MEMORY = 3
+
+
+def get_regular_file_path(file_or_path, description) -> str:
+    """
+    Returns the path of a file (or `click.File`) that can be reopened and read again
+
+    Lookups and indexes are built from the path (in several passes), so inputs such as
+    stdin or pipes are rejected.
+    """
+    path = getattr(file_or_path, "name", file_or_path)
+    if not os.path.isfile(str(path)):
+        msg = f"expected {description} to be a regular file (not '{path}')"
+        raise ArgumentError(msg)
+    return str(path)
+
 
 class PredictedCathDomainProviderBase:
     """
@@ -36,12 +66,6 @@ class PredictedCathDomainProviderBase:
         raise NotImplementedError
 
 
-class AfMd5Uniprot(pydantic.BaseModel):
-    af_id: str
-    md5: str
-    uniprot_id: str
-
-
 class OraclePredictedCathDomainProvider(PredictedCathDomainProviderBase):
     """
     Provides datasets from Oracle database
@@ -116,41 +140,103 @@ class OraclePredictedCathDomainProvider(PredictedCathDomainProviderBase):
             entry = PredictedCathDomain(**rowdict)
             yield entry
 
+    def next_uniprot_accession(
+        self,
+        *,
+        dbname,
+        max_independent_evalue=None,
+        max_records=None,
+        arraysize=None,
+    ) -> str:
+        """
+        Returns a generator that provides the unique UniProt accessions with predicted domains
+
+        Accessions are grouped on the server (so each one is only sent once) and, if
+        `max_records` is set, the accessions with the best (lowest) independent evalue
+        are returned first.
+        """
+
+        sql_args = {}
+        sql_where = ""
+        if max_independent_evalue:
+            sql_args.update({"max_independent_evalue": max_independent_evalue})
+            sql_where = "WHERE INDEPENDENT_EVALUE <= :max_independent_evalue"
+
+        sql = f"""
+    SELECT
+        upa.ACCESSION                           AS uniprot_acc,
+        MIN(INDEPENDENT_EVALUE)                 AS min_indp_evalue
+    FROM
+        {dbname}.CATH_DOMAIN_PREDICTIONS cdp
+        INNER JOIN {dbname}.UNIPROT_PRIM_ACC upa
+            ON (cdp.SEQUENCE_MD5 = upa.SEQUENCE_MD5)
+    {sql_where}
+    GROUP BY
+        upa.ACCESSION
+    """
+
+        # only sort when we need the top N (allows the server to use a top-N sort)
+        if max_records:
+            sql_args.update({"max_records": max_records})
+            sql = f"""
+    SELECT * FROM (
+        {sql}
+        ORDER BY
+            min_indp_evalue ASC, uniprot_acc ASC
+    )
+    WHERE ROWNUM <= :max_records
+    """
+
+        # the query should already be unique, but make sure (bytes are more compact than str)
+        seen_accessions = set()
+        for rowdict in self.yieldall(
+            sql, sql_args, return_type=dict, arraysize=arraysize
+        ):
+            uniprot_acc = rowdict["uniprot_acc"]
+            key = uniprot_acc.encode("ascii")
+            if key in seen_accessions:
+                continue
+            seen_accessions.add(key)
+            yield uniprot_acc
+
 
 class CrhPredictedCathDomainProviderBase(PredictedCathDomainProviderBase):
     """
     Provides datasets from CRH files ("original" or "decorated")
     """
 
-    def __init__(self, *args, af_uniprot_md5_file, **kwargs):
+    def __init__(self, *args, af_uniprot_md5_file, lookup_path=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.af_uniprot_md5_file = af_uniprot_md5_file
+        self.lookup_path = lookup_path
         self.md5_to_af_md5_uniprot_mapping = None
+        self.datasource_scanned = False
 
     def get_datasource_reader(self):
         raise NotImplementedError
 
+    def rewind_datasource(self):
+        """
+        Moves the datasource back to the start (the CRH file is scanned for each chunk)
+        """
+        if self.datasource_scanned:
+            if not self.datasource.seekable():
+                msg = (
+                    f"cannot rescan CRH datasource {self.datasource.name} "
+                    "(use a regular file, or a single chunk of UniProt ids)"
+                )
+                raise ValueError(msg)
+            self.datasource.seek(0)
+        self.datasource_scanned = True
+
     def build_md5_to_af_md5_uniprot_mapping(self):
-        md5_to_af_md5_uniprot_mapping = dict()
-        LOG.info(f"Building UniProt to MD5 mapping ... {self.af_uniprot_md5_file}")
-
-        def process_line(line):
-            af_id, uniprot_id, md5 = line.strip().split()
-            entry = AfMd5Uniprot(af_id=af_id, md5=md5, uniprot_id=uniprot_id)
-            LOG.info(f"entry: {entry}")
-            if md5 not in md5_to_af_md5_uniprot_mapping:
-                md5_to_af_md5_uniprot_mapping[md5] = []
-            md5_to_af_md5_uniprot_mapping[md5].extend([entry])
-
-        if isinstance(self.af_uniprot_md5_file, TextIOWrapper):
-            for line in self.af_uniprot_md5_file:
-                process_line(line)
-        else:
-            with open(self.af_uniprot_md5_file) as fh:
-                for line in self.af_uniprot_md5_file:
-                    process_line(line)
-
-        self.md5_to_af_md5_uniprot_mapping = md5_to_af_md5_uniprot_mapping
+        af_uniprot_md5_path = get_regular_file_path(
+            self.af_uniprot_md5_file, "AF / UniProt / MD5 file"
+        )
+        LOG.info(f"Building UniProt to MD5 mapping ... {af_uniprot_md5_path}")
+        self.md5_to_af_md5_uniprot_mapping = Md5AfUniprotLookup.load_or_build(
+            af_uniprot_md5_path, self.lookup_path
+        )
 
     def next_cath_dataset_entry(
         self,
@@ -163,10 +249,11 @@ class CrhPredictedCathDomainProviderBase(PredictedCathDomainProviderBase):
         if uniprot_ids is not None:
             uniprot_ids = set(uniprot_ids)
 
-        if not self.md5_to_af_md5_uniprot_mapping:
+        if self.md5_to_af_md5_uniprot_mapping is None:
             self.build_md5_to_af_md5_uniprot_mapping()
 
         records_counter = 0
+        self.rewind_datasource()
         reader = self.get_datasource_reader()
 
         for crh in reader:
@@ -176,7 +263,7 @@ class CrhPredictedCathDomainProviderBase(PredictedCathDomainProviderBase):
             ):
                 continue
 
-            if max_records and records_counter > max_records:
+            if max_records and records_counter >= max_records:
                 break
 
             seq_md5 = crh.sequence_md5
@@ -185,15 +272,19 @@ class CrhPredictedCathDomainProviderBase(PredictedCathDomainProviderBase):
                 msg = f"failed to find sequence MD5 {seq_md5} in lookup"
                 raise NoMatchingMd5Error(msg)
 
-            for af_md5_uniprot in self.md5_to_af_md5_uniprot_mapping[seq_md5]:
+            md5_entries = self.md5_to_af_md5_uniprot_mapping.entries_for_md5(seq_md5)
+            for _af_id, uniprot_id in md5_entries:
+                if uniprot_ids is not None and uniprot_id not in uniprot_ids:
+                    continue
                 pred_dom = PredictedCathDomain(
-                    uniprot_acc=af_md5_uniprot.uniprot_id,
+                    uniprot_acc=uniprot_id,
                     sequence_md5=crh.sequence_md5,
                     gene3d_domain_id=crh.domain_id,
                     bitscore=crh.bitscore,
                     chopping=crh.chopping_final,
                     indp_evalue=crh.indp_evalue,
                 )
+                records_counter += 1
                 yield pred_dom
 
 
@@ -213,3 +304,254 @@ class DecoratedCrhPredictedCathDomainProvider(CrhPredictedCathDomainProviderBase
 
     def get_datasource_reader(self):
         return DecoratedCrhReader(self.datasource)
+
+
+class IndexedCrhPredictedCathDomainProviderMixin:
+    """
+    Provides datasets from CRH files via a byte-offset index keyed by sequence MD5
+
+    Rather than scanning the full CRH file for every chunk of UniProt ids, the
+    UniProt ids are mapped to sequence MD5s (via the AF / UniProt / MD5 lookup) and the
+    corresponding CRH rows are read directly from their offsets in the CRH file.
+
+    The index is built on first use and persisted to `index_path` (if provided) so that
+    subsequent runs over the same CRH file can reuse it.
+    """
+
+    CRH_DELIMITER: bytes = None
+    CRH_MD5_COLUMN: int = None
+
+    def __init__(self, *args, index_path, **kwargs):
+        super().__init__(*args, **kwargs)
+        if index_path is None:
+            raise ValueError("index_path must be set")
+        self.index_path = index_path
+        self.crh_index = None
+
+    @property
+    def crh_path(self):
+        return get_regular_file_path(self.datasource, "indexed CRH file")
+
+    def build_crh_index(self):
+        md5_from_line = get_md5_from_crh_line_func(
+            delimiter=self.CRH_DELIMITER, column=self.CRH_MD5_COLUMN
+        )
+        self.crh_index = CrhOffsetIndex.load_or_build(
+            self.crh_path, self.index_path, md5_from_line=md5_from_line
+        )
+
+    def get_crh_lines_reader(self, lines):
+        raise NotImplementedError
+
+    def next_cath_dataset_entry(
+        self,
+        *,
+        max_independent_evalue=None,
+        max_records=None,
+        uniprot_ids=None,
+        **kwargs,
+    ) -> PredictedCathDomain:
+        if uniprot_ids is None:
+            raise RuntimeError("need to specify uniprot_ids when using a CRH index")
+
+        uniprot_ids = set(uniprot_ids)
+
+        if self.md5_to_af_md5_uniprot_mapping is None:
+            self.build_md5_to_af_md5_uniprot_mapping()
+
+        if not self.crh_index:
+            self.build_crh_index()
+
+        md5s = set()
+        for uniprot_id in uniprot_ids:
+            md5s.update(self.md5_to_af_md5_uniprot_mapping.md5s_for_uniprot(uniprot_id))
+
+        records_counter = 0
+        crh_lines = self.crh_index.yield_lines(md5s)
+        for crh in self.get_crh_lines_reader(crh_lines):
+            if (
+                max_independent_evalue is not None
+                and crh.indp_evalue > max_independent_evalue
+            ):
+                continue
+
+            md5_entries = self.md5_to_af_md5_uniprot_mapping.entries_for_md5(
+                crh.sequence_md5
+            )
+            for _af_id, uniprot_id in md5_entries:
+                if uniprot_id not in uniprot_ids:
+                    continue
+
+                if max_records and records_counter >= max_records:
+                    return
+
+                records_counter += 1
+                yield PredictedCathDomain(
+                    uniprot_acc=uniprot_id,
+                    sequence_md5=crh.sequence_md5,
+                    gene3d_domain_id=crh.domain_id,
+                    bitscore=crh.bitscore,
+                    chopping=crh.chopping_final,
+                    indp_evalue=crh.indp_evalue,
+                )
+
+
+class IndexedGene3DCrhPredictedCathDomainProvider(
+    IndexedCrhPredictedCathDomainProviderMixin, Gene3DCrhPredictedCathDomainProvider
+):
+    """
+    Provides a CATH dataset from an indexed CRH / MD5 files
+    """
+
+    CRH_DELIMITER = b"\t"
+    CRH_MD5_COLUMN = 0
+
+    def get_crh_lines_reader(self, lines):
+        return Gene3DCrhReader(io.StringIO("".join(lines)))
+
+
+class IndexedDecoratedCrhPredictedCathDomainProvider(
+    IndexedCrhPredictedCathDomainProviderMixin, DecoratedCrhPredictedCathDomainProvider
+):
+    """
+    Provides a CATH dataset from an indexed "decorated" CRH / MD5 files
+    """
+
+    CRH_DELIMITER = b","
+    CRH_MD5_COLUMN = 2
+
+    def get_crh_lines_reader(self, lines):
+        return DecoratedCrhReader(io.StringIO("".join(lines)))
+
+
+class SortMergeCrhPredictedCathDomainProviderMixin:
+    """
+    Provides datasets from CRH files via an external sort / merge join on sequence MD5
+
+    None of the inputs are held in memory: the requested UniProt ids are joined to the
+    AF / UniProt / MD5 rows, then these are joined to the CRH rows by sequence MD5, with
+    each input sorted on disk beforehand (see `sort_utils.external_sort`). Memory use is
+    bounded by `sort_buffer_rows` (the total number of rows held in memory by all the
+    sorts), not by the size of the inputs.
+
+    All the UniProt ids should be provided in a single call, as every call reads the
+    full AF / UniProt / MD5 and CRH files.
+    """
+
+    def __init__(
+        self,
+        *args,
+        sort_buffer_rows=DEFAULT_SORT_BUFFER_ROWS,
+        sort_tmp_dir=None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.sort_buffer_rows = sort_buffer_rows
+        self.sort_tmp_dir = sort_tmp_dir
+
+    def yield_crh_rows(self, *, max_independent_evalue=None):
+        for crh in self.get_datasource_reader():
+            if (
+                max_independent_evalue is not None
+                and crh.indp_evalue > max_independent_evalue
+            ):
+                continue
+            yield (
+                crh.sequence_md5,
+                crh.domain_id,
+                str(crh.bitscore),
+                crh.chopping_final,
+                str(crh.indp_evalue),
+            )
+
+    def next_cath_dataset_entry(
+        self,
+        *,
+        max_independent_evalue=None,
+        max_records=None,
+        uniprot_ids=None,
+        **kwargs,
+    ) -> PredictedCathDomain:
+        if uniprot_ids is None:
+            raise RuntimeError("need to specify uniprot_ids when using a merge join")
+
+        # up to SORTS_IN_MEMORY sorts hold a buffer at once, so share the rows between them
+        sort = functools.partial(
+            external_sort,
+            buffer_rows=max(1, self.sort_buffer_rows // SORTS_IN_MEMORY),
+            tmp_dir=self.sort_tmp_dir,
+        )
+        af_uniprot_md5_path = get_regular_file_path(
+            self.af_uniprot_md5_file, "AF / UniProt / MD5 file"
+        )
+
+        # (uniprot_id,) sorted by uniprot_id (without duplicates)
+        uniprot_rows = unique_rows(
+            sort(((uniprot_id,) for uniprot_id in uniprot_ids), key=itemgetter(0)),
+            key=itemgetter(0),
+        )
+        # (uniprot_id, md5) sorted by uniprot_id
+        af_rows = sort(
+            (
+                (uniprot_id, md5)
+                for _af_id, uniprot_id, md5 in Md5AfUniprotLookup.yield_rows(
+                    af_uniprot_md5_path
+                )
+            ),
+            key=itemgetter(0),
+        )
+        # (uniprot_id, md5) for the requested uniprot ids, sorted by md5
+        requested_af_rows = sort(
+            (
+                af_row
+                for _uniprot_group, af_group in merge_join(
+                    uniprot_rows,
+                    af_rows,
+                    left_key=itemgetter(0),
+                    right_key=itemgetter(0),
+                )
+                for af_row in af_group
+            ),
+            key=itemgetter(1),
+        )
+        # (md5, domain_id, bitscore, chopping, indp_evalue) sorted by md5
+        crh_rows = sort(
+            self.yield_crh_rows(max_independent_evalue=max_independent_evalue),
+            key=itemgetter(0),
+        )
+
+        records_counter = 0
+        for af_group, crh_group in merge_join(
+            requested_af_rows, crh_rows, left_key=itemgetter(1), right_key=itemgetter(0)
+        ):
+            for seq_md5, domain_id, bitscore, chopping, indp_evalue in crh_group:
+                for uniprot_id, _md5 in af_group:
+                    if max_records and records_counter >= max_records:
+                        return
+
+                    records_counter += 1
+                    yield PredictedCathDomain(
+                        uniprot_acc=uniprot_id,
+                        sequence_md5=seq_md5,
+                        gene3d_domain_id=domain_id,
+                        bitscore=bitscore,
+                        chopping=chopping,
+                        indp_evalue=indp_evalue,
+                    )
+
+
+class SortMergeGene3DCrhPredictedCathDomainProvider(
+    SortMergeCrhPredictedCathDomainProviderMixin, Gene3DCrhPredictedCathDomainProvider
+):
+    """
+    Provides a CATH dataset from CRH / MD5 files (via an external sort / merge join)
+    """
+
+
+class SortMergeDecoratedCrhPredictedCathDomainProvider(
+    SortMergeCrhPredictedCathDomainProviderMixin,
+    DecoratedCrhPredictedCathDomainProvider,
+):
+    """
+    Provides a CATH dataset from "decorated" CRH / MD5 files (via an external sort / merge join)
+    """
@@ -0,0 +1,189 @@
+"""
+Timing instrumentation for `cath-af-cli` commands
+
+Hot functions are wrapped with `timed(stage)` and blocks of code with `timer(stage)`,
+where the stage is one of `read`, `parse`, `compute` or `write`. Commands loop over
+`entries(...)` to record the time spent on each entry (chain, domain, ...). When
+profiling is off (the default) these only cost a check of `PROFILER.enabled`.
+
+Profiling is turned on with `cath-af-cli --profile report.json <command> ...`, which
+writes the wall time of the command split by stage (time spent in nested timers is
+only counted once, in the innermost stage), the time spent in each timed function,
+per-entry latency percentiles and entries/second. Time that is not spent in any timer
+(e.g. writing CSV rows, logging) is reported as `other`.
+"""
+
+import contextlib
+import functools
+import json
+import math
+import threading
+import time
+from typing import Dict, List
+
+STAGE_READ = "read"
+STAGE_PARSE = "parse"
+STAGE_COMPUTE = "compute"
+STAGE_WRITE = "write"
+STAGES = (STAGE_READ, STAGE_PARSE, STAGE_COMPUTE, STAGE_WRITE)
+
+# time that is not within any timer
+STAGE_OTHER = "other"
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """
+    Returns the percentile of a sorted list of values (nearest rank)
+    """
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Profiler:
+    """
+    Collects the timings for a single command
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, command: str = None):
+        self.command = command
+        self.started = None
+        self.wall_seconds = None
+        self.stage_seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.function_stats: Dict[str, dict] = {}
+        self.entry_seconds: List[float] = []
+
+    def start(self, command: str = None):
+        self.reset(command)
+        self.started = time.perf_counter()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+        self.wall_seconds = time.perf_counter() - self.started
+
+    @property
+    def _stack(self):
+        # timers are nested per thread
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, name: str):
+        stack = self._stack
+        # [child seconds]
+        frame = [0.0]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            if stack:
+                stack[-1][0] += seconds
+            with self._lock:
+                self.stage_seconds[stage] += seconds - frame[0]
+                stats = self.function_stats.setdefault(
+                    name, {"stage": stage, "calls": 0, "seconds": 0.0}
+                )
+                stats["calls"] += 1
+                stats["seconds"] += seconds
+
+    def entries(self, iterable):
+        for item in iterable:
+            started = time.perf_counter()
+            yield item
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.entry_seconds.append(seconds)
+
+    def report(self) -> dict:
+        wall_seconds = self.wall_seconds
+        if wall_seconds is None:
+            wall_seconds = time.perf_counter() - self.started
+        stage_seconds = dict(self.stage_seconds)
+        stage_seconds[STAGE_OTHER] = max(wall_seconds - sum(stage_seconds.values()), 0)
+
+        entry_seconds = sorted(self.entry_seconds)
+        entries = {
+            "count": len(entry_seconds),
+            "per_second": len(entry_seconds) / wall_seconds if wall_seconds else None,
+            "max_seconds": entry_seconds[-1] if entry_seconds else None,
+        }
+        for pct in LATENCY_PERCENTILES:
+            entries[f"p{pct}_seconds"] = percentile(entry_seconds, pct)
+
+        functions = dict(
+            sorted(
+                self.function_stats.items(),
+                key=lambda item: item[1]["seconds"],
+                reverse=True,
+            )
+        )
+        return {
+            "command": self.command,
+            "wall_seconds": wall_seconds,
+            "stage_seconds": stage_seconds,
+            "entries": entries,
+            "functions": functions,
+        }
+
+    def write_report(self, report_path):
+        with open(report_path, "wt") as fh:
+            json.dump(self.report(), fh, indent=2)
+            fh.write("\n")
+
+
+PROFILER = Profiler()
+
+
+def timer(stage: str, name: str = None):
+    """
+    Context manager that times a block of code (when profiling is on)
+    """
+    if not PROFILER.enabled:
+        return contextlib.nullcontext()
+    return PROFILER.timer(stage, name or stage)
+
+
+def entries(iterable):
+    """
+    Yields the entries to process, recording the time spent on each one
+
+    The time for an entry is from when it is yielded until the next entry is
+    requested (when profiling is off, this returns `iterable` unchanged).
+    """
+    if not PROFILER.enabled:
+        return iterable
+    return PROFILER.entries(iterable)
+
+
+def timed(stage: str):
+    """
+    Decorator that times each call of a function (when profiling is on)
+    """
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with PROFILER.timer(stage, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,96 @@
+"""
+Periodic progress reporting for long-running commands
+"""
+
+import datetime
+import logging
+import time
+from pathlib import Path
+
+from .io_utils import count_lines
+
+LOG = logging.getLogger(__name__)
+
+# seconds between progress lines
+DEFAULT_PROGRESS_INTERVAL = 60
+
+
+def format_seconds(seconds: float) -> str:
+    return str(datetime.timedelta(seconds=round(seconds)))
+
+
+class ProgressReporter:
+    """
+    Logs the number of entries processed, the rate and the ETA every `interval` seconds
+
+    Checking the time is the only cost of `update` between progress lines, so this can
+    be called for every entry.
+    """
+
+    def __init__(
+        self,
+        total: int = None,
+        *,
+        label: str = "entries",
+        interval: float = DEFAULT_PROGRESS_INTERVAL,
+    ):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.processed = 0
+        self.started = time.monotonic()
+        self.next_report = self.started + interval
+
+    @classmethod
+    def for_id_file(cls, id_file, *, header: bool = True, **kwargs):
+        """
+        Creates a reporter with the total from the number of lines in an id file
+
+        The lines are counted without parsing the file (the total is unknown if the
+        ids are not read from a regular file, e.g. stdin).
+        """
+        total = None
+        id_path = Path(getattr(id_file, "name", ""))
+        if id_path.is_file():
+            total = max(count_lines(id_path) - (1 if header else 0), 0)
+        return cls(total, **kwargs)
+
+    def update(self, count: int = 1):
+        self.processed += count
+        if self.interval and time.monotonic() >= self.next_report:
+            self.report()
+
+    def report(self):
+        now = time.monotonic()
+        self.next_report = now + self.interval
+        LOG.info(f"Progress: {self.progress_str(now)}")
+
+    def finish(self):
+        now = time.monotonic()
+        LOG.info(
+            f"Processed {self.processed} {self.label} in "
+            f"{format_seconds(now - self.started)} ({self.rate(now):.1f}/s)"
+        )
+
+    def rate(self, now: float = None) -> float:
+        if now is None:
+            now = time.monotonic()
+        elapsed = now - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def progress_str(self, now: float = None) -> str:
+        if now is None:
+            now = time.monotonic()
+        rate = self.rate(now)
+        msg = f"{self.processed}"
+        if self.total:
+            msg += (
+                f"/{self.total} {self.label} ({100 * self.processed / self.total:.1f}%)"
+            )
+        else:
+            msg += f" {self.label}"
+        msg += f", {rate:.1f}/s"
+        if self.total and rate > 0:
+            remaining = max(self.total - self.processed, 0)
+            msg += f", ETA {format_seconds(remaining / rate)}"
+        return msg
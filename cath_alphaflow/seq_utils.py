@@ -3,8 +3,8 @@ import hashlib
 import logging
 from pathlib import Path
 import re
+from typing import Optional
 
-from Bio.PDB.MMCIF2Dict import MMCIF2Dict
 from Bio.PDB import MMCIFParser
 from Bio.PDB import PDBParser
 from Bio.PDB import Structure
@@ -14,6 +14,7 @@ from Bio import SeqIO
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
 
+from cath_alphaflow.cif_utils import read_cif_categories
 from cath_alphaflow.models.domains import ChoppingPdbResLabel
 from cath_alphaflow.models.domains import SegmentStr
 
@@ -111,6 +112,13 @@ def cif_to_md5(cif_path: Path, chain_id=0, chopping=None):
         raise FileNotFoundError(msg)
 
     _hdr, seq = cif_to_fasta(cif_path, chain_id=chain_id)
+    return chopped_sequence_to_md5(seq, chopping=chopping)
+
+
+def chopped_sequence_to_md5(seq: str, *, chopping=None) -> str:
+    """
+    Returns the MD5 of the sequence within the chopping (or the whole sequence)
+    """
     if chopping:
         # apply chopping to sequence
         seq = "".join(
@@ -124,6 +132,27 @@ def cif_to_md5(cif_path: Path, chain_id=0, chopping=None):
     return md5
 
 
+def cif_dict_to_sequence(cif_dict: dict) -> Optional[str]:
+    """
+    Returns the sequence from the `_entity_poly` category of mmCIF (if present)
+    """
+    if "_entity_poly.pdbx_seq_one_letter_code" not in cif_dict:
+        return None
+    return cif_dict["_entity_poly.pdbx_seq_one_letter_code"][0].replace("\n", "")
+
+
+def biostructure_chain_to_sequence(chain) -> str:
+    """
+    Returns the sequence of the standard residues in a Bio.PDB chain
+    """
+    sequence = ""
+    for residue in chain:
+        resname = residue.get_resname()
+        if seq1(resname) != "X":
+            sequence += seq1(resname)
+    return sequence
+
+
 # TODO add chain_id exception
 def cif_to_fasta(cif_path: Path, chain_id=0):
     if not cif_path.exists():
@@ -138,22 +167,15 @@ def cif_to_fasta(cif_path: Path, chain_id=0):
 
     with open_func(str(cif_path), mode="rt") as cif_fh:
         header = cif_path.stem
-        structure = MMCIF2Dict(cif_fh)
+        structure = read_cif_categories(cif_fh, ["_entity_poly"])
 
-        if "_entity_poly.pdbx_seq_one_letter_code" in structure:
-            sequence = structure["_entity_poly.pdbx_seq_one_letter_code"][0].replace(
-                "\n", ""
-            )
-        else:
+        sequence = cif_dict_to_sequence(structure)
+        if sequence is None:
             parser = MMCIFParser()
             structure = parser.get_structure(header, cif_path)
             model = structure[0]
             chain = model[chain_id]
-            sequence = ""
-            for residue in chain:
-                resname = residue.get_resname()
-                if seq1(resname) != "X":
-                    sequence += seq1(resname)
+            sequence = biostructure_chain_to_sequence(chain)
 
     return header, sequence
 
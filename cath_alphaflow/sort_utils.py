@@ -0,0 +1,125 @@
+"""
+External (on-disk) sorting and merge joins over streams of rows
+
+Rows are tuples of strings (which must not contain tabs or newlines). Sorting holds at
+most `buffer_rows` rows in memory at a time: each full buffer is sorted and spilled to
+a temporary file, then the spill files are lazily merged with `heapq.merge`.
+"""
+
+import heapq
+import itertools
+import logging
+import tempfile
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_SORT_BUFFER_ROWS = 1000000
+
+# maximum number of spill files to merge at once (keeps open file handles bounded)
+MAX_MERGE_FILES = 128
+
+
+def _write_spill_file(rows: Iterable[Tuple[str, ...]], *, tmp_dir=None):
+    spill_fh = tempfile.TemporaryFile(
+        mode="w+t", encoding="utf-8", newline="\n", dir=tmp_dir
+    )
+    for row in rows:
+        spill_fh.write("\t".join(row) + "\n")
+    spill_fh.seek(0)
+    return spill_fh
+
+
+def _yield_spill_rows(spill_fh) -> Iterator[Tuple[str, ...]]:
+    with spill_fh:
+        for line in spill_fh:
+            yield tuple(line.rstrip("\n").split("\t"))
+
+
+def _merge_spill_files(spill_fhs, *, key: Callable) -> Iterator[Tuple[str, ...]]:
+    return heapq.merge(*[_yield_spill_rows(fh) for fh in spill_fhs], key=key)
+
+
+def external_sort(
+    rows: Iterable[Tuple[str, ...]],
+    *,
+    key: Callable,
+    buffer_rows: int = DEFAULT_SORT_BUFFER_ROWS,
+    tmp_dir=None,
+) -> Iterator[Tuple[str, ...]]:
+    """
+    Yields `rows` sorted by `key` while holding at most `buffer_rows` rows in memory
+
+    The sort is stable (rows with equal keys are returned in input order).
+    """
+    if buffer_rows < 1:
+        raise ValueError(f"buffer_rows must be a positive integer (got {buffer_rows})")
+
+    rows = iter(rows)
+    spill_fhs = []
+    while True:
+        buffer = list(itertools.islice(rows, buffer_rows))
+        if not buffer:
+            break
+        buffer.sort(key=key)
+        if not spill_fhs and len(buffer) < buffer_rows:
+            # everything fits in memory
+            yield from buffer
+            return
+        spill_fhs.append(_write_spill_file(buffer, tmp_dir=tmp_dir))
+        del buffer
+
+    LOG.debug(f"Merging {len(spill_fhs)} sorted spill files")
+
+    # merge in passes so we never have more than MAX_MERGE_FILES open at once
+    while len(spill_fhs) > MAX_MERGE_FILES:
+        spill_fhs = [
+            _write_spill_file(
+                _merge_spill_files(spill_fhs[idx : idx + MAX_MERGE_FILES], key=key),
+                tmp_dir=tmp_dir,
+            )
+            for idx in range(0, len(spill_fhs), MAX_MERGE_FILES)
+        ]
+
+    yield from _merge_spill_files(spill_fhs, key=key)
+
+
+def unique_rows(
+    sorted_rows: Iterable[Tuple[str, ...]], *, key: Callable
+) -> Iterator[Tuple[str, ...]]:
+    """
+    Yields the first row for each key from a stream of rows already sorted by `key`
+    """
+    for _value, group in itertools.groupby(sorted_rows, key=key):
+        yield next(group)
+
+
+def merge_join(
+    left_rows: Iterable[Tuple[str, ...]],
+    right_rows: Iterable[Tuple[str, ...]],
+    *,
+    left_key: Callable,
+    right_key: Callable,
+) -> Iterator[Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]]]]:
+    """
+    Inner join of two streams of rows that are already sorted by their keys
+
+    Yields `(left_group, right_group)` for each key present in both streams, where each
+    group is the list of rows with that key (so only one key is held in memory at a time).
+    """
+    left_groups = itertools.groupby(left_rows, key=left_key)
+    right_groups = itertools.groupby(right_rows, key=right_key)
+
+    left = next(left_groups, None)
+    right = next(right_groups, None)
+    while left is not None and right is not None:
+        left_value, left_group = left
+        right_value, right_group = right
+        if left_value < right_value:
+            left = next(left_groups, None)
+        elif left_value > right_value:
+            right = next(right_groups, None)
+        else:
+            yield list(left_group), list(right_group)
+            left = next(left_groups, None)
+            right = next(right_groups, None)
@@ -0,0 +1,83 @@
+"""
+Client for submitting `cath-af-cli` tasks to a worker started with `cath-af-cli serve`
+
+This module only uses the standard library so that submitting a task is much faster
+than starting `cath-af-cli` (which is the point of running the worker):
+
+    python -m cath_alphaflow.task_client --socket /tmp/cath-af.sock -- \\
+        convert-cif-to-plddt-summary --cif_in_dir ...
+
+Tasks are sent as one JSON line (`{"args": [...], "cwd": "..."}`) and the worker
+replies with JSON lines containing `stdout` / `stderr` text as it is written, then
+a final `exit_code`.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+SOCKET_ENV_VAR = "CATH_AF_SOCKET"
+
+
+def send_message(sock_file, message: dict):
+    sock_file.write((json.dumps(message) + "\n").encode("utf-8"))
+    sock_file.flush()
+
+
+def read_message(sock_file):
+    line = sock_file.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def submit(args, *, socket_path, cwd=None, stdout=None, stderr=None) -> int:
+    """
+    Runs a `cath-af-cli` command on the worker, returns the exit code
+
+    Output from the command is written to `stdout` / `stderr` as it arrives.
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        with sock.makefile("rwb") as sock_file:
+            send_message(sock_file, {"args": list(args), "cwd": cwd or os.getcwd()})
+            while True:
+                message = read_message(sock_file)
+                if message is None:
+                    stderr.write("worker closed the connection before the task ended\n")
+                    return 1
+                if "stdout" in message:
+                    stdout.write(message["stdout"])
+                    stdout.flush()
+                if "stderr" in message:
+                    stderr.write(message["stderr"])
+                    stderr.flush()
+                if "exit_code" in message:
+                    return message["exit_code"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Submit a cath-af-cli command to a `cath-af-cli serve` worker"
+    )
+    parser.add_argument(
+        "--socket",
+        default=os.environ.get(SOCKET_ENV_VAR),
+        help=f"Path of the worker socket (default: ${SOCKET_ENV_VAR})",
+    )
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="cath-af-cli arguments")
+    options = parser.parse_args(argv)
+    if not options.socket:
+        parser.error(f"expected --socket or ${SOCKET_ENV_VAR}")
+    args = options.args
+    if args and args[0] == "--":
+        args = args[1:]
+    sys.exit(submit(args, socket_path=options.socket))
+
+
+if __name__ == "__main__":
+    main()
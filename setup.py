@@ -30,6 +30,7 @@ setup(
     entry_points="""
         [console_scripts]
         cath-af-cli=cath_alphaflow.cli:cli
+        cath-af-submit=cath_alphaflow.task_client:main
     """,
     install_requires=[
         "click",
@@ -42,6 +43,7 @@ setup(
         "pydantic-core!=2.41.3,<2.41",  # Exclude corrupted version
         "pymongo",
         "biopython",
+        "numpy",
     ],
     extras_require={"test": ["pytest"]},
     python_requires=">=3.7",
@@ -2,8 +2,19 @@ import os
 from pathlib import Path
 import csv
 import logging
+import shutil
+import pytest
 from click.testing import CliRunner
 from cath_alphaflow.cli import cli
+from cath_alphaflow.commands import convert_cif_to_foldseek_db
+from cath_alphaflow.constants import DEFAULT_FS_QUERYDB_NAME, DEFAULT_FS_QUERYDB_SUFFIX
+from cath_alphaflow.foldseek_utils import (
+    file_md5,
+    get_keys_by_filename,
+    read_checksums,
+    read_db_index,
+    read_lookup,
+)
 from cath_alphaflow.settings import get_default_settings
 
 config = get_default_settings()
@@ -74,3 +85,101 @@ def test_convert_cif_to_foldseek_db(tmp_path, create_cli_runner):
         assert result.exception is None
         assert result.exit_code == 0
         assert "DONE" in result.output
+
+
+def test_convert_cif_to_foldseek_db_id_file(tmp_path, monkeypatch):
+    ids = ["AF-P00520-F1-model_v3/12-100", "AF-P00521-F1-model_v3/1-50"]
+    file_stubs = ["AF-P00520-F1-model_v3-12-100", "AF-P00521-F1-model_v3-1-50"]
+    createdb_inputs = []
+
+    def fake_run_foldseek_command(fs_bin_path, command, cif_input, fs_db, **kwargs):
+        createdb_inputs.append(Path(cif_input).read_text().splitlines())
+
+    monkeypatch.setattr(
+        convert_cif_to_foldseek_db, "run_foldseek_command", fake_run_foldseek_command
+    )
+    runner = CliRunner()
+    with runner.isolated_filesystem(temp_dir=tmp_path):
+        cif_path = create_fake_cif_dir("cif", file_stubs).resolve()
+        with open("ids.txt", "wt") as fh:
+            write_ids_to_file(fh, ["af_domain_id"], ids + [ids[0]])
+
+        args = [
+            SUBCOMMAND,
+            "--cif_dir",
+            "cif",
+            "--fs_querydb_dir",
+            "fs_db",
+            "--id_file",
+            "ids.txt",
+            "--cif_suffix",
+            ".cif.gz",
+        ]
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 0, result.output
+        assert createdb_inputs == [[f"{cif_path}/{stub}.cif.gz" for stub in file_stubs]]
+
+        # all missing files are reported together
+        with open("ids.txt", "wt") as fh:
+            missing_ids = ["AF-P00001-F1-model_v3/1-10", "AF-P00002-F1-model_v3/1-10"]
+            write_ids_to_file(fh, ["af_domain_id"], ids + missing_ids)
+        result = runner.invoke(cli, args)
+        assert isinstance(result.exception, FileNotFoundError)
+        assert "failed to locate 2 of 4 CIF input files" in str(result.exception)
+        assert "AF-P00002-F1-model_v3-1-10.cif.gz" in str(result.exception)
+
+
+@pytest.mark.skipif(
+    not FS_BINARY_PATH.exists(),
+    reason=f"cannot run tests as foldseek is not installed: {FS_BINARY_PATH}",
+)
+def test_convert_cif_to_foldseek_db_incremental(tmp_path):
+    cif_dir = tmp_path / "cif"
+    cif_dir.mkdir()
+    fixture_paths = sorted((FIXTURE_PATH / "cif").glob("*.cif.gz"))
+    for cif_src in fixture_paths[:2]:
+        shutil.copyfile(cif_src, cif_dir / cif_src.name)
+    removed_path, changed_path = [cif_dir / path.name for path in fixture_paths[:2]]
+    new_src = fixture_paths[2]
+
+    fs_db_dir = tmp_path / "fs_db"
+    fs_querydb = fs_db_dir / f"{DEFAULT_FS_QUERYDB_NAME}{DEFAULT_FS_QUERYDB_SUFFIX}"
+    args = [
+        SUBCOMMAND,
+        "--cif_dir",
+        str(cif_dir),
+        "--fs_querydb_dir",
+        str(fs_db_dir),
+        "--fs_bin_path",
+        str(FS_BINARY_PATH),
+        "--incremental",
+    ]
+
+    runner = CliRunner()
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    assert set(get_keys_by_filename(fs_querydb)) == {
+        removed_path.name,
+        changed_path.name,
+    }
+    changed_keys = get_keys_by_filename(fs_querydb)[changed_path.name]
+
+    # add a file, change a file and remove a file
+    shutil.copyfile(new_src, cif_dir / new_src.name)
+    shutil.copyfile(new_src, changed_path)
+    removed_path.unlink()
+
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+
+    keys_by_filename = get_keys_by_filename(fs_querydb)
+    assert set(keys_by_filename) == {changed_path.name, new_src.name}
+    # the changed file was added again (with new keys)
+    assert not keys_by_filename[changed_path.name] & changed_keys
+    lookup_keys = [key for key, _name, _file_id in read_lookup(fs_querydb)]
+    assert sorted(lookup_keys) == sorted(set().union(*keys_by_filename.values()))
+    assert set(read_db_index(fs_querydb)) == set(lookup_keys)
+
+    checksums = read_checksums(fs_querydb)
+    assert set(checksums) == {changed_path.name, new_src.name}
+    assert checksums[changed_path.name].md5 == file_md5(new_src)
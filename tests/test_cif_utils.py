@@ -0,0 +1,113 @@
+import gzip
+import io
+from pathlib import Path
+
+import pytest
+from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+
+from cath_alphaflow.cif_utils import (
+    cif_category,
+    read_cif_categories,
+    split_cif_line,
+)
+from cath_alphaflow.errors import ParseError
+
+CIF_DIR = Path(__file__).parent / "fixtures" / "cif"
+
+EXAMPLE_CIF = """data_test
+#
+_entry.id TEST
+#
+loop_
+_audit_author.name
+_audit_author.pdbx_ordinal
+"Smith, J." 1
+'O'Brien, K.' 2
+#
+_entity.id 1
+_entity.pdbx_description
+"Example protein"
+#
+_entity_poly.entity_id 1
+_entity_poly.pdbx_seq_one_letter_code
+;MKVL
+AAGG
+;
+_entity_poly.type 'polypeptide(L)'
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+ATOM 1
+ATOM 2
+#
+_ma_qa_metric_global.metric_value 64.96
+"""
+
+
+def test_split_cif_line():
+    assert split_cif_line("""ATOM 'C1' "it's" O5' ?""") == [
+        "ATOM",
+        "C1",
+        "it's",
+        "O5'",
+        "?",
+    ]
+
+
+def test_read_cif_categories():
+    cif_dict = read_cif_categories(
+        io.StringIO(EXAMPLE_CIF), ["_audit_author", "_entity", "_entity_poly"]
+    )
+    assert cif_dict == {
+        "_audit_author.name": ["Smith, J.", "O'Brien, K."],
+        "_audit_author.pdbx_ordinal": ["1", "2"],
+        "_entity.id": ["1"],
+        "_entity.pdbx_description": ["Example protein"],
+        "_entity_poly.entity_id": ["1"],
+        "_entity_poly.pdbx_seq_one_letter_code": ["MKVL\nAAGG"],
+        "_entity_poly.type": ["polypeptide(L)"],
+    }
+
+    # categories after _atom_site are still found (by reading the whole file)
+    cif_dict = read_cif_categories(io.StringIO(EXAMPLE_CIF), ["_ma_qa_metric_global"])
+    assert cif_dict == {"_ma_qa_metric_global.metric_value": ["64.96"]}
+
+
+def test_read_cif_categories_stops_after_categories():
+    lines = EXAMPLE_CIF.splitlines(keepends=True)
+    cif_fh = iter(lines)
+    read_cif_categories(cif_fh, ["_entity"])
+    # the rest of the file is not read
+    assert next(cif_fh).startswith("_entity_poly.pdbx_seq_one_letter_code")
+
+
+def test_read_cif_categories_bad_loop():
+    bad_cif = "loop_\n_audit_author.name\n_audit_author.pdbx_ordinal\nSmith 1 Jones\n"
+    with pytest.raises(ParseError):
+        read_cif_categories(io.StringIO(bad_cif), ["_audit_author"])
+
+
+@pytest.mark.parametrize(
+    "example_cif_fname",
+    [
+        "AF-P00520-F1-model_v3.cif.gz",
+        "AF-Q15772-F3-model_v4.cif.gz",
+        "AF-Q15772-F11-model_v4.cif.gz",
+    ],
+)
+def test_read_cif_categories_matches_mmcif2dict(example_cif_fname):
+    cif_path = CIF_DIR / example_cif_fname
+    with gzip.open(str(cif_path), "rt") as fh:
+        expected_dict = MMCIF2Dict(fh)
+    categories = {cif_category(tag) for tag in expected_dict if tag.startswith("_")}
+    categories.discard("_atom_site")
+    expected_dict = {
+        tag: values
+        for tag, values in expected_dict.items()
+        if cif_category(tag) in categories
+    }
+
+    with gzip.open(str(cif_path), "rt") as fh:
+        cif_dict = read_cif_categories(fh, categories)
+    assert cif_dict == expected_dict
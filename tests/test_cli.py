@@ -0,0 +1,69 @@
+import subprocess
+import sys
+import time
+
+import click
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import LAZY_COMMANDS, cli
+
+# `cath-af-cli --help` should take < 100 ms, which includes ~40 ms to start the
+# interpreter (this varies between machines, so the time over that is checked)
+HELP_OVERHEAD_LIMIT_SECONDS = 0.06
+
+
+def test_help_does_not_import_commands():
+    script = (
+        "import sys\n"
+        "from cath_alphaflow.cli import cli\n"
+        "cli(['--help'], standalone_mode=False)\n"
+        "print(sorted(m for m in sys.modules if m.startswith('cath_alphaflow.')))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert "run-foldseek" in result.stdout
+    assert result.stdout.splitlines()[-1] == "['cath_alphaflow.cli']"
+
+
+def test_help_without_warnings():
+    result = subprocess.run(
+        [sys.executable, "-W", "error", "-m", "cath_alphaflow", "--help"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert "run-foldseek" in result.stdout
+
+
+def get_best_run_seconds(cmd, runs=5):
+    # best of a few runs, to ignore slow runs from a busy machine
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(cmd, capture_output=True, check=True)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def test_help_startup_time():
+    python_seconds = get_best_run_seconds([sys.executable, "-c", "pass"])
+    help_seconds = get_best_run_seconds(
+        [sys.executable, "-m", "cath_alphaflow", "--help"]
+    )
+    assert help_seconds - python_seconds < HELP_OVERHEAD_LIMIT_SECONDS
+
+
+def test_lazy_commands_match_commands():
+    ctx = click.Context(cli)
+    for cmd_name, (_import_path, short_help) in LAZY_COMMANDS.items():
+        cmd = cli.get_command(ctx, cmd_name)
+        assert cmd.name == cmd_name
+        assert cmd.get_short_help_str(limit=200) == short_help
+
+
+def test_lazy_command_usage():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["run-foldseek", "--help"])
+    assert result.exit_code == 0
+    assert "--fs_querydb" in result.output
@@ -0,0 +1,114 @@
+import gzip
+from pathlib import Path
+
+import pytest
+from Bio import SeqIO
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import cli
+from cath_alphaflow.fasta_utils import format_fasta_record
+from cath_alphaflow.seq_utils import cif_to_fasta, write_fasta_file
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+CIF_DIR = FIXTURE_PATH / "cif"
+CIF_SUFFIX = ".cif.gz"
+AF_CHAIN_IDS = [
+    "AF-Q15772-F3-model_v4",
+    "AF-P00520-F1-model_v3",
+    "AF-Q15772-F11-model_v4",
+]
+
+SUBCOMMAND = "convert-cif-to-fasta"
+
+
+@pytest.fixture
+def id_file(tmp_path):
+    id_path = tmp_path / "ids.txt"
+    id_path.write_text("af_chain_id\n" + "\n".join(AF_CHAIN_IDS) + "\n")
+    return id_path
+
+
+def expected_fasta_with_seqio(tmp_path):
+    # reference output (one FASTA file per chain written with SeqIO)
+    expected = ""
+    for af_chain_id in AF_CHAIN_IDS:
+        header, sequence = cif_to_fasta(CIF_DIR / (af_chain_id + CIF_SUFFIX))
+        fasta_path = tmp_path / f"expected_{header}.fasta"
+        write_fasta_file(header=header, sequence=sequence, fasta_out_file=fasta_path)
+        expected += fasta_path.read_text()
+    return expected
+
+
+def test_format_fasta_record_matches_seqio(tmp_path):
+    for sequence in ["", "M" * 60, "MKV" * 41]:
+        fasta_path = tmp_path / "test.fasta"
+        write_fasta_file(header="test", sequence=sequence, fasta_out_file=fasta_path)
+        assert format_fasta_record("test", sequence) == fasta_path.read_text()
+
+
+@pytest.mark.parametrize(
+    "combined_name,extra_args",
+    [
+        ("merged.fasta", []),
+        ("merged.fasta.gz", []),
+        ("merged.fasta", ["--jobs", "2", "--batch_size", "1"]),
+    ],
+)
+def test_convert_cif_to_fasta(tmp_path, id_file, combined_name, extra_args):
+    combined_path = tmp_path / combined_name
+    result = CliRunner().invoke(
+        cli,
+        [
+            SUBCOMMAND,
+            "--cif_in_dir",
+            str(CIF_DIR),
+            "--id_file",
+            str(id_file),
+            "--cif_suffix",
+            CIF_SUFFIX,
+            "--combined_fasta_file",
+            str(combined_path),
+            *extra_args,
+        ],
+    )
+    assert result.exit_code == 0
+    assert "DONE" in result.output
+
+    if combined_name.endswith(".gz"):
+        combined_text = gzip.decompress(combined_path.read_bytes()).decode()
+    else:
+        combined_text = combined_path.read_text()
+    assert combined_text == expected_fasta_with_seqio(tmp_path)
+
+
+def test_convert_cif_to_fasta_per_chain_files(tmp_path, id_file):
+    fasta_out_dir = tmp_path / "fasta"
+    fasta_out_dir.mkdir()
+    combined_path = tmp_path / "merged.fasta"
+    result = CliRunner().invoke(
+        cli,
+        [
+            SUBCOMMAND,
+            "--cif_in_dir",
+            str(CIF_DIR),
+            "--id_file",
+            str(id_file),
+            "--cif_suffix",
+            CIF_SUFFIX,
+            "--fasta_out_dir",
+            str(fasta_out_dir),
+            "--combined_fasta_file",
+            str(combined_path),
+        ],
+    )
+    assert result.exit_code == 0
+
+    chain_records = []
+    for af_chain_id in AF_CHAIN_IDS:
+        fasta_path = fasta_out_dir / f"{af_chain_id}.cif.fasta"
+        (record,) = SeqIO.parse(fasta_path, "fasta")
+        chain_records.append((record.id, str(record.seq)))
+    combined_records = [
+        (record.id, str(record.seq)) for record in SeqIO.parse(combined_path, "fasta")
+    ]
+    assert combined_records == chain_records
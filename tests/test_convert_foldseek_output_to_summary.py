@@ -0,0 +1,157 @@
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import cli
+from cath_alphaflow.io_utils import FOLDSEEK_FIELDNAMES
+
+SUBCOMMAND = "convert-foldseek-output-to-summary"
+
+ID_FILE_CONTENT = """af_domain_id
+AF-P00520-F1-model_v4/22-322
+AF-Q15772-F3-model_v4/1-100
+AF-Q96HM7-F1-model_v4/5-200
+"""
+
+
+def fs_row(query, target, tcov, bits):
+    return "\t".join(
+        [query, target, "7", "271", "301", "3", "252", "274", "0.880", tcov, bits]
+        + ["1.305E-11"]
+    )
+
+
+FS_ROWS = [
+    # not in id file
+    fs_row("AF-A0A059CHW2-F1-model_v4-22-322.cif", "1xhlA00", "0.912", "509"),
+    fs_row("AF-Q15772-F3-model_v4-1-100.cif", "2aaaA00", "0.900", "300"),
+    fs_row("AF-P00520-F1-model_v4-22-322.cif", "1xhlA00", "0.912", "509"),
+    # tcov too low
+    fs_row("AF-P00520-F1-model_v4-22-322.cif", "3cccA00", "0.500", "900"),
+    # tie with first hit (first hit is kept)
+    fs_row("AF-P00520-F1-model_v4-22-322.cif", "4dddA00", "0.912", "509"),
+    fs_row("AF-Q15772-F3-model_v4-1-100.cif", "5eeeA00", "0.900", "350"),
+    # bits too low
+    fs_row("AF-Q96HM7-F1-model_v4-5-200.cif", "6fffA00", "0.990", "160"),
+    fs_row("AF-P00520-F1-model_v4-22-322.cif", "7gggA00", "0.950", "510"),
+]
+
+
+@pytest.mark.parametrize("batch_size", ["1000", "1", "3"])
+def test_convert_foldseek_output_to_summary(batch_size):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("ids.txt").write_text(ID_FILE_CONTENT)
+        Path("fs_results.m8").write_text("\n".join(FS_ROWS) + "\n")
+
+        result = runner.invoke(
+            cli,
+            [
+                SUBCOMMAND,
+                "--id_file",
+                "ids.txt",
+                "--fs_input_file",
+                "fs_results.m8",
+                "--fs_results",
+                "fs_summary.tsv",
+                "--batch_size",
+                batch_size,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        assert "DONE" in result.output
+
+        lines = Path("fs_summary.tsv").read_text().splitlines()
+
+    assert lines == [
+        "\t".join(FOLDSEEK_FIELDNAMES),
+        FS_ROWS[5],
+        FS_ROWS[7],
+    ]
+
+
+CATH_DOMAIN_LIST_CONTENT = """#---------------------------------------------------------------------
+# FILE NAME:    CathDomainList
+#---------------------------------------------------------------------
+1xhlA00     3    40    50   720     1     1     1     1     1   274 1.800
+2aaaA00     3    40    50   720     2     1     1     1     1   250 2.000
+4dddA00     1    10    10    10     1     1     1     1     1   200 2.500
+5eeeA00     2    60    40    10     1     1     1     1     1   180 1.500
+7gggA00     3    40    50   720     3     1     1     1     1   260 1.900
+"""
+
+
+@pytest.mark.parametrize("batch_size", ["1000", "1", "3"])
+def test_convert_foldseek_output_to_summary_top_hits(batch_size):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("ids.txt").write_text(ID_FILE_CONTENT)
+        Path("fs_results.m8").write_text("\n".join(FS_ROWS) + "\n")
+        Path("CathDomainList").write_text(CATH_DOMAIN_LIST_CONTENT)
+
+        result = runner.invoke(
+            cli,
+            [
+                SUBCOMMAND,
+                "--id_file",
+                "ids.txt",
+                "--fs_input_file",
+                "fs_results.m8",
+                "--fs_results",
+                "fs_summary.tsv",
+                "--batch_size",
+                batch_size,
+                "--top_k",
+                "2",
+                "--cath_domain_list",
+                "CathDomainList",
+                "--fs_top_hits",
+                "fs_top_hits.tsv",
+                "--fs_top_superfamily_hits",
+                "fs_top_sfam_hits.tsv",
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        top_hits = Path("fs_top_hits.tsv").read_text().splitlines()
+        top_sfam_hits = Path("fs_top_sfam_hits.tsv").read_text().splitlines()
+
+    header = "\t".join([*FOLDSEEK_FIELDNAMES, "superfamily", "rank"])
+    assert top_hits == [
+        header,
+        FS_ROWS[5] + "\t2.60.40.10\t1",
+        FS_ROWS[1] + "\t3.40.50.720\t2",
+        FS_ROWS[7] + "\t3.40.50.720\t1",
+        FS_ROWS[2] + "\t3.40.50.720\t2",
+    ]
+    assert top_sfam_hits == [
+        header,
+        FS_ROWS[5] + "\t2.60.40.10\t1",
+        FS_ROWS[1] + "\t3.40.50.720\t2",
+        FS_ROWS[7] + "\t3.40.50.720\t1",
+        FS_ROWS[4] + "\t1.10.10.10\t2",
+    ]
+
+
+def test_convert_foldseek_output_to_summary_needs_domain_list():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("ids.txt").write_text(ID_FILE_CONTENT)
+        Path("fs_results.m8").write_text("\n".join(FS_ROWS) + "\n")
+        result = runner.invoke(
+            cli,
+            [
+                SUBCOMMAND,
+                "--id_file",
+                "ids.txt",
+                "--fs_input_file",
+                "fs_results.m8",
+                "--fs_results",
+                "fs_summary.tsv",
+                "--fs_top_superfamily_hits",
+                "fs_top_sfam_hits.tsv",
+            ],
+        )
+        assert result.exit_code != 0
+        assert "--cath_domain_list" in result.output
@@ -65,3 +65,39 @@ def test_create_dataset_uniprot_ids(create_mock_query):
 
         assert headers == ["uniprot_acc"]
         assert rows == [[expected_uniprot_id]]
+
+
+def test_create_dataset_uniprot_ids_are_unique(create_mock_query):
+
+    mock_rows = [
+        {"uniprot_acc": "P00520", "min_indp_evalue": 1e-60},
+        {"uniprot_acc": "P00520", "min_indp_evalue": 1e-60},
+        {"uniprot_acc": "Q12345", "min_indp_evalue": 1e-55},
+    ]
+    expected_outfile = "uniprot_ids.csv"
+
+    runner = CliRunner()
+    create_mock_query(["uniprot_acc", "min_indp_evalue"], mock_rows)
+    with runner.isolated_filesystem():
+        result = runner.invoke(
+            cli,
+            [
+                "create-dataset-uniprot-ids",
+                "--uniprot_ids_csv",
+                expected_outfile,
+                "--max_records",
+                100,
+                "--arraysize",
+                500,
+            ],
+        )
+        assert result.exit_code == 0
+        assert "DONE" in result.output
+
+        with Path(expected_outfile).open("rt") as fh:
+            csvreader = csv.reader(fh)
+            headers = next(csvreader)
+            rows = list(csvreader)
+
+        assert headers == ["uniprot_acc"]
+        assert rows == [["P00520"], ["Q12345"]]
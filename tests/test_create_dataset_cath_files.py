@@ -1,9 +1,14 @@
+import io
 import pytest
 from pathlib import Path
 import logging
 from click.testing import CliRunner
 from cath_alphaflow.cli import cli
+from cath_alphaflow.errors import ArgumentError
 from cath_alphaflow.io_utils import DecoratedCrhReader, Gene3DCrhReader
+from cath_alphaflow.predicted_domain_provider import (
+    DecoratedCrhPredictedCathDomainProvider,
+)
 import shutil
 import os
 
@@ -198,7 +203,13 @@ def test_create_dataset_crh_output(subcommand, extras_arg_tmpfile_src):
             shared_args.extend([opt, outfilename])
 
         for cmd_arg, tmpfilename, src_path in extras_arg_tmpfile_src:
-            shutil.copy2(str(src_path), tmpfilename)
+            if cmd_arg == "--csv_uniprot_ids":
+                # the UniProt reader expects a header
+                with open(tmpfilename, "wt") as fh:
+                    fh.write("uniprot_id\n")
+                    fh.write(src_path.read_text())
+            else:
+                shutil.copy2(str(src_path), tmpfilename)
             extra_args.extend([cmd_arg, tmpfilename])
 
         result = runner.invoke(cli, [subcommand, *shared_args, *extra_args])
@@ -303,3 +314,150 @@ def test_create_dataset_db_command(create_mock_query):
         for name, filename in expected_outfiles.items():
             expected_outfile_path = Path(filename)
             assert expected_outfile_path.exists()
+
+
+def test_decorated_crh_provider_in_chunks():
+    """
+    Checks the CRH file is rescanned (and filtered) for each chunk of UniProt ids
+    """
+
+    with TEST_UNIPROT_IDS_FILE.open("rt") as fh:
+        uniprot_ids = [line.strip() for line in fh if line.strip()]
+    chunks = [uniprot_ids[:20], uniprot_ids[20:]]
+
+    with TEST_DECORATED_CRH_FILE.open("rt") as crh_fh:
+        provider = DecoratedCrhPredictedCathDomainProvider(
+            datasource=crh_fh, af_uniprot_md5_file=str(TEST_AF_UNIPROT_MD5_FILE)
+        )
+        entries_by_chunk = [
+            list(provider.next_cath_dataset_entry(uniprot_ids=chunk))
+            for chunk in chunks
+        ]
+
+    for chunk, entries in zip(chunks, entries_by_chunk):
+        assert entries
+        assert {entry.uniprot_acc for entry in entries} <= set(chunk)
+
+    with TEST_AF_CATH_ANNOTATIONS_FILE.open("rt") as fh:
+        expected_count = len(fh.readlines()) - 1
+    assert sum(len(entries) for entries in entries_by_chunk) == expected_count
+
+
+def test_decorated_crh_provider_rejects_stdin_lookup():
+    """
+    Checks the MD5 lookup is not built from an input that cannot be reopened
+    """
+
+    with TEST_DECORATED_CRH_FILE.open("rt") as crh_fh:
+        stdin_fh = io.StringIO(TEST_AF_UNIPROT_MD5_FILE.read_text())
+        stdin_fh.name = "<stdin>"
+        provider = DecoratedCrhPredictedCathDomainProvider(
+            datasource=crh_fh, af_uniprot_md5_file=stdin_fh
+        )
+        with pytest.raises(ArgumentError, match="regular file"):
+            list(provider.next_cath_dataset_entry(uniprot_ids=UNIPROT_IDS))
+
+
+@pytest.mark.parametrize("chunk_size", ["1000", "5"])
+def test_create_dataset_from_files_with_crh_index(chunk_size):
+    """
+    Checks the indexed CRH provider gives the same annotations as a full scan
+    """
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+
+        # the UniProt reader expects a header
+        with open("uniprot_ids.csv", "wt") as fh:
+            fh.write("uniprot_id\n")
+            fh.write(TEST_UNIPROT_IDS_FILE.read_text())
+
+        args = [
+            COMMAND_FILES,
+            "--csv_uniprot_ids",
+            "uniprot_ids.csv",
+            "--src_af_uniprot_md5",
+            str(TEST_AF_UNIPROT_MD5_FILE),
+            "--src_decorated_crh",
+            str(TEST_DECORATED_CRH_FILE),
+            "--crh_index",
+            "crh_index",
+            "--af_uniprot_md5_lookup",
+            "md5_lookup",
+            "--chunk",
+            chunk_size,
+        ]
+        for opt in OUTPUT_OPTIONS:
+            args.extend([opt, opt.replace("--", "") + ".txt"])
+
+        result = runner.invoke(cli, args)
+        assert result.exception is None
+        assert result.exit_code == 0
+        assert Path("crh_index", "offsets.npy").exists()
+        assert Path("md5_lookup", "md5.npy").exists()
+
+        annotations_path = Path("af_cath_annotations.txt")
+        if chunk_size == "1000":
+            assert_files_match(
+                test=annotations_path, expected=TEST_AF_CATH_ANNOTATIONS_FILE
+            )
+        else:
+            # rows are grouped by chunk, so just check the content
+            with annotations_path.open("rt") as fh:
+                got_lines = fh.readlines()
+            with TEST_AF_CATH_ANNOTATIONS_FILE.open("rt") as fh:
+                expected_lines = fh.readlines()
+            assert got_lines[0] == expected_lines[0]
+            assert sorted(got_lines[1:]) == sorted(expected_lines[1:])
+
+        # second run reuses the persisted index
+        index_mtime = Path("crh_index", "offsets.npy").stat().st_mtime_ns
+        result = runner.invoke(cli, args)
+        assert result.exit_code == 0
+        assert Path("crh_index", "offsets.npy").stat().st_mtime_ns == index_mtime
+
+
+@pytest.mark.parametrize("sort_buffer_rows", ["1000000", "3"])
+def test_create_dataset_from_files_with_sort_merge_join(sort_buffer_rows):
+    """
+    Checks the sort / merge join gives the same annotations as a full scan
+    """
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+
+        # the UniProt reader expects a header (and duplicate ids are only written once)
+        with open("uniprot_ids.csv", "wt") as fh:
+            fh.write("uniprot_id\n")
+            fh.write(TEST_UNIPROT_IDS_FILE.read_text())
+            fh.write(TEST_UNIPROT_IDS_FILE.read_text())
+
+        args = [
+            COMMAND_FILES,
+            "--csv_uniprot_ids",
+            "uniprot_ids.csv",
+            "--src_af_uniprot_md5",
+            str(TEST_AF_UNIPROT_MD5_FILE),
+            "--src_decorated_crh",
+            str(TEST_DECORATED_CRH_FILE),
+            "--sort_merge_join",
+            "--sort_buffer_rows",
+            sort_buffer_rows,
+        ]
+        for opt in OUTPUT_OPTIONS:
+            args.extend([opt, opt.replace("--", "") + ".txt"])
+
+        result = runner.invoke(cli, args)
+        assert result.exception is None
+        assert result.exit_code == 0
+
+        # rows are ordered by MD5, so just check the content
+        with Path("af_cath_annotations.txt").open("rt") as fh:
+            got_lines = fh.readlines()
+        with TEST_AF_CATH_ANNOTATIONS_FILE.open("rt") as fh:
+            expected_lines = fh.readlines()
+        assert got_lines[0] == expected_lines[0]
+        assert sorted(got_lines[1:]) == sorted(expected_lines[1:])
+
+        with Path("af_domainlist_ids.txt").open("rt") as fh:
+            assert len(fh.readlines()) == len(expected_lines)
@@ -1,8 +1,14 @@
+import gzip
 import os
 from tempfile import NamedTemporaryFile
 from pathlib import Path
+
+import pytest
+from Bio import SeqIO
 from click.testing import CliRunner
 from cath_alphaflow.cli import cli
+from cath_alphaflow.io_utils import get_af_uniprot_md5_summary_writer
+from cath_alphaflow.seq_utils import str_to_md5
 from cath_alphaflow.commands.create_md5 import (
     create_md5,
 )
@@ -56,3 +62,67 @@ AF-A0A428DD76-F1	A0A428DD76	597ef8c3d835b2554d1a79dbaef616e1
         for line in output_path.open("rt"):
             actual_tsv_content += line
     assert actual_tsv_content == expected_tsv_content
+
+
+def create_md5_with_seqio(fasta_path, out_path):
+    # reference output (as previously written with SeqIO)
+    with fasta_path.open("rt") as fasta_fh, out_path.open("wt") as out_fh:
+        writer = get_af_uniprot_md5_summary_writer(out_fh)
+        for record in SeqIO.parse(fasta_fh, "fasta"):
+            af_chain_id = record.id[5:] if record.id.startswith("AFDB:") else record.id
+            writer.writerow(
+                {
+                    "af_chain_id": af_chain_id,
+                    "uniprot_id": af_chain_id.split("-")[1],
+                    "sequence_md5": str_to_md5(str(record.seq)),
+                }
+            )
+
+
+@pytest.mark.parametrize(
+    "gzipped,extra_args",
+    [
+        (False, []),
+        (False, ["--chunk_bytes", "100", "--jobs", "2"]),
+        (True, ["--chunk_bytes", "100"]),
+        (True, ["--chunk_bytes", "100", "--jobs", "2"]),
+    ],
+)
+def test_create_md5_matches_seqio(tmp_path, gzipped, extra_args):
+    expected_path = tmp_path / "expected.csv"
+    create_md5_with_seqio(EXAMPLE_FASTA_FILE, expected_path)
+
+    fasta_path = EXAMPLE_FASTA_FILE
+    if gzipped:
+        fasta_path = tmp_path / "test.fasta.gz"
+        fasta_path.write_bytes(gzip.compress(EXAMPLE_FASTA_FILE.read_bytes()))
+
+    out_path = tmp_path / "output.csv"
+    result = CliRunner().invoke(
+        cli,
+        [
+            SUBCOMMAND,
+            "--fasta",
+            str(fasta_path),
+            "--uniprot_md5_csv",
+            str(out_path),
+            *extra_args,
+        ],
+    )
+    assert result.exit_code == 0
+    assert out_path.read_bytes() == expected_path.read_bytes()
+
+
+def test_create_md5_quotes_ids_like_seqio(tmp_path):
+    fasta_path = tmp_path / "test.fasta"
+    fasta_path.write_bytes(b'>AF-"Q"-F1 quoted\nMKV\n>AFDB:AF-P12345-F1\nGGG\n')
+    expected_path = tmp_path / "expected.csv"
+    create_md5_with_seqio(fasta_path, expected_path)
+
+    out_path = tmp_path / "output.csv"
+    result = CliRunner().invoke(
+        cli,
+        [SUBCOMMAND, "--fasta", str(fasta_path), "--uniprot_md5_csv", str(out_path)],
+    )
+    assert result.exit_code == 0
+    assert out_path.read_bytes() == expected_path.read_bytes()
@@ -53,3 +53,25 @@ def test_yieldall(create_mock_query):
     entries = list(db.yieldall(sql, sql_args, return_type=dict))
 
     assert entries == mock_rows
+
+
+def test_yieldall_arraysize(create_mock_query):
+    mock_rows = [{"uniprot_acc": "P00520"}]
+    create_mock_query(description=["uniprot_acc"], rows=mock_rows)
+
+    db = OraDB()
+    cursors = []
+    get_mock_cursor = db.conn.cursor
+
+    def get_tracked_cursor(*args, **kwargs):
+        curs = get_mock_cursor()
+        cursors.append(curs)
+        return curs
+
+    db.conn.cursor = get_tracked_cursor
+
+    entries = list(db.yieldall("select * from foo", {}, arraysize=5000))
+
+    assert entries == mock_rows
+    assert cursors[0].arraysize == 5000
+    assert cursors[0].prefetchrows == 5001
@@ -1,4 +1,6 @@
+import logging
 import os
+import shutil
 from pathlib import Path
 from click.testing import CliRunner
 from cath_alphaflow.cli import cli
@@ -90,3 +92,28 @@ def test_extract_LUR_summary(tmp_path):
     )
     del chopping
     del lur_summary
+
+
+def test_convert_cif_to_plddt_summary_reports_progress(tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    shutil.copy(EXAMPLE_CIF_FILE, tmp_path / "AF-P00520-F1-model_v3.cif.gz")
+    id_path = tmp_path / "ids.txt"
+    id_path.write_text("af_domain_id\nAF-P00520-F1-model_v3/10-20\n")
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            SUBCOMMAND,
+            "--cif_in_dir",
+            str(tmp_path),
+            "--id_file",
+            str(id_path),
+            "--plddt_stats_file",
+            str(tmp_path / "plddt.tsv"),
+            "--cif_suffix",
+            ".cif.gz",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "Processed 1 domains" in caplog.text
@@ -0,0 +1,77 @@
+import io
+from pathlib import Path
+
+import pytest
+from Bio import SeqIO
+
+from cath_alphaflow.errors import ParseError
+from cath_alphaflow.fasta_utils import (
+    find_fasta_chunk_ranges,
+    iter_fasta_blocks,
+    iter_fasta_records,
+    read_fasta_chunk,
+)
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+EXAMPLE_FASTA_FILE = FIXTURE_PATH / "fasta" / "fasta_test10.fasta"
+
+# multi-line sequences, spaces, tabs, CRLF, blank lines, empty title / sequence
+AWKWARD_FASTA = (
+    b">seq1 first record\nMKV LA\nGG\tG\n\n"
+    b">seq2\r\nAAAA\r\nCCCC\r\n"
+    b">\nMMM\n"
+    b">seq4  \n"
+    b">seq5 last record without newline\nWWW"
+)
+
+
+def seqio_records(data: bytes):
+    return [
+        (record.id, str(record.seq).encode())
+        for record in SeqIO.parse(io.StringIO(data.decode()), "fasta")
+    ]
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 30, 1024])
+def test_chunk_ranges_match_seqio(tmp_path, chunk_bytes):
+    fasta_path = tmp_path / "test.fasta"
+    fasta_path.write_bytes(AWKWARD_FASTA)
+
+    ranges = find_fasta_chunk_ranges(fasta_path, chunk_bytes=chunk_bytes)
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(AWKWARD_FASTA)
+    records = [
+        record
+        for start, end in ranges
+        for record in iter_fasta_records(read_fasta_chunk(fasta_path, start, end))
+    ]
+    assert records == seqio_records(AWKWARD_FASTA)
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 30, 1024])
+def test_blocks_match_seqio(chunk_bytes):
+    blocks = list(iter_fasta_blocks(io.BytesIO(AWKWARD_FASTA), chunk_bytes=chunk_bytes))
+    assert b"".join(blocks) == AWKWARD_FASTA
+    records = [record for block in blocks for record in iter_fasta_records(block)]
+    assert records == seqio_records(AWKWARD_FASTA)
+
+
+def test_example_fasta_matches_seqio():
+    data = EXAMPLE_FASTA_FILE.read_bytes()
+    assert list(iter_fasta_records(data)) == seqio_records(data)
+
+
+def test_fasta_must_start_with_record(tmp_path):
+    fasta_path = tmp_path / "test.fasta"
+    fasta_path.write_bytes(b"# comment\n" + AWKWARD_FASTA)
+    with pytest.raises(ParseError):
+        find_fasta_chunk_ranges(fasta_path)
+    with pytest.raises(ParseError):
+        list(iter_fasta_blocks(fasta_path.open("rb")))
+
+
+def test_empty_fasta(tmp_path):
+    fasta_path = tmp_path / "test.fasta"
+    fasta_path.write_bytes(b"")
+    assert find_fasta_chunk_ranges(fasta_path) == []
+    assert list(iter_fasta_blocks(io.BytesIO(b""))) == []
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import cli
+from cath_alphaflow.index_utils import Md5BloomFilter
+
+SUBCOMMAND = "filter-crh-by-md5"
+
+MD5_A = "000122ad8c8fccfd2991bbd4a138d3c6"
+MD5_B = "00015352b8446c4ccdb74461696a601f"
+MD5_MISSING = "0002fb2a82c8a28bb6119ed72997a450"
+
+# from create-md5 (with windows line endings)
+AF_UNIPROT_MD5_CONTENT = (
+    "af_chain_id\tuniprot_id\tsequence_md5\r\n"
+    f"AF-P00001-F1\tP00001\t{MD5_A}\r\n"
+    f"AF-P00002-F1\tP00002\t{MD5_B}\r\n"
+    f"AF-P00003-F1\tP00003\t{MD5_B}\r\n"
+    "AF-P00004-F1\tP00004\t0003aaaaaaaaaaaaaaaaaaaaaaaaaaaa\r\n"
+)
+
+CRH_CONTENT = (
+    f"{MD5_A}\t1c52A00__1.10.760.10/18-148\t146.2\t18-148\t18-148\n"
+    f"{MD5_A}\t1c52A00__1.10.760.10/18-148\t146.2\t18-148\t18-148\r\n"
+    f"{MD5_MISSING}\t2eslA00__2.40.100.10/12-200\t268.8\t12-200\t12-200\n"
+    f"{MD5_B}\t6dxpC00__3.40.50.360/1-202\t202.1\t1-202\t1-202\n"
+)
+
+AF_DOMAIN_LIST_CONTENT = (
+    "af_domain_id\n"
+    "AF-P00001-F1-model_v4/18-148\n"
+    "AF-P00002-F1-model_v4/1-202\n"
+    "AF-P00002-F1-model_v4/1-202\n"
+    "AF-P00004-F1-model_v4/1-100\n"
+    "AF-P00009-F1-model_v4/1-100\n"
+)
+
+
+def test_cli_usage():
+    runner = CliRunner()
+    result = runner.invoke(cli, [SUBCOMMAND, "--help"])
+    assert result.exit_code == 0
+    assert "Usage:" in result.output
+
+
+@pytest.mark.parametrize("bloom_args", [[], ["--bloom_error_rate", "1e-6"]])
+def test_filter_crh_by_md5(bloom_args):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("af_md5.tsv").write_bytes(AF_UNIPROT_MD5_CONTENT.encode())
+        Path("input.crh").write_bytes(CRH_CONTENT.encode())
+        Path("domains.txt").write_text(AF_DOMAIN_LIST_CONTENT)
+
+        result = runner.invoke(
+            cli,
+            [
+                SUBCOMMAND,
+                "--af_uniprot_md5",
+                "af_md5.tsv",
+                "--crh",
+                "input.crh",
+                "--af_domain_list",
+                "domains.txt",
+                "--crh_out",
+                "filtered.crh",
+                "--af_uniprot_md5_out",
+                "filtered_md5.tsv",
+                "--af_domain_list_out",
+                "filtered_domains.txt",
+                *bloom_args,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        assert "DONE" in result.output
+
+        assert Path("filtered.crh").read_text().splitlines() == [
+            f"{MD5_A}\t1c52A00__1.10.760.10/18-148\t146.2\t18-148\t18-148",
+            f"{MD5_B}\t6dxpC00__3.40.50.360/1-202\t202.1\t1-202\t1-202",
+        ]
+        assert Path("filtered_md5.tsv").read_text().splitlines() == [
+            "af_chain_id\tuniprot_id\tsequence_md5",
+            f"AF-P00001-F1\tP00001\t{MD5_A}",
+            f"AF-P00002-F1\tP00002\t{MD5_B}",
+            f"AF-P00003-F1\tP00003\t{MD5_B}",
+        ]
+        assert Path("filtered_domains.txt").read_text().splitlines() == [
+            "af_domain_id",
+            "AF-P00001-F1-model_v4/18-148",
+            "AF-P00002-F1-model_v4/1-202",
+        ]
+
+
+def test_md5_bloom_filter():
+    md5s = [MD5_A, MD5_B]
+    bloom = Md5BloomFilter(len(md5s), error_rate=1e-6)
+    bloom.add_many(md5s)
+    assert MD5_A in bloom
+    assert MD5_B in bloom
+    assert MD5_MISSING not in bloom
+
+    with pytest.raises(ValueError):
+        Md5BloomFilter(10, error_rate=0)
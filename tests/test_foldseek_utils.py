@@ -0,0 +1,147 @@
+import os
+import sys
+from pathlib import Path
+
+from cath_alphaflow import foldseek_utils
+from cath_alphaflow.foldseek_utils import (
+    concat_dbs,
+    create_sub_db,
+    get_keys_by_filename,
+    plan_incremental_update,
+    read_checksums,
+    read_lookup,
+    read_source,
+    replace_db,
+    run_foldseek_command,
+    write_checksums,
+)
+
+
+def create_fake_fs_db(fs_db, filenames):
+    """Writes the lookup / source files of a Foldseek DB (one entry per file)"""
+    with open(f"{fs_db}.lookup", "wt") as fh:
+        for key, filename in enumerate(filenames):
+            fh.write(f"{key}\t{filename}\t{key}\n")
+    with open(f"{fs_db}.source", "wt") as fh:
+        for file_id, filename in enumerate(filenames):
+            fh.write(f"{file_id}\t{filename}\n")
+
+
+def create_cif_files(cif_dir, contents_by_filename):
+    cif_dir.mkdir(exist_ok=True)
+    paths = []
+    for filename, contents in contents_by_filename.items():
+        path = cif_dir / filename
+        path.write_text(contents)
+        paths.append(path)
+    return paths
+
+
+def test_plan_incremental_update(tmp_path):
+    fs_db = tmp_path / "query.db"
+    cif_dir = tmp_path / "cif"
+    cif_paths = create_cif_files(
+        cif_dir, {"dom1.cif": "one", "dom2.cif": "two", "dom3.cif": "three"}
+    )
+    create_fake_fs_db(fs_db, ["dom1.cif", "dom2.cif"])
+
+    # no recorded checksums: files in the DB are assumed to be current
+    plan = plan_incremental_update(fs_db, cif_paths)
+    assert plan.new_paths == [cif_dir / "dom3.cif"]
+    assert plan.changed_paths == []
+    assert plan.stale_keys == set()
+    write_checksums(fs_db, plan.checksums)
+    assert set(read_checksums(fs_db)) == {"dom1.cif", "dom2.cif", "dom3.cif"}
+
+    # change the contents of one file
+    (cif_dir / "dom2.cif").write_text("two (updated)")
+    plan = plan_incremental_update(fs_db, cif_paths)
+    assert plan.changed_paths == [cif_dir / "dom2.cif"]
+    assert plan.stale_keys == {1}
+
+    # touching a file without changing the contents is not a change
+    write_checksums(fs_db, plan.checksums)
+    os.utime(cif_dir / "dom1.cif", ns=(0, 0))
+    plan = plan_incremental_update(fs_db, cif_paths)
+    assert plan.changed_paths == []
+    assert plan.checksums["dom1.cif"].mtime_ns == 0
+
+    # files that no longer exist are removed (if the directory is given)
+    (cif_dir / "dom1.cif").unlink()
+    cif_paths = [cif_dir / "dom2.cif", cif_dir / "dom3.cif"]
+    assert plan_incremental_update(fs_db, cif_paths).removed_filenames == []
+    plan = plan_incremental_update(fs_db, cif_paths, cif_dir=cif_dir)
+    assert plan.removed_filenames == ["dom1.cif"]
+    assert plan.stale_keys == {0}
+    assert set(plan.checksums) == {"dom2.cif", "dom3.cif"}
+
+
+def test_concat_dbs_merges_lookup(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(
+        foldseek_utils, "run_foldseek_command", lambda *args: commands.append(args)
+    )
+
+    db_a = tmp_path / "a.db"
+    db_b = tmp_path / "b.db"
+    merged_db = tmp_path / "merged.db"
+    create_fake_fs_db(db_a, ["dom1.cif", "dom2.cif"])
+    create_fake_fs_db(db_b, ["dom3.cif"])
+
+    concat_dbs("foldseek", db_a, db_b, merged_db)
+
+    # concatdbs is run for each part of the structure DB
+    assert [cmd[1] for cmd in commands] == ["concatdbs"] * 4
+    assert read_lookup(merged_db) == [
+        (0, "dom1.cif", 0),
+        (1, "dom2.cif", 1),
+        (2, "dom3.cif", 2),
+    ]
+    assert read_source(merged_db) == {0: "dom1.cif", 1: "dom2.cif", 2: "dom3.cif"}
+    assert get_keys_by_filename(merged_db)["dom3.cif"] == {2}
+
+
+def test_replace_db_with_soft_linked_sub_db(tmp_path):
+    # createsubdb (--subdb-mode 1) soft-links the data files of the DB it subsets
+    dest_db = tmp_path / "query.db"
+    sub_db = tmp_path / "sub.db"
+    create_fake_fs_db(dest_db, ["dom1.cif", "dom2.cif"])
+    create_fake_fs_db(sub_db, ["dom1.cif"])
+    for part in foldseek_utils.FS_DB_PARTS:
+        Path(f"{dest_db}{part}").write_text(f"data{part}")
+        Path(f"{sub_db}{part}").symlink_to(f"{dest_db}{part}")
+
+    replace_db(sub_db, dest_db)
+
+    for part in foldseek_utils.FS_DB_PARTS:
+        dest_path = Path(f"{dest_db}{part}")
+        assert not dest_path.is_symlink()
+        assert dest_path.read_text() == f"data{part}"
+        assert not Path(f"{sub_db}{part}").exists()
+    assert read_lookup(dest_db) == [(0, "dom1.cif", 0)]
+
+
+def test_create_sub_db_copies_data(tmp_path, monkeypatch):
+    commands = []
+    monkeypatch.setattr(
+        foldseek_utils,
+        "run_foldseek_command",
+        lambda *args, **kwargs: commands.append(args),
+    )
+    in_db = tmp_path / "query.db"
+    create_fake_fs_db(in_db, ["dom1.cif", "dom2.cif"])
+
+    create_sub_db("foldseek", [1], in_db, tmp_path / "sub.db", tmp_dir=tmp_path)
+
+    assert [cmd[1] for cmd in commands] == ["createsubdb"] * 4
+    assert all(cmd[-2:] == ("--subdb-mode", "0") for cmd in commands)
+    assert read_lookup(tmp_path / "sub.db") == [(1, "dom2.cif", 1)]
+
+
+def test_run_foldseek_command_logs_stderr(tmp_path):
+    log_path = tmp_path / "foldseek.log"
+    script = "import sys; print('out'); print('err', file=sys.stderr)"
+    run_foldseek_command(sys.executable, "-c", script, log_path=log_path)
+    log_lines = log_path.read_text().splitlines()
+    assert log_lines[0].startswith(f"# {sys.executable} -c")
+    assert log_lines[1:] == ["out", "err"]
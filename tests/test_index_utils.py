@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from cath_alphaflow.index_utils import (
+    CrhOffsetIndex,
+    Md5AfUniprotLookup,
+    get_md5_from_crh_line_func,
+    read_index_meta,
+)
+
+DATASET_DIR = Path(__file__).parent / "fixtures" / "dataset10"
+TEST_DECORATED_CRH_FILE = DATASET_DIR / "dataset10.decorated_crh.csv"
+TEST_GENE3D_CRH_FILE = DATASET_DIR / "dataset10.gene3d_crh.csv"
+TEST_AF_UNIPROT_MD5_FILE = DATASET_DIR / "dataset10.af_uniprot_md5.csv"
+
+
+def test_crh_offset_index(tmp_path):
+    md5_from_line = get_md5_from_crh_line_func(delimiter=b",", column=2)
+    index_dir = tmp_path / "crh_index"
+
+    index = CrhOffsetIndex.load_or_build(
+        TEST_DECORATED_CRH_FILE, index_dir, md5_from_line=md5_from_line
+    )
+    assert len(index) == 31
+    assert read_index_meta(index_dir)["count"] == 31
+
+    lines = list(index.yield_lines(["0001315b8bcda0cfacb1a2df673341d4"]))
+    assert len(lines) == 2
+    assert lines[0].startswith('"3fxaA00"')
+    assert lines[1].startswith('"3k2vA00"')
+
+    assert list(index.yield_lines(["ffffffffffffffffffffffffffffffff"])) == []
+
+    # reloading gives the same lookups
+    index = CrhOffsetIndex.load_or_build(
+        TEST_DECORATED_CRH_FILE, index_dir, md5_from_line=md5_from_line
+    )
+    assert len(index.offsets_for_md5("0001c5d32dccb8e03267c370872e1694")) == 17
+
+
+def test_crh_offset_index_gene3d(tmp_path):
+    md5_from_line = get_md5_from_crh_line_func(delimiter=b"\t", column=0)
+    index = CrhOffsetIndex.build(
+        TEST_GENE3D_CRH_FILE, tmp_path / "idx", md5_from_line=md5_from_line
+    )
+    lines = list(index.yield_lines(["000122ad8c8fccfd2991bbd4a138d3c6"]))
+    assert lines == [
+        "000122ad8c8fccfd2991bbd4a138d3c6\t1c52A00__1.10.760.10/18-148\t146.2\t18-148\t18-148\n"
+    ]
+
+
+def test_md5_af_uniprot_lookup(tmp_path):
+    lookup_dir = tmp_path / "md5_lookup"
+
+    expected_entries = {}
+    with TEST_AF_UNIPROT_MD5_FILE.open("rt") as fh:
+        for line in fh:
+            af_id, uniprot_id, md5 = line.split()
+            expected_entries.setdefault(md5, []).append((af_id, uniprot_id))
+
+    lookup = Md5AfUniprotLookup.load_or_build(TEST_AF_UNIPROT_MD5_FILE, lookup_dir)
+    assert len(lookup) == 34
+    assert read_index_meta(lookup_dir)["count"] == 34
+
+    # entries for each MD5 come back in input order
+    for md5, entries in expected_entries.items():
+        assert md5 in lookup
+        assert lookup.entries_for_md5(md5) == entries
+        for _af_id, uniprot_id in entries:
+            assert md5 in lookup.md5s_for_uniprot(uniprot_id)
+
+    assert "ffffffffffffffffffffffffffffffff" not in lookup
+    assert lookup.entries_for_md5("ffffffffffffffffffffffffffffffff") == []
+    assert lookup.md5s_for_uniprot("NOTAUNIPROTID") == []
+
+    # reloading uses the existing arrays
+    md5_mtime = (lookup_dir / "md5.npy").stat().st_mtime_ns
+    lookup = Md5AfUniprotLookup.load_or_build(TEST_AF_UNIPROT_MD5_FILE, lookup_dir)
+    assert (lookup_dir / "md5.npy").stat().st_mtime_ns == md5_mtime
+    assert lookup.md5s_for_uniprot("Q48RC3") == ["0002526b05a5fd23c2c90b7da32bf0d8"]
+
+
+def test_md5_af_uniprot_lookup_tmp_dir():
+    lookup = Md5AfUniprotLookup.load_or_build(TEST_AF_UNIPROT_MD5_FILE)
+    lookup_dir = lookup.lookup_dir
+    assert lookup_dir.exists()
+    assert len(lookup.entries_for_md5("0001315b8bcda0cfacb1a2df673341d4")) == 14
+
+    del lookup
+    assert not lookup_dir.exists()
@@ -1,8 +1,13 @@
+import io
 import logging
 import tempfile
 
+import pytest
+
 from cath_alphaflow.models.domains import AFChainID, AFDomainID
+from cath_alphaflow.commands.optimise_domain_boundaries import write_status_log
 from cath_alphaflow.io_utils import get_af_chain_id_reader, get_af_domain_id_reader
+from cath_alphaflow.io_utils import get_status_log_dictwriter
 from cath_alphaflow.io_utils import Gene3DCrhReader, DecoratedCrhReader
 from cath_alphaflow.models.domains import Gene3DCrh, DecoratedCrh, CrhBase
 
@@ -110,3 +115,31 @@ def test_decorated_crh_reader():
             assert isinstance(crh, CrhBase)
             crh.domain_id = "1c52A00"
             crh.superfamily_id = "1.10.760.10"
+
+
+def test_status_log_dictwriter():
+    """
+    Check that metric columns are only written when requested (unknown keys still fail)
+    """
+
+    for metrics, expected_header in [
+        (False, "entry_id\tstatus\terror\tdescription"),
+        (
+            True,
+            "entry_id\tstatus\terror\tdescription\t"
+            "elapsed_seconds\tinput_bytes\tresidue_count",
+        ),
+    ]:
+        fh = io.StringIO()
+        status_log = get_status_log_dictwriter(fh, metrics=metrics)
+        write_status_log(
+            status_log, "dom1", "SUCCESS", "", "ok", elapsed_seconds=1.23456
+        )
+        lines = fh.getvalue().splitlines()
+        assert lines[0] == expected_header
+        assert lines[1].startswith("dom1\tSUCCESS\t\tok")
+        assert ("1.2346" in lines[1]) == metrics
+
+    status_log = get_status_log_dictwriter(io.StringIO())
+    with pytest.raises(ValueError):
+        status_log.writerow({"entry_id": "dom1", "stauts": "SUCCESS"})
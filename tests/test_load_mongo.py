@@ -1,14 +1,34 @@
 import gzip
 import io
+import tarfile
+import types
+import typing
 from pathlib import Path
+import pydantic
 import pytest
 
+from cath_alphaflow.commands import load_mongo
 from cath_alphaflow.commands.load_mongo import (
     get_beacons_uniprot_summary_from_af_cif,
     beacons,
 )
+from cath_alphaflow.errors import ParseError
+from cath_alphaflow.models.mongo import AFFile
 
 CIF_DIR = Path(__file__).parent / "fixtures" / "cif"
+CIF_FILENAMES = [
+    "AF-P00520-F1-model_v3.cif.gz",
+    "AF-Q15772-F3-model_v4.cif.gz",
+    "AF-Q15772-F11-model_v4.cif.gz",
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_mongo_clients():
+    # tests replace MongoClient, so clients must not be reused between tests
+    load_mongo.get_mongo_client.cache_clear()
+    yield
+    load_mongo.get_mongo_client.cache_clear()
 
 
 @pytest.mark.parametrize(
@@ -28,3 +48,493 @@ def test_get_beacons_uniprot_summary_from_af_cif(example_cif_fname, uniprot_id):
         )
         assert isinstance(uniprot_summary, beacons.UniprotSummary)
         assert uniprot_summary.uniprot_entry.ac == uniprot_id
+
+
+class FakeCollection:
+    """In-memory stand-in for the pymongo collection used by the loader"""
+
+    def __init__(self):
+        self.docs = {}
+        self.bulk_write_sizes = []
+        self.find_count = 0
+        self.indexes = {"_id_": None}
+
+    def index_information(self):
+        return dict(self.indexes)
+
+    def create_indexes(self, indexes):
+        for index in indexes:
+            self.indexes[index.document["name"]] = index.document
+
+    def drop_index(self, index_name):
+        del self.indexes[index_name]
+
+    def find(self, criteria, projection=None):
+        self.find_count += 1
+        filenames = set(criteria["fileName"]["$in"])
+        return [
+            {"fileName": doc["fileName"]}
+            for doc in self.docs.values()
+            if doc["dataset"] == criteria["dataset"] and doc["fileName"] in filenames
+        ]
+
+    def bulk_write(self, requests, ordered=True):
+        self.bulk_write_sizes.append(len(requests))
+        for request in requests:
+            key = (request._filter["dataset"], request._filter["fileName"])
+            doc = self.docs.setdefault(key, dict(request._filter))
+            doc.update(request._doc["$set"])
+            for field in request._doc.get("$unset", {}):
+                doc.pop(field, None)
+
+
+class FakeGridFSBucket:
+    """In-memory stand-in for GridFS"""
+
+    files = {}
+
+    def __init__(self, database, bucket_name):
+        pass
+
+    def delete(self, file_id):
+        if file_id not in self.files:
+            raise load_mongo.gridfs.errors.NoFile(file_id)
+        del self.files[file_id]
+
+    def upload_from_stream_with_id(self, file_id, filename, data):
+        self.files[file_id] = data
+
+    def open_download_stream(self, file_id):
+        return io.BytesIO(self.files[file_id])
+
+    def find(self, criteria):
+        file_ids = set(criteria["_id"]["$in"])
+        return [
+            types.SimpleNamespace(_id=file_id)
+            for file_id in list(self.files)
+            if file_id in file_ids
+        ]
+
+
+@pytest.fixture(autouse=True)
+def fake_gridfs(monkeypatch):
+    monkeypatch.setattr(load_mongo.gridfs, "GridFSBucket", FakeGridFSBucket)
+    monkeypatch.setattr(FakeGridFSBucket, "files", {})
+
+
+class FakeLedgerCollection:
+    """In-memory stand-in for the archive ledger collection"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, criteria, projection=None):
+        archive_paths = set(criteria["archivePath"]["$in"])
+        return [
+            dict(doc)
+            for (dataset, archive_path), doc in self.docs.items()
+            if dataset == criteria["dataset"] and archive_path in archive_paths
+        ]
+
+    def update_one(self, criteria, update, upsert=False):
+        key = (criteria["dataset"], criteria["archivePath"])
+        doc = self.docs.setdefault(key, dict(criteria))
+        doc.update(update["$set"])
+
+
+class FakeDatabase:
+    def __init__(self, collection, ledger_collection):
+        self.afCollection = collection
+        self.ledger_collection = ledger_collection
+
+    def __getitem__(self, name):
+        assert name == load_mongo.AF_LOAD_LEDGER_COLLECTION
+        return self.ledger_collection
+
+
+class FakeMongoClient:
+    def __init__(self, collection, ledger_collection=None):
+        if ledger_collection is None:
+            ledger_collection = FakeLedgerCollection()
+        self.models = FakeDatabase(collection, ledger_collection)
+
+
+def create_archive(archive_path, filenames):
+    with tarfile.open(archive_path, "w") as tar:
+        for filename in filenames:
+            tar.add(str(CIF_DIR / filename), arcname=filename)
+
+
+def test_run_batches_and_skips_existing(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+    )
+    assert collection.bulk_write_sizes == [2, 1]
+    assert collection.find_count == 2
+    assert sorted(fileName for _, fileName in collection.docs) == sorted(CIF_FILENAMES)
+    doc = collection.docs[("test", "AF-P00520-F1-model_v3.cif.gz")]
+    assert doc["uniprotAccession"] == "P00520"
+    assert doc["uniprot_summary"]["uniprot_entry"]["ac"] == "P00520"
+
+    # everything is already loaded
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+    )
+    assert collection.bulk_write_sizes == [2, 1]
+
+
+def test_run_pipeline(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=1,
+        workers=2,
+        queue_size=1,
+        validate_every=1,
+    )
+    assert collection.bulk_write_sizes == [1, 1, 1]
+    assert [fileName for _, fileName in collection.docs] == CIF_FILENAMES
+
+    # the parallel and serial loaders create the same documents
+    serial_collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo,
+        "MongoClient",
+        lambda url: FakeMongoClient(serial_collection),
+    )
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+    )
+    for key, doc in serial_collection.docs.items():
+        expected_doc = {**doc, "id": None}
+        assert {**collection.docs[key], "id": None} == expected_doc
+
+
+def test_run_pipeline_reports_parse_errors(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    bad_path = tmp_path / "AF-P99999-F1-model_v4.cif.gz"
+    bad_path.write_bytes(gzip.compress(b"data_bad\n"))
+    with tarfile.open(archive_path, "w") as tar:
+        tar.add(str(CIF_DIR / CIF_FILENAMES[0]), arcname=CIF_FILENAMES[0])
+        tar.add(str(bad_path), arcname=bad_path.name)
+
+    with pytest.raises(KeyError):
+        load_mongo.run(
+            archive_paths=[str(archive_path)],
+            dataset="test",
+            mongo_db_url="mongodb://fake",
+            batch_size=1,
+            workers=2,
+        )
+
+
+@pytest.mark.parametrize(
+    "contents_mode,max_inline_bytes,expected_gridfs_count",
+    [
+        ["text", None, 0],
+        ["gzip", None, 0],
+        ["gzip", 1000, 3],
+        ["gridfs", None, 3],
+    ],
+)
+def test_run_contents_modes(
+    contents_mode, max_inline_bytes, expected_gridfs_count, tmp_path, monkeypatch
+):
+    collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    if max_inline_bytes:
+        monkeypatch.setattr(load_mongo, "MAX_INLINE_CONTENTS_BYTES", max_inline_bytes)
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+        contents_mode=contents_mode,
+    )
+    assert len(FakeGridFSBucket.files) == expected_gridfs_count
+    for filename in CIF_FILENAMES:
+        doc = collection.docs[("test", filename)]
+        assert doc["uniprot_summary"]["uniprot_entry"]["ac"] in filename
+        with gzip.open(str(CIF_DIR / filename), "rt") as fh:
+            expected_contents = fh.read()
+        assert load_mongo.read_af_file_contents(doc, database="db") == expected_contents
+
+    # reloading in another mode replaces the contents fields
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+        force_overwrite=True,
+    )
+    doc = collection.docs[("test", CIF_FILENAMES[0])]
+    assert isinstance(doc["contents"], str)
+    assert "contentsEncoding" not in doc
+    assert "contentsFileId" not in doc
+    # the contents previously stored in GridFS are removed
+    assert FakeGridFSBucket.files == {}
+
+
+def test_run_fresh_load_does_not_query_gridfs(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+
+    def find(self, criteria):
+        raise AssertionError("GridFS should only be queried when reloading")
+
+    monkeypatch.setattr(FakeGridFSBucket, "find", find)
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+    )
+    assert len(collection.docs) == len(CIF_FILENAMES)
+
+
+def get_nested_model(annotation):
+    """Returns the pydantic model in a field annotation (e.g. `Optional[List[Model]]`)"""
+    if isinstance(annotation, type) and issubclass(annotation, pydantic.BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        model = get_nested_model(arg)
+        if model is not None:
+            return model
+    return None
+
+
+def assert_fields_match_model(doc, model_class, path):
+    assert list(doc) == list(model_class.model_fields), path
+    for name, field in model_class.model_fields.items():
+        nested_model = get_nested_model(field.annotation)
+        if nested_model is None or doc[name] is None:
+            continue
+        values = doc[name] if isinstance(doc[name], list) else [doc[name]]
+        assert values, f"{path}.{name}"
+        for value in values:
+            assert_fields_match_model(value, nested_model, f"{path}.{name}")
+
+
+def test_make_af_document_has_every_model_field():
+    # every field of the models (at every level) must be set by the dict builders
+    filename = CIF_FILENAMES[0]
+    af_file_dict = load_mongo.make_af_document(
+        gzip_bytes=(CIF_DIR / filename).read_bytes(), filename=filename, dataset="test"
+    )
+    assert_fields_match_model(af_file_dict, AFFile, "AFFile")
+
+
+@pytest.mark.parametrize("contents_mode", load_mongo.CONTENTS_MODES)
+@pytest.mark.parametrize("example_cif_fname", CIF_FILENAMES)
+def test_make_af_document_matches_model(example_cif_fname, contents_mode):
+    gzip_bytes = (CIF_DIR / example_cif_fname).read_bytes()
+    af_file_dict = load_mongo.make_af_document(
+        gzip_bytes=gzip_bytes,
+        filename=example_cif_fname,
+        dataset="test",
+        contents_mode=contents_mode,
+    )
+    expected_dict = load_mongo.make_af_file(
+        tarfileobj=io.BytesIO(gzip_bytes),
+        filename=example_cif_fname,
+        dataset="test",
+        contents_mode=contents_mode,
+    ).dict()
+    expected_dict["id"] = af_file_dict["id"]
+    assert af_file_dict == expected_dict
+    # same field order (so the stored documents are identical)
+    assert repr(af_file_dict) == repr(expected_dict)
+
+    load_mongo.validate_af_document(
+        af_file_dict,
+        gzip_bytes=gzip_bytes,
+        filename=example_cif_fname,
+        dataset="test",
+        contents_mode=contents_mode,
+    )
+    af_file_dict["uniprot_summary"]["uniprot_entry"]["segment_end"] += 1
+    with pytest.raises(ParseError):
+        load_mongo.validate_af_document(
+            af_file_dict,
+            gzip_bytes=gzip_bytes,
+            filename=example_cif_fname,
+            dataset="test",
+            contents_mode=contents_mode,
+        )
+
+
+def test_run_multiple_archives_with_ledger(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    ledger_collection = FakeLedgerCollection()
+    monkeypatch.setattr(
+        load_mongo.pymongo,
+        "MongoClient",
+        lambda url: FakeMongoClient(collection, ledger_collection),
+    )
+    for archive_num, filename in enumerate(CIF_FILENAMES):
+        create_archive(tmp_path / f"proteome_{archive_num}.tar", [filename])
+    archive_paths = load_mongo.expand_archive_paths([str(tmp_path / "proteome_*.tar")])
+    assert [Path(path).name for path in archive_paths] == [
+        "proteome_0.tar",
+        "proteome_1.tar",
+        "proteome_2.tar",
+    ]
+
+    # one archive fails, the others are loaded and recorded in the ledger
+    bad_path = tmp_path / "AF-P99999-F1-model_v4.cif.gz"
+    bad_path.write_bytes(gzip.compress(b"data_bad\n"))
+    with tarfile.open(archive_paths[1], "w") as tar:
+        tar.add(str(bad_path), arcname=bad_path.name)
+    with pytest.raises(KeyError):
+        load_mongo.run(
+            archive_paths=archive_paths,
+            dataset="test",
+            mongo_db_url="mongodb://fake",
+            batch_size=2,
+            workers=2,
+            jobs=2,
+        )
+    assert sorted(fileName for _, fileName in collection.docs) == sorted(
+        [CIF_FILENAMES[0], CIF_FILENAMES[2]]
+    )
+    ledger_docs = {
+        Path(archive_path).name: doc
+        for (_, archive_path), doc in ledger_collection.docs.items()
+    }
+    assert sorted(ledger_docs) == ["proteome_0.tar", "proteome_2.tar"]
+    assert ledger_docs["proteome_0.tar"]["members"] == 1
+
+    # the restart only loads the archive that failed
+    create_archive(archive_paths[1], [CIF_FILENAMES[1]])
+    archive_list = tmp_path / "archives.txt"
+    archive_list.write_text("\n".join(archive_paths) + "\n")
+    collection.find_count = 0
+    load_mongo.run(
+        archive_paths=load_mongo.expand_archive_paths([], str(archive_list)),
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+        jobs=2,
+    )
+    assert collection.find_count == 1
+    assert sorted(fileName for _, fileName in collection.docs) == sorted(CIF_FILENAMES)
+    assert len(ledger_collection.docs) == 3
+
+
+def test_run_defers_indexes(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    # an index managed by the loader and an index created by someone else
+    collection.indexes["uniprotAccession_afVersion"] = None
+    collection.indexes["api_text_index"] = {"name": "api_text_index"}
+    index_names = []
+    load_mongo_write_af_documents = load_mongo.write_af_documents
+
+    def write_af_documents(lm, af_file_dicts, progress):
+        index_names.append(sorted(lm.collection.index_information()))
+        return load_mongo_write_af_documents(lm, af_file_dicts, progress)
+
+    monkeypatch.setattr(load_mongo, "write_af_documents", write_af_documents)
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+        defer_indexes=True,
+    )
+    # only the managed secondary indexes are dropped while loading
+    assert index_names == [["_id_", "api_text_index", "dataset_fileName"]] * 2
+    assert sorted(collection.indexes) == [
+        "_id_",
+        "api_text_index",
+        "dataset_fileName",
+        "uniprotAccession_afVersion",
+    ]
+    assert collection.indexes["api_text_index"] == {"name": "api_text_index"}
+    assert collection.indexes["dataset_fileName"]["unique"] is True
+
+
+def test_run_keeps_indexes_by_default(tmp_path, monkeypatch):
+    collection = FakeCollection()
+    collection.indexes["uniprotAccession_afVersion"] = None
+    monkeypatch.setattr(collection, "drop_index", pytest.fail)
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    load_mongo.run(
+        archive_paths=[str(archive_path)],
+        dataset="test",
+        mongo_db_url="mongodb://fake",
+        batch_size=2,
+    )
+    assert len(collection.docs) == len(CIF_FILENAMES)
+
+
+def test_run_rebuilds_deferred_indexes_when_interrupted(tmp_path, monkeypatch):
+    collection = FakeCollection()
+
+    def write_af_documents(lm, af_file_dicts, progress):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(load_mongo, "write_af_documents", write_af_documents)
+    monkeypatch.setattr(
+        load_mongo.pymongo, "MongoClient", lambda url: FakeMongoClient(collection)
+    )
+    archive_path = tmp_path / "proteome.tar"
+    create_archive(archive_path, CIF_FILENAMES)
+
+    with pytest.raises(KeyboardInterrupt):
+        load_mongo.run(
+            archive_paths=[str(archive_path)],
+            dataset="test",
+            mongo_db_url="mongodb://fake",
+            batch_size=2,
+            defer_indexes=True,
+        )
+    assert "uniprotAccession_afVersion" in collection.indexes
@@ -111,6 +111,51 @@ def test_optimise_domain_boundaries(tmp_path):
         )
 
 
+def test_optimise_domain_boundaries_status_log_metrics(tmp_path):
+    chain_ids = ["AF-P00520-F1-model_v3"]
+    tmp_cif_path = create_fake_cif_dir(tmp_path / "cif", chain_ids)
+    tmp_id_path = tmp_path / "ids.csv"
+    with tmp_id_path.open("wt") as fh:
+        write_ids_to_file(fh, ["header"], ["AF-P00520-F1-model_v3/1-100"])
+    tmp_status_log = tmp_path / "optimise_boundaries_status.log"
+
+    args = (
+        SUBCOMMAND,
+        "--af_domain_list",
+        f"{tmp_id_path}",
+        "--af_chain_mmcif_dir",
+        f"{tmp_cif_path}",
+        "--af_domain_list_post_tailchop",
+        f"{tmp_path / 'domain_list_post_tailchop.csv'}",
+        "--af_domain_mapping_post_tailchop",
+        f"{tmp_path / 'domain_mapping_post_tailchop.csv'}",
+        "--status_log",
+        f"{tmp_status_log}",
+        "--gzipped_af_chains",
+        "True",
+        "--status_log_metrics",
+    )
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0
+
+    with tmp_status_log.open("rt") as fh:
+        rows = list(csv.DictReader(fh, delimiter="\t"))
+    assert len(rows) == 1
+    assert list(rows[0]) == [
+        "entry_id",
+        "status",
+        "error",
+        "description",
+        "elapsed_seconds",
+        "input_bytes",
+        "residue_count",
+    ]
+    assert rows[0]["entry_id"] == "AF-P00520-F1-model_v3/1-100"
+    assert float(rows[0]["elapsed_seconds"]) > 0
+    assert int(rows[0]["input_bytes"]) == EXAMPLE_CIF_FILE.stat().st_size
+    assert int(rows[0]["residue_count"]) == 1123
+
+
 def assert_csv_matches(csv_path, expected_headers, expected_rows, max_lines=None):
 
     assert csv_path.exists()
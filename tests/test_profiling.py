@@ -0,0 +1,125 @@
+import json
+import pstats
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import cli
+from cath_alphaflow.profiling import (
+    PROFILER,
+    STAGE_COMPUTE,
+    STAGE_READ,
+    entries,
+    percentile,
+    timed,
+    timer,
+)
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+EXAMPLE_DSSP_FILE = FIXTURE_PATH / "dssp" / "AF-P00520-F1-model_v3.dssp"
+
+
+@timed(STAGE_COMPUTE)
+def slow_compute():
+    with timer(STAGE_READ, "slow_read"):
+        time.sleep(0.02)
+    time.sleep(0.01)
+
+
+def test_percentile():
+    values = [0.1, 0.2, 0.3, 0.4]
+    assert percentile(values, 50) == 0.2
+    assert percentile(values, 99) == 0.4
+    assert percentile(values, 0) == 0.1
+    assert percentile([], 50) is None
+
+
+def test_profiler_off():
+    items = [1, 2, 3]
+    assert not PROFILER.enabled
+    assert entries(items) is items
+    slow_compute()
+    assert PROFILER.function_stats == {}
+
+
+def test_profiler_nested_timers():
+    PROFILER.start("test")
+    try:
+        for _ in entries(range(2)):
+            slow_compute()
+    finally:
+        PROFILER.stop()
+
+    report = PROFILER.report()
+    assert report["command"] == "test"
+    assert report["entries"]["count"] == 2
+    assert report["entries"]["p50_seconds"] >= 0.03
+    compute_name = f"{__name__}.slow_compute"
+    functions = report["functions"]
+    assert list(functions) == [compute_name, "slow_read"]
+    assert functions[compute_name]["calls"] == 2
+    assert functions[compute_name]["stage"] == STAGE_COMPUTE
+
+    # nested time is only counted in the innermost stage
+    stage_seconds = report["stage_seconds"]
+    assert stage_seconds[STAGE_READ] >= 0.04
+    assert stage_seconds[STAGE_READ] == functions["slow_read"]["seconds"]
+    assert stage_seconds[STAGE_COMPUTE] == pytest.approx(
+        functions[compute_name]["seconds"] - functions["slow_read"]["seconds"]
+    )
+    assert sum(stage_seconds.values()) == pytest.approx(report["wall_seconds"])
+
+
+def test_cli_profile(tmp_path):
+    dssp_dir = tmp_path / "dssp"
+    dssp_dir.mkdir()
+    shutil.copy(EXAMPLE_DSSP_FILE, dssp_dir)
+    id_file = tmp_path / "ids.csv"
+    id_file.write_text(
+        "header\nAF-P00520-F1-model_v3/61-117\nAF-P00520-F1-model_v3/319-513\n"
+    )
+    report_path = tmp_path / "profile.json"
+    stats_path = tmp_path / "profile.pstats"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        cli,
+        [
+            "--profile",
+            str(report_path),
+            "--profile_stats",
+            str(stats_path),
+            "convert-dssp-to-sse-summary",
+            "--dssp_dir",
+            str(dssp_dir),
+            "--id_file",
+            str(id_file),
+            "--sse_out_file",
+            str(tmp_path / "sse_out.csv"),
+        ],
+    )
+    assert result.exit_code == 0
+    assert not PROFILER.enabled
+
+    report = json.loads(report_path.read_text())
+    assert report["command"] == "convert-dssp-to-sse-summary"
+    assert report["entries"]["count"] == 2
+    assert report["entries"]["per_second"] > 0
+    assert set(report["stage_seconds"]) == {
+        "read",
+        "parse",
+        "compute",
+        "write",
+        "other",
+    }
+    assert report["stage_seconds"]["read"] > 0
+    read_dssp_name = (
+        "cath_alphaflow.commands.convert_dssp_to_sse_summary.read_dssp_string"
+    )
+    assert report["functions"][read_dssp_name]["calls"] == 2
+
+    stats = pstats.Stats(str(stats_path))
+    assert any(func_name == "read_dssp_string" for _, _, func_name in stats.stats)
@@ -0,0 +1,54 @@
+import io
+import logging
+
+from cath_alphaflow.progress import ProgressReporter, format_seconds
+
+
+def test_format_seconds():
+    assert format_seconds(0.4) == "0:00:00"
+    assert format_seconds(3725) == "1:02:05"
+
+
+def test_progress_str():
+    progress = ProgressReporter(1000, label="domains")
+    progress.processed = 250
+    assert progress.progress_str(progress.started + 10) == (
+        "250/1000 domains (25.0%), 25.0/s, ETA 0:00:30"
+    )
+
+    # unknown total
+    progress = ProgressReporter(label="domains")
+    progress.processed = 250
+    assert progress.progress_str(progress.started + 10) == "250 domains, 25.0/s"
+
+
+def test_for_id_file(tmp_path):
+    id_path = tmp_path / "ids.csv"
+    id_path.write_text(
+        "af_domain_id\nAF-P00520-F1-model_v3/1-100\nAF-P00521-F1-model_v3/800-1123\n"
+    )
+    with id_path.open("rt") as id_file:
+        assert ProgressReporter.for_id_file(id_file).total == 2
+    with id_path.open("rt") as id_file:
+        assert ProgressReporter.for_id_file(id_file, header=False).total == 3
+    assert ProgressReporter.for_id_file(io.StringIO("a\nb\n")).total is None
+
+
+def test_update_reports_progress(caplog):
+    caplog.set_level(logging.INFO)
+    progress = ProgressReporter(3, interval=60)
+    progress.update()
+    assert "Progress:" not in caplog.text
+
+    # progress is reported when the interval has passed
+    progress.next_report = progress.started
+    progress.update()
+    assert "Progress: 2/3 entries (66.7%)" in caplog.text
+
+    # interval of 0 disables the progress lines
+    caplog.clear()
+    progress = ProgressReporter(3, interval=0)
+    progress.update(3)
+    assert caplog.text == ""
+    progress.finish()
+    assert "Processed 3 entries" in caplog.text
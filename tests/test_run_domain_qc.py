@@ -0,0 +1,287 @@
+import csv
+import gzip
+from pathlib import Path
+import shutil
+import tempfile
+
+from Bio.PDB import MMCIFParser
+from click.testing import CliRunner
+
+from cath_alphaflow.cli import cli
+from cath_alphaflow.commands import run_domain_qc
+from cath_alphaflow.commands.measure_globularity import (
+    calculate_normed_radius_of_gyration,
+    calculate_packing_density,
+)
+from cath_alphaflow.constants import DEFAULT_GLOB_DISTANCE, DEFAULT_GLOB_VOLUME
+from cath_alphaflow.models.domains import GeneralDomainID
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+EXAMPLE_AF_ID = "AF-P00520-F1-model_v3"
+
+SUBCOMMAND = "run-domain-qc"
+
+AF_DOMAIN_IDS = [
+    f"{EXAMPLE_AF_ID}/1-100",
+    f"{EXAMPLE_AF_ID}/200-500_600-800",
+    "AF-P99999-F1-model_v3/1-100",
+]
+
+
+def test_cli_usage():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        result = runner.invoke(cli, [SUBCOMMAND, "--help"])
+        assert result.exit_code == 0
+        assert "Usage:" in result.output
+
+
+def invoke(runner, args):
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def read_rows(path):
+    with open(path, "rt") as fh:
+        return list(csv.DictReader(fh, delimiter="\t"))
+
+
+def test_run_domain_qc_matches_individual_commands():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("domains.txt").write_text("\n".join(["af_domain_id", *AF_DOMAIN_IDS]))
+        Path("qc_domains").mkdir()
+        invoke(
+            runner,
+            [
+                SUBCOMMAND,
+                "--af_domain_list",
+                "domains.txt",
+                "--af_chain_mmcif_dir",
+                str(FIXTURE_PATH / "cif"),
+                "--cif_suffix",
+                ".cif.gz",
+                "--dssp_dir",
+                str(FIXTURE_PATH / "dssp"),
+                "--af_domain_list_post_tailchop",
+                "qc_post_tailchop.txt",
+                "--af_domain_mapping_post_tailchop",
+                "qc_mapping.tsv",
+                "--domain_cif_out_dir",
+                "qc_domains",
+                "--plddt_stats_file",
+                "qc_plddt.tsv",
+                "--sse_out_file",
+                "qc_sse.tsv",
+                "--domain_globularity",
+                "qc_globularity.tsv",
+                "--qc_summary_file",
+                "qc_summary.tsv",
+                "--status_log",
+                "qc_status.tsv",
+            ],
+        )
+
+        # the missing chain is recorded as a failure, the other domains are processed
+        status_rows = read_rows("qc_status.tsv")
+        assert [row["status"] for row in status_rows] == ["SUCCESS", "SUCCESS", "FAIL"]
+
+        # same results as running the individual commands
+        Path("domains_found.txt").write_text(
+            "\n".join(["af_domain_id", *AF_DOMAIN_IDS[:2]])
+        )
+        invoke(
+            runner,
+            [
+                "optimise-domain-boundaries",
+                "--af_domain_list",
+                "domains_found.txt",
+                "--af_chain_mmcif_dir",
+                str(FIXTURE_PATH / "cif"),
+                "--gzipped_af_chains",
+                "True",
+                "--af_domain_list_post_tailchop",
+                "post_tailchop.txt",
+                "--af_domain_mapping_post_tailchop",
+                "mapping.tsv",
+                "--status_log",
+                "status.tsv",
+            ],
+        )
+        for filename in ["post_tailchop.txt", "mapping.tsv"]:
+            assert Path(f"qc_{filename}").read_text() == Path(filename).read_text()
+
+        Path("domains").mkdir()
+        invoke(
+            runner,
+            [
+                "chop-cif",
+                "--cif_in_dir",
+                str(FIXTURE_PATH / "cif"),
+                "--id_file",
+                "post_tailchop.txt",
+                "--cif_out_dir",
+                "domains",
+            ],
+        )
+        domain_files = sorted(path.name for path in Path("domains").iterdir())
+        assert sorted(path.name for path in Path("qc_domains").iterdir()) == (
+            domain_files
+        )
+        for filename in domain_files:
+            with gzip.open(f"domains/{filename}", "rt") as fh:
+                expected_domain_cif = fh.read()
+            with gzip.open(f"qc_domains/{filename}", "rt") as fh:
+                assert fh.read() == expected_domain_cif
+
+        invoke(
+            runner,
+            [
+                "convert-cif-to-plddt-summary",
+                "--cif_in_dir",
+                str(FIXTURE_PATH / "cif"),
+                "--cif_suffix",
+                ".cif.gz",
+                "--id_file",
+                "post_tailchop.txt",
+                "--plddt_stats_file",
+                "plddt.tsv",
+            ],
+        )
+        assert Path("qc_plddt.tsv").read_text() == Path("plddt.tsv").read_text()
+
+        invoke(
+            runner,
+            [
+                "convert-dssp-to-sse-summary",
+                "--dssp_dir",
+                str(FIXTURE_PATH / "dssp"),
+                "--id_file",
+                "post_tailchop.txt",
+                "--sse_out_file",
+                "sse.tsv",
+            ],
+        )
+        assert Path("qc_sse.tsv").read_text() == Path("sse.tsv").read_text()
+
+        # globularity of the chopped domain files
+        globularity_rows = read_rows("qc_globularity.tsv")
+        assert len(globularity_rows) == 2
+        for row in globularity_rows:
+            with gzip.open(f"domains/{row['model_id']}.cif.gz", "rt") as fh:
+                structure = MMCIFParser(QUIET=1).get_structure(row["model_id"], fh)
+            domain_id = GeneralDomainID(raw_id=row["model_id"])
+            assert float(row["packing_density"]) == calculate_packing_density(
+                domain_id, structure, DEFAULT_GLOB_DISTANCE
+            )
+            assert float(
+                row["normed_radius_gyration"]
+            ) == calculate_normed_radius_of_gyration(
+                domain_id, structure, DEFAULT_GLOB_VOLUME
+            )
+
+        summary_rows = read_rows("qc_summary.tsv")
+        assert [row["af_domain_id"] for row in summary_rows] == AF_DOMAIN_IDS[:2]
+        plddt_rows = read_rows("plddt.tsv")
+        assert [row["md5"] for row in summary_rows] == [
+            row["md5"] for row in plddt_rows
+        ]
+
+
+def invoke_without_dssp_dir(runner, cif_dir):
+    return invoke(
+        runner,
+        [
+            SUBCOMMAND,
+            "--af_domain_list",
+            "domains.txt",
+            "--af_chain_mmcif_dir",
+            str(cif_dir),
+            "--cif_suffix",
+            ".cif.gz",
+            "--af_domain_list_post_tailchop",
+            "qc_post_tailchop.txt",
+            "--af_domain_mapping_post_tailchop",
+            "qc_mapping.tsv",
+            "--domain_cif_out_dir",
+            "qc_domains",
+            "--plddt_stats_file",
+            "qc_plddt.tsv",
+            "--sse_out_file",
+            "qc_sse.tsv",
+            "--domain_globularity",
+            "qc_globularity.tsv",
+            "--qc_summary_file",
+            "qc_summary.tsv",
+            "--status_log",
+            "qc_status.tsv",
+        ],
+    )
+
+
+def test_run_domain_qc_removes_dssp_files(monkeypatch, tmp_path):
+    dssp_dirs = []
+
+    def fake_run_dssp(cif_path, dssp_path, *, config=None):
+        # the DSSP file of the previous chain has already been removed
+        assert list(dssp_path.parent.iterdir()) == []
+        dssp_dirs.append(dssp_path.parent)
+        shutil.copy(FIXTURE_PATH / "dssp" / f"{EXAMPLE_AF_ID}.dssp", dssp_path)
+
+    monkeypatch.setattr(run_domain_qc, "run_dssp", fake_run_dssp)
+    qc_tmp_dir = tmp_path / "qc_tmp"
+    qc_tmp_dir.mkdir()
+    runner = CliRunner()
+    with runner.isolated_filesystem(temp_dir=tmp_path):
+        monkeypatch.setattr(tempfile, "tempdir", str(qc_tmp_dir))
+        Path("domains.txt").write_text(
+            "\n".join(
+                [
+                    "af_domain_id",
+                    *AF_DOMAIN_IDS[:2],
+                    "AF-Q15772-F3-model_v4/1-100",
+                    "AF-Q15772-F11-model_v4/1-100",
+                ]
+            )
+        )
+        Path("qc_domains").mkdir()
+        invoke_without_dssp_dir(runner, FIXTURE_PATH / "cif")
+
+        assert len(dssp_dirs) == 3
+        assert list(qc_tmp_dir.iterdir()) == []
+        status_rows = read_rows("qc_status.tsv")
+        assert [row["status"] for row in status_rows[:2]] == ["SUCCESS", "SUCCESS"]
+
+
+def test_run_domain_qc_truncated_cif(monkeypatch, tmp_path):
+    def fake_run_dssp(cif_path, dssp_path, *, config=None):
+        shutil.copy(FIXTURE_PATH / "dssp" / f"{EXAMPLE_AF_ID}.dssp", dssp_path)
+
+    monkeypatch.setattr(run_domain_qc, "run_dssp", fake_run_dssp)
+
+    # the CIF file ends before the local pLDDT metrics and the atoms
+    cif_dir = tmp_path / "cif"
+    cif_dir.mkdir()
+    shutil.copy(FIXTURE_PATH / "cif" / f"{EXAMPLE_AF_ID}.cif.gz", cif_dir)
+    truncated_id = "AF-Q15772-F3-model_v4"
+    with gzip.open(FIXTURE_PATH / "cif" / f"{truncated_id}.cif.gz", "rt") as fh:
+        cif_lines = fh.readlines()
+    with gzip.open(cif_dir / f"{truncated_id}.cif.gz", "wt") as fh:
+        fh.writelines(cif_lines[:1000])
+
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        Path("domains.txt").write_text(
+            "\n".join(
+                ["af_domain_id", f"{truncated_id}/1-100", *AF_DOMAIN_IDS[:2]]
+            )
+        )
+        Path("qc_domains").mkdir()
+        invoke_without_dssp_dir(runner, cif_dir)
+
+        # only the domain in the truncated chain fails
+        status_rows = read_rows("qc_status.tsv")
+        assert [row["status"] for row in status_rows] == ["FAIL", "SUCCESS", "SUCCESS"]
+        summary_rows = read_rows("qc_summary.tsv")
+        assert [row["af_domain_id"] for row in summary_rows] == AF_DOMAIN_IDS[:2]
@@ -0,0 +1,273 @@
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from cath_alphaflow import foldseek_utils
+from cath_alphaflow.cli import cli
+from cath_alphaflow.commands import run_foldseek
+from cath_alphaflow.foldseek_utils import (
+    FS_DB_STRUCTURE_PARTS,
+    FoldseekResultCache,
+    get_db_fingerprint,
+    get_entry_hashes,
+    read_lookup,
+    split_keys_into_shards,
+)
+
+SUBCOMMAND = "run-foldseek"
+
+QUERY_NAMES = [f"AF-P0000{num}-F1-model_v4" for num in range(5)]
+
+
+class FakeFoldseek:
+    """Records Foldseek commands and writes one m8 row per query in the DB"""
+
+    def __init__(self, fail_shard_dir=None):
+        self.commands = []
+        self.subdb_keys = []
+        self.fail_shard_dir = fail_shard_dir
+
+    def __call__(self, fs_bin_path, *args, log_path=None):
+        args = [str(arg) for arg in args]
+        self.commands.append(args)
+        if log_path:
+            with open(log_path, "at") as fh:
+                fh.write(" ".join(args) + "\n")
+        command = args[0]
+        if command == "createsubdb":
+            self.subdb_keys.append(Path(args[1]).read_text().split())
+            Path(args[3]).touch()
+        elif command == "search":
+            if self.fail_shard_dir and args[1].startswith(self.fail_shard_dir):
+                raise RuntimeError("search failed")
+            Path(args[3]).touch()
+        elif command == "convertalis":
+            with open(args[4], "wt") as fh:
+                for _key, name, _file_id in read_lookup(args[1]):
+                    fh.write(f"{name}\t1abcA00\n")
+
+    def searched_dbs(self):
+        return [args[1] for args in self.commands if args[0] == "search"]
+
+
+def create_query_db(fs_db):
+    Path(fs_db).touch()
+    with open(f"{fs_db}.lookup", "wt") as fh:
+        for key, name in enumerate(QUERY_NAMES):
+            fh.write(f"{key}\t{name}\t{key}\n")
+    with open(f"{fs_db}.source", "wt") as fh:
+        for file_id, name in enumerate(QUERY_NAMES):
+            fh.write(f"{file_id}\t{name}.cif\n")
+
+
+def invoke_run_foldseek(runner, *args):
+    return runner.invoke(
+        cli,
+        [
+            SUBCOMMAND,
+            "--fs_querydb",
+            "query.db",
+            "--fs_targetdb",
+            "target.db",
+            "--fs_results",
+            "results.m8",
+            "--tmp_dir",
+            "tmp",
+            "--fs_bin_path",
+            "foldseek",
+            *args,
+        ],
+    )
+
+
+def test_split_keys_into_shards():
+    assert split_keys_into_shards([4, 3, 2, 1, 0], 3) == [[0, 1], [2, 3], [4]]
+    assert split_keys_into_shards([0, 1], 3) == [[0], [1], []]
+
+
+def test_run_foldseek_sharded_with_resume(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        Path("target.db").touch()
+        shards_dir = str(Path("results.m8.shards").resolve())
+
+        # first run: shard 1 fails, the other shards complete
+        fake_foldseek = FakeFoldseek(fail_shard_dir=f"{shards_dir}/shard_0001")
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(
+            runner, "--shards", "3", "--jobs", "2", "--threads", "2"
+        )
+        assert result.exit_code != 0
+        assert not Path("results.m8").exists()
+        assert len(fake_foldseek.searched_dbs()) == 3
+        search_args = [args for args in fake_foldseek.commands if args[0] == "search"]
+        assert search_args[0][5:7] == ["-s", "9"]
+        assert search_args[0][-2:] == ["--threads", "2"]
+        assert "search" in Path(shards_dir, "shard_0001", "foldseek.log").read_text()
+
+        # rerun: only the failed shard is searched, then the results are merged
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner, "--shards", "3")
+        assert result.exit_code == 0, result.output
+        assert "DONE" in result.output
+        assert fake_foldseek.searched_dbs() == [f"{shards_dir}/shard_0001/query.db"]
+        assert Path("results.m8").read_text().splitlines() == [
+            f"{name}\t1abcA00" for name in QUERY_NAMES
+        ]
+
+        # the shard plan cannot be changed without starting again
+        result = invoke_run_foldseek(runner, "--shards", "2")
+        assert result.exit_code != 0
+        assert "remove it to start again" in result.output
+
+
+def test_run_foldseek_single_shard_index(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        Path("target.db").touch()
+
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner, "--shards", "2", "--shard_index", "1")
+        assert result.exit_code == 0, result.output
+        assert len(fake_foldseek.searched_dbs()) == 1
+        assert Path("results.m8.shards", "shard_0001", "DONE").exists()
+        assert not Path("results.m8.shards", "shard_0000", "DONE").exists()
+        assert not Path("results.m8").exists()
+
+        result = invoke_run_foldseek(runner, "--shards", "2", "--shard_index", "2")
+        assert result.exit_code != 0
+
+
+def test_run_foldseek_logs_output(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        Path("target.db").touch()
+
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner)
+        assert result.exit_code == 0, result.output
+        log_lines = Path("foldseek.log").read_text().splitlines()
+        assert [line.split()[0] for line in log_lines] == ["search", "convertalis"]
+
+
+def test_run_foldseek_sharded_rejects_rebuilt_query_db(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        Path("target.db").touch()
+
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner, "--shards", "2")
+        assert result.exit_code == 0, result.output
+
+        # the query DB is rebuilt at the same path (e.g. an incremental update)
+        with open("query.db.lookup", "at") as fh:
+            fh.write("5\tAF-P00005-F1-model_v4\t5\n")
+        result = invoke_run_foldseek(runner, "--shards", "2")
+        assert result.exit_code != 0
+        assert "remove it to start again" in result.output
+        assert len(fake_foldseek.searched_dbs()) == 2
+
+
+def test_run_foldseek_more_shards_than_queries(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        Path("target.db").touch()
+
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner, "--shards", "7", "--jobs", "3")
+        assert result.exit_code == 0, result.output
+        # the empty shards are marked as done without running Foldseek
+        assert len(fake_foldseek.searched_dbs()) == len(QUERY_NAMES)
+        assert sorted(set(map(tuple, fake_foldseek.subdb_keys))) == [
+            (str(key),) for key in range(len(QUERY_NAMES))
+        ]
+        for shard_index in (5, 6):
+            shard_dir = Path("results.m8.shards", f"shard_000{shard_index}")
+            assert (shard_dir / "DONE").exists()
+            assert (shard_dir / "results.m8").read_text() == ""
+        assert Path("results.m8").read_text().splitlines() == [
+            f"{name}\t1abcA00" for name in QUERY_NAMES
+        ]
+
+
+def write_mmseqs_db(db, entries):
+    """Writes the data and index files of an MMseqs2-style DB"""
+    offset = 0
+    with open(db, "wb") as data_fh, open(f"{db}.index", "wt") as index_fh:
+        for key, entry in enumerate(entries):
+            data = entry.encode() + b"\0"
+            data_fh.write(data)
+            index_fh.write(f"{key}\t{offset}\t{len(data)}\n")
+            offset += len(data)
+
+
+def create_structure_db(fs_db, structures):
+    for part in FS_DB_STRUCTURE_PARTS:
+        write_mmseqs_db(f"{fs_db}{part}", [f"{part}{s}" for s in structures])
+
+
+def test_get_entry_hashes(tmp_path):
+    fs_db = tmp_path / "query.db"
+    create_structure_db(fs_db, ["AAA", "CCC", "AAA"])
+    hashes = get_entry_hashes(fs_db)
+    assert hashes[0] == hashes[2]
+    assert hashes[0] != hashes[1]
+
+
+def test_run_foldseek_with_cache(monkeypatch):
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        create_query_db("query.db")
+        create_structure_db("query.db", ["AAA", "CCC", "DDD", "AAA", "EEE"])
+        create_structure_db("target.db", ["TTT"])
+
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        result = invoke_run_foldseek(runner, "--cache", "hits.sqlite")
+        assert result.exit_code == 0, result.output
+        assert len(fake_foldseek.searched_dbs()) == 1
+        expected_results = [f"{name}\t1abcA00" for name in QUERY_NAMES]
+        assert Path("results.m8").read_text().splitlines() == expected_results
+
+        # everything is cached, so nothing is searched
+        fake_foldseek = FakeFoldseek()
+        monkeypatch.setattr(run_foldseek, "run_foldseek_command", fake_foldseek)
+        monkeypatch.setattr(foldseek_utils, "run_foldseek_command", fake_foldseek)
+        Path("results.m8").unlink()
+        result = invoke_run_foldseek(runner, "--cache", "hits.sqlite")
+        assert result.exit_code == 0, result.output
+        assert fake_foldseek.searched_dbs() == []
+        assert Path("results.m8").read_text().splitlines() == expected_results
+
+        # changing a structure or the search parameters means searching again
+        create_structure_db("query.db", ["AAA", "CCC", "DDD", "AAA", "FFF"])
+        result = invoke_run_foldseek(runner, "--cache", "hits.sqlite")
+        assert result.exit_code == 0, result.output
+        assert not Path("results.m8.cache_misses").exists()
+        assert len(fake_foldseek.searched_dbs()) == 1
+        assert fake_foldseek.subdb_keys[0] == ["4"]
+        assert Path("results.m8").read_text().splitlines() == expected_results
+
+        cache = FoldseekResultCache(
+            "hits.sqlite",
+            target_fingerprint=get_db_fingerprint("target.db"),
+            params_hash="other",
+        )
+        assert cache.cached_hashes(get_entry_hashes("query.db").values()) == set()
+        cache.close()
@@ -0,0 +1,112 @@
+import io
+import logging
+import shutil
+import socket
+import stat
+import threading
+from pathlib import Path
+
+import pytest
+
+from cath_alphaflow.commands.serve import (
+    bind_socket,
+    remove_stale_socket,
+    serve_tasks,
+)
+from cath_alphaflow.task_client import submit
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures"
+EXAMPLE_FASTA_FILE = FIXTURE_PATH / "fasta" / "fasta_test10.fasta"
+
+
+@pytest.fixture
+def start_worker(tmp_path):
+    socket_path = tmp_path / "worker.sock"
+    server_sock = bind_socket(socket_path)
+    threads = []
+
+    def start(max_tasks):
+        thread = threading.Thread(
+            target=serve_tasks,
+            args=(server_sock,),
+            kwargs={"max_tasks": max_tasks},
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+        return socket_path
+
+    yield start
+    for thread in threads:
+        thread.join(timeout=10)
+    server_sock.close()
+
+
+@pytest.fixture
+def info_logging():
+    root_logger = logging.getLogger()
+    log_level = root_logger.level
+    root_logger.setLevel(logging.INFO)
+    yield
+    root_logger.setLevel(log_level)
+
+
+def run_task(args, **kwargs):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = submit(args, stdout=stdout, stderr=stderr, **kwargs)
+    return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+def test_serve_tasks(start_worker, info_logging, tmp_path):
+    socket_path = start_worker(max_tasks=4)
+
+    exit_code, stdout, _stderr = run_task(["dump-config"], socket_path=socket_path)
+    assert exit_code == 0
+    assert stdout.startswith("Settings:")
+
+    # relative paths are resolved in the working directory of the client
+    shutil.copy(EXAMPLE_FASTA_FILE, tmp_path / "test.fasta")
+    exit_code, stdout, stderr = run_task(
+        ["-v", "create-md5", "--fasta", "test.fasta", "--uniprot_md5_csv", "md5.csv"],
+        socket_path=socket_path,
+        cwd=str(tmp_path),
+    )
+    assert exit_code == 0
+    assert stdout == "DONE\n"
+    assert "Starting logging... (level=DEBUG)" in stderr
+    md5_lines = (tmp_path / "md5.csv").read_text().splitlines()
+    assert (
+        md5_lines[1] == "AF-A0A2L2JPH6-F1\tA0A2L2JPH6\t8d7bd48f425bed920868023f24865164"
+    )
+
+    exit_code, _stdout, stderr = run_task(["no-such-command"], socket_path=socket_path)
+    assert exit_code == 2
+    assert "No such command" in stderr
+
+    # `--verbose` from the previous task does not persist
+    exit_code, _stdout, stderr = run_task(
+        ["create-md5", "--fasta", "missing.fasta", "--uniprot_md5_csv", "md5.csv"],
+        socket_path=socket_path,
+        cwd=str(tmp_path),
+    )
+    assert exit_code == 2
+    assert "Starting logging... (level=INFO)" in stderr
+    assert "missing.fasta" in stderr
+
+
+def test_remove_stale_socket(tmp_path):
+    socket_path = tmp_path / "stale.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(socket_path))
+    remove_stale_socket(socket_path)
+    assert not socket_path.exists()
+
+
+def test_bind_socket_is_private(tmp_path):
+    socket_path = tmp_path / "worker.sock"
+    server_sock = bind_socket(socket_path)
+    try:
+        assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600
+    finally:
+        server_sock.close()
@@ -0,0 +1,56 @@
+from operator import itemgetter
+
+import pytest
+
+from cath_alphaflow.sort_utils import external_sort, merge_join, unique_rows
+
+
+@pytest.mark.parametrize("buffer_rows", [1, 2, 3, 100])
+def test_external_sort(buffer_rows):
+    rows = [("c", "1"), ("a", "1"), ("b", "1"), ("a", "2"), ("c", "2"), ("a", "3")]
+    sorted_rows = list(external_sort(rows, key=itemgetter(0), buffer_rows=buffer_rows))
+    # stable: rows with the same key stay in input order
+    assert sorted_rows == [
+        ("a", "1"),
+        ("a", "2"),
+        ("a", "3"),
+        ("b", "1"),
+        ("c", "1"),
+        ("c", "2"),
+    ]
+
+
+def test_external_sort_many_spill_files(monkeypatch):
+    monkeypatch.setattr("cath_alphaflow.sort_utils.MAX_MERGE_FILES", 3)
+    rows = [(f"{num:03d}",) for num in reversed(range(50))]
+    sorted_rows = list(external_sort(rows, key=itemgetter(0), buffer_rows=2))
+    assert sorted_rows == sorted(rows)
+
+
+def test_external_sort_empty():
+    assert list(external_sort([], key=itemgetter(0))) == []
+    with pytest.raises(ValueError):
+        list(external_sort([("a",)], key=itemgetter(0), buffer_rows=0))
+
+
+def test_merge_join():
+    left_rows = [("a", "L1"), ("a", "L2"), ("b", "L3"), ("d", "L4")]
+    right_rows = [("a", "R1"), ("c", "R2"), ("d", "R3"), ("d", "R4"), ("e", "R5")]
+    joined = list(
+        merge_join(
+            left_rows, right_rows, left_key=itemgetter(0), right_key=itemgetter(0)
+        )
+    )
+    assert joined == [
+        ([("a", "L1"), ("a", "L2")], [("a", "R1")]),
+        ([("d", "L4")], [("d", "R3"), ("d", "R4")]),
+    ]
+
+
+def test_unique_rows():
+    rows = [("a", "1"), ("a", "2"), ("b", "1"), ("c", "1"), ("c", "2")]
+    assert list(unique_rows(rows, key=itemgetter(0))) == [
+        ("a", "1"),
+        ("b", "1"),
+        ("c", "1"),
+    ]